@@ -0,0 +1,66 @@
+import sys
+import json
+import subprocess
+
+# Import-time guard for pyplinkqc.
+# Each module is imported in a fresh interpreter; the fastest of several runs is
+# compared against its budget, and heavy dependencies that must not be loaded by
+# the import are checked.
+# Usage: python benchmarks/import_time.py [repeats]
+
+BUDGETS = {
+    # module: (budget in seconds, modules that must not be imported)
+    'pyplinkqc.qc_filter': (0.1, ['matplotlib', 'pandas', 'numpy']),
+    'pyplinkqc.run_plink': (0.1, ['matplotlib', 'pandas', 'numpy']),
+    'pyplinkqc.qc_snps': (None, ['matplotlib']),
+    'pyplinkqc.qc_samples': (None, ['matplotlib']),
+}
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module: str, forbidden: list, repeats: int=5):
+    """Time the import of a module in fresh interpreters.
+
+    Key arguments:
+    --------------
+    module: str
+        dotted module name
+    forbidden: list
+        top-level modules that should not be imported as a side effect
+    repeats: int
+        number of interpreters to start (the fastest run is reported)
+
+    Returns:
+    --------
+    result: dict
+        fastest import time in seconds and forbidden modules that were loaded
+    """
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, forbidden=forbidden)],
+                             check=True, capture_output=True, text=True)
+        runs.append(json.loads(out.stdout))
+    return {'seconds': min(r['seconds'] for r in runs), 'loaded': runs[0]['loaded']}
+
+
+def main(repeats: int=5):
+    failed = False
+    for module, (budget, forbidden) in BUDGETS.items():
+        result = time_import(module, forbidden, repeats)
+        ok = not result['loaded'] and (budget is None or result['seconds'] < budget)
+        failed = failed or not ok
+        budget_str = "-" if budget is None else f'{budget * 1000:.0f} ms'
+        print(f'{module:<24} {result["seconds"] * 1000:8.1f} ms  budget {budget_str:>7}  '
+              f'loaded {result["loaded"] or "none"}  {"ok" if ok else "FAILED"}')
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
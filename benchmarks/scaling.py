@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import subprocess
+
+from synthetic import generate_bfile
+
+# Scaling benchmarks of the pyplinkqc QC and association entry points.
+# Synthetic bfiles are generated (and reused) for every size, and each stage
+# runs in a fresh interpreter in the order of a QC pipeline, recording wall
+# time, peak RSS (including plink child processes) and bytes written.
+# Results are appended to a JSON-lines history outside the source tree
+# ($PYPLINKQC_BENCH_HISTORY, default ~/.cache/pyplinkqc/benchmark_history.jsonl,
+# or --history); --compare prints the change between the last two recorded
+# versions.
+# Usage: python benchmarks/scaling.py [--samples 1000 10000 ...] [--variants N]
+#        python benchmarks/scaling.py --compare
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HISTORY = os.environ.get('PYPLINKQC_BENCH_HISTORY') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache"),
+    "pyplinkqc", "benchmark_history.jsonl")
+
+# stage name: code run in the stage working directory, with {bfile} the synthetic bfile
+STAGES = {
+    'qc_snps.check_snp_missingness': "from pyplinkqc import qc_snps\n"
+        "qc_snps.check_snp_missingness('{bfile}', deferred=True)",
+    'qc_snps.check_maf': "from pyplinkqc import qc_snps\n"
+        "qc_snps.check_maf('snp_missingness_filtered', deferred=True)",
+    'qc_snps.check_hwe': "from pyplinkqc import qc_snps\n"
+        "qc_snps.check_hwe('maf_filtered', deferred=True)",
+    'qc_report.snps_failed': "from pyplinkqc import qc_report\n"
+        "qc_report.snps_failed(write=True, deferred=True)",
+    'qc_samples.check_snp_missingness': "from pyplinkqc import qc_samples\n"
+        "qc_samples.check_snp_missingness('{bfile}', deferred=True)",
+    'qc_samples.check_sex_discrepancy': "from pyplinkqc import qc_samples\n"
+        "qc_samples.check_sex_discrepancy('sample_missingness_filtered', deferred=True)",
+    'qc_samples.check_heterozygosity_rate': "from pyplinkqc import qc_samples\n"
+        "qc_samples.check_heterozygosity_rate('sex_discrepancy_filtered', deferred=True)",
+    'qc_samples.check_cryptic_relatedness': "from pyplinkqc import qc_samples\n"
+        "qc_samples.check_cryptic_relatedness('heterozygosity_filtered', deferred=True)",
+    'qc_report.samples_failed': "from pyplinkqc import qc_report\n"
+        "qc_report.samples_failed(write=True, deferred=True)",
+    'association.perform_simple_assoc': "from pyplinkqc import association\n"
+        "association.perform_simple_assoc('{bfile}', 'assoc')",
+    'association.perform_simple_assoc(native)': "from pyplinkqc import association\n"
+        "association.perform_simple_assoc('{bfile}', 'native_assoc', native=True)",
+    'association.perform_cov_assoc(native)': "from pyplinkqc import association\n"
+        "association.perform_cov_assoc('{bfile}', 'native_logistic', type='log', native=True)",
+}
+
+_CHILD = """
+import sys, time, json, resource, traceback
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+status, error = 'ok', None
+try:
+    exec({code!r})
+except BaseException as e:
+    status, error = 'error', traceback.format_exception_only(type(e), e)[-1].strip()
+seconds = time.perf_counter() - start
+peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+print(json.dumps({{'seconds': seconds, 'peak_rss_mb': peak_kb / 1024, 'status': status, 'error': error}}))
+"""
+
+
+def _dir_sizes(path: str):
+    sizes = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            full = os.path.join(root, name)
+            stat = os.stat(full)
+            sizes[full] = (stat.st_size, stat.st_mtime_ns)
+    return sizes
+
+
+def run_stage(stage: str, bfile: str, workdir: str):
+    """Run one stage in a fresh interpreter.
+
+    Key arguments:
+    --------------
+    stage: str
+        name of the stage (key of STAGES)
+    bfile: str
+        absolute prefix of the input plink binary files
+    workdir: str
+        working directory of the stage
+
+    Returns:
+    --------
+    result: dict
+        seconds, peak_rss_mb, bytes_written, status and error
+    """
+    before = _dir_sizes(workdir)
+    code = STAGES[stage].format(bfile=bfile)
+    out = subprocess.run([sys.executable, '-c', _CHILD.format(repo=REPO, code=code)], cwd=workdir,
+                         capture_output=True, text=True)
+    try:
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        result = {'seconds': None, 'peak_rss_mb': None, 'status': 'error',
+                  'error': out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'no output'}
+    after = _dir_sizes(workdir)
+    result['bytes_written'] = sum(size for path, (size, mtime) in after.items()
+                                  if before.get(path) != (size, mtime))
+    return result
+
+
+def _version():
+    """Package version and git commit of the benchmarked tree."""
+    sys.path.insert(0, REPO)
+    import pyplinkqc
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return pyplinkqc.__version__, commit
+
+
+def run_benchmarks(samples: list, n_variants: int, stages: list=None, datadir: str="benchmark_data",
+                   history: str=HISTORY, plink_conf: str=None, seed: int=0, related_pairs: int=None):
+    """Run the stages on synthetic data of every size and append the results to the history.
+
+    Key arguments:
+    --------------
+    samples: list
+        numbers of samples to benchmark
+    n_variants: int
+        number of variants of the synthetic data
+    stages: list
+        stages to run (default: all stages, in pipeline order)
+    datadir: str
+        directory of the synthetic data and stage outputs (data is reused between runs)
+    history: str
+        JSON-lines file the results are appended to
+    plink_conf: str
+        plink config file (default: plink.conf of the repository)
+    seed: int
+        random seed of the synthetic data
+    related_pairs: int
+        number of parent-offspring pairs (default: 0.5% of the samples)
+
+    Returns:
+    --------
+    records: list
+        one dict per (size, stage)
+    """
+    stages = stages or list(STAGES)
+    version, commit = _version()
+    plink_conf = os.path.abspath(plink_conf or os.path.join(REPO, "plink.conf"))
+    records = []
+    for n_samples in samples:
+        pairs = related_pairs if related_pairs is not None else n_samples // 200
+        size_dir = os.path.abspath(os.path.join(datadir, f'{n_samples}x{n_variants}_seed{seed}'))
+        os.makedirs(size_dir, exist_ok=True)
+        bfile = os.path.join(size_dir, "synthetic")
+        if not os.path.exists(bfile + ".bed"):
+            print(f'generating {n_samples} samples x {n_variants} variants')
+            generate_bfile(bfile, n_samples, n_variants, seed=seed, related_pairs=pairs)
+        # stages find the plink config at ../plink.conf, relative to their working directory
+        shutil.copyfile(plink_conf, os.path.join(size_dir, "plink.conf"))
+        workdir = os.path.join(size_dir, "run")
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        for stage in stages:
+            result = run_stage(stage, bfile, workdir)
+            record = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'version': version,
+                      'commit': commit, 'host': socket.gethostname(),
+                      'python': platform.python_version(), 'stage': stage,
+                      'n_samples': n_samples, 'n_variants': n_variants, **result}
+            records.append(record)
+            os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+            with open(history, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            seconds = "-" if result['seconds'] is None else f'{result["seconds"]:.2f} s'
+            rss = "-" if result['peak_rss_mb'] is None else f'{result["peak_rss_mb"]:.0f} MB'
+            print(f'{n_samples:>8} {stage:<45} {seconds:>10} {rss:>9} '
+                  f'{result["bytes_written"] / 1e6:9.1f} MB written  {result["status"]}'
+                  + (f' ({result["error"]})' if result['error'] else ''))
+    return records
+
+
+def compare(history: str=HISTORY):
+    """Print the change of each stage and size between the last two benchmarked commits.
+
+    Key arguments:
+    --------------
+    history: str
+        JSON-lines history written by run_benchmarks
+    """
+    with open(history) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    runs = []
+    for record in records:
+        run = (record['version'], record['commit'])
+        if run in runs:
+            runs.remove(run)
+        runs.append(run)
+    if len(runs) < 2:
+        print('need results of at least two versions to compare')
+        return
+    old, new = runs[-2], runs[-1]
+    latest = {}
+    for record in records:
+        if record['status'] == 'ok':
+            latest[((record['version'], record['commit']), record['stage'], record['n_samples'],
+                    record['n_variants'])] = record
+    print(f'{old} -> {new}')
+    for (run, stage, n_samples, n_variants), record in sorted(latest.items(), key=lambda x: x[0][1:]):
+        if run != new or (old, stage, n_samples, n_variants) not in latest:
+            continue
+        before = latest[(old, stage, n_samples, n_variants)]
+        time_ratio = record['seconds'] / before['seconds'] if before['seconds'] else float('nan')
+        rss_ratio = record['peak_rss_mb'] / before['peak_rss_mb'] if before['peak_rss_mb'] else float('nan')
+        print(f'{n_samples:>8}x{n_variants:<8} {stage:<45} time x{time_ratio:5.2f}  '
+              f'peak RSS x{rss_ratio:5.2f}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pyplinkqc scaling benchmarks")
+    parser.add_argument('--samples', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--variants', type=int, default=10000)
+    parser.add_argument('--stages', nargs='+', default=None, choices=list(STAGES))
+    parser.add_argument('--datadir', default="benchmark_data")
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--plink-conf', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', action='store_true')
+    args = parser.parse_args()
+    if args.compare:
+        compare(args.history)
+    else:
+        run_benchmarks(args.samples, args.variants, args.stages, args.datadir, args.history,
+                       args.plink_conf, args.seed)
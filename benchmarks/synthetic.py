@@ -0,0 +1,128 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pyplinkqc.plink_io import BedWriter, encode_genotypes, write_bim, write_fam  # noqa: E402
+
+# Seeded synthetic plink binary files for benchmarks.
+# Usage: python benchmarks/synthetic.py <prefix> <n_samples> <n_variants> [seed]
+
+# relative weights of the autosomes (roughly their lengths in Mb)
+_AUTOSOME_MB = [249, 243, 198, 191, 181, 171, 159, 146, 141, 136, 135, 133, 115, 107, 102, 90,
+                83, 78, 59, 63, 48, 51]
+_ALLELES = np.array([['A', 'G'], ['C', 'T'], ['A', 'C'], ['G', 'T']])
+
+
+def _variant_table(rng, n_variants: int, x_fraction: float, y_fraction: float):
+    """Chromosomes, positions and alleles of the synthetic variants (plink order)."""
+    n_x = int(round(n_variants * x_fraction))
+    n_y = int(round(n_variants * y_fraction))
+    n_auto = n_variants - n_x - n_y
+    weights = np.array(_AUTOSOME_MB, dtype=float) / sum(_AUTOSOME_MB)
+    per_chrom = rng.multinomial(n_auto, weights)
+    chroms = np.concatenate([np.repeat(np.arange(1, 23), per_chrom),
+                             np.full(n_x, 23), np.full(n_y, 24)])
+    sizes = np.r_[_AUTOSOME_MB, 156, 57] * 1000000
+    positions = np.empty(n_variants, dtype=np.int64)
+    for chrom in np.unique(chroms):
+        sel = chroms == chrom
+        positions[sel] = np.sort(rng.choice(sizes[chrom - 1], sel.sum(), replace=False)) + 1
+    alleles = _ALLELES[rng.integers(0, len(_ALLELES), n_variants)]
+    flip = rng.random(n_variants) < 0.5
+    alleles[flip] = alleles[flip][:, ::-1]
+    return pd.DataFrame({'chrom': chroms.astype(str), 'snp': [f'snp{i}' for i in range(n_variants)],
+                         'cm': 0.0, 'pos': positions, 'a1': alleles[:, 0], 'a2': alleles[:, 1]})
+
+
+def generate_bfile(prefix: str, n_samples: int, n_variants: int, seed: int=0,
+                   missing_rate: float=0.01, maf_beta: tuple=(0.6, 1.4), min_maf: float=0.001,
+                   related_pairs: int=0, x_fraction: float=0.03, y_fraction: float=0.005,
+                   sex_error_rate: float=0.005, case_fraction: float=0.5, block_size: int=None):
+    """Write seeded synthetic plink binary files (.bed, .bim, .fam).
+
+    Genotypes are drawn variant block by variant block, so memory use does not
+    depend on the number of variants. The same arguments always give the same
+    files.
+
+    Key arguments:
+    --------------
+    prefix: str
+        prefix of the output files
+    n_samples: int
+        number of samples
+    n_variants: int
+        number of variants
+    seed: int
+        random seed
+    missing_rate: float
+        mean genotype missingness (varies between samples)
+    maf_beta: tuple
+        Beta distribution shape parameters of the minor allele frequency
+        spectrum, scaled to [min_maf, 0.5]
+    min_maf: float
+        lowest minor allele frequency
+    related_pairs: int
+        number of parent-offspring sample pairs
+    x_fraction: float
+        fraction of the variants on the X chromosome (males are hemizygous)
+    y_fraction: float
+        fraction of the variants on the Y chromosome (missing in females)
+    sex_error_rate: float
+        fraction of samples whose reported sex in the .fam is wrong
+    case_fraction: float
+        fraction of samples with a case phenotype (2), the others are controls (1)
+    block_size: int
+        number of variants drawn at a time (default: about 16 MB of genotypes)
+
+    Returns:
+    --------
+    prefix: str
+        prefix of the written files
+    """
+    rng = np.random.default_rng(seed)
+    bim = _variant_table(rng, n_variants, x_fraction, y_fraction)
+    male = rng.random(n_samples) < 0.5
+    reported_male = male ^ (rng.random(n_samples) < sex_error_rate)
+    fam = pd.DataFrame({'fid': [f'FAM{i}' for i in range(n_samples)],
+                        'iid': [f'ID{i}' for i in range(n_samples)], 'pat': '0', 'mat': '0',
+                        'sex': np.where(reported_male, 1, 2),
+                        'pheno': np.where(rng.random(n_samples) < case_fraction, 2, 1)})
+    related_pairs = min(related_pairs, n_samples // 2)
+    pairs = rng.permutation(n_samples)[:2 * related_pairs].reshape(-1, 2)
+    parents, children = pairs[:, 0], pairs[:, 1]
+    fam.loc[children, 'fid'] = fam['fid'].to_numpy()[parents]
+    fam.loc[children, 'pat' if rng.random() < 0.5 else 'mat'] = fam['iid'].to_numpy()[parents]
+    sample_missing = np.minimum(missing_rate * rng.gamma(2, 0.5, n_samples), 1)
+    maf = min_maf + (0.5 - min_maf) * rng.beta(maf_beta[0], maf_beta[1], n_variants)
+    chroms = bim['chrom'].to_numpy()
+    if block_size is None:
+        block_size = max(1, (1 << 24) // n_samples)
+
+    write_bim(bim, prefix + ".bim")
+    write_fam(fam, prefix + ".fam")
+    with BedWriter(prefix + ".bed") as bed:
+        for start in range(0, n_variants, block_size):
+            stop = min(start + block_size, n_variants)
+            p = maf[start:stop, None]
+            shape = (stop - start, n_samples)
+            genotypes = rng.binomial(2, p, size=shape).astype(np.int8)
+            if related_pairs:
+                transmitted = rng.binomial(1, genotypes[:, parents] / 2)
+                genotypes[:, children] = transmitted + rng.binomial(1, p, size=(shape[0], len(children)))
+            sex_chrom = np.isin(chroms[start:stop], ['23', '24'])
+            if sex_chrom.any():
+                hemizygous = 2 * rng.binomial(1, p[sex_chrom], size=(sex_chrom.sum(), male.sum()))
+                rows = np.flatnonzero(sex_chrom)
+                genotypes[np.ix_(rows, np.flatnonzero(male))] = hemizygous
+                y_rows = np.flatnonzero(chroms[start:stop] == '24')
+                genotypes[np.ix_(y_rows, np.flatnonzero(~male))] = -1
+            genotypes[rng.random(shape) < sample_missing] = -1
+            bed.write(encode_genotypes(genotypes))
+    return prefix
+
+
+if __name__ == "__main__":
+    generate_bfile(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]),
+                   seed=int(sys.argv[4]) if len(sys.argv) > 4 else 0)
@@ -0,0 +1,216 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+from .utils import write_table, read_table
+
+# An association results store is a directory with one table per chromosome
+# (chrom=<CHR>/part, sorted by position), an index of the partitions (_index)
+# and the strongest hits of the whole store sorted by p-value (_top). Tables
+# are parquet when pyarrow is installed, csv otherwise (see utils.write_table).
+# A csv partition is written in chunks of row_group_size rows and comes with
+# an offsets table (part.offsets.csv: first BP and byte offset of every
+# chunk), so region queries only read the chunks overlapping the region, as
+# they only read the overlapping row groups of a parquet partition.
+INDEX_COLUMNS = ['CHR', 'PATH', 'N', 'BP_MIN', 'BP_MAX', 'P_MIN']
+
+
+def _write_partition(results: pd.DataFrame, prefix: str, row_group_size: int):
+    """Write a sorted partition (parquet, or csv with its chunk offsets table)."""
+    try:
+        import pyarrow
+    except ImportError:
+        pass
+    else:
+        return write_table(results, prefix, row_group_size)
+    path = prefix + ".csv"
+    first_bp = []
+    offsets = []
+    with open(path, "w", newline="") as f:
+        f.write(",".join(results.columns) + "\n")
+        for i in range(0, len(results), row_group_size):
+            chunk = results.iloc[i:i + row_group_size]
+            first_bp.append(chunk['BP'].iloc[0])
+            offsets.append(f.tell())
+            chunk.to_csv(f, header=False, index=False)
+    pd.DataFrame({'BP': first_bp, 'OFFSET': offsets}).to_csv(prefix + ".offsets.csv", index=False)
+    return path
+
+
+def _read_csv_region(path: str, start: int, end: int, columns: list):
+    """Read the chunks of a csv partition that may hold rows in [start, end]."""
+    offsets_file = path[:-len(".csv")] + ".offsets.csv"
+    if not os.path.exists(offsets_file):
+        return read_table(path, columns)
+    offsets = pd.read_csv(offsets_file)
+    first_bp = offsets['BP'].to_numpy()
+    # the chunk before the first one starting at or after start may hold start
+    lo = 0 if start is None else max(np.searchsorted(first_bp, start, side='left') - 1, 0)
+    hi = len(first_bp) if end is None else np.searchsorted(first_bp, end, side='right')
+    bounds = np.append(offsets['OFFSET'].to_numpy(), os.path.getsize(path))
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(bounds[lo])
+        data = f.read(max(bounds[hi] - bounds[lo], 0))
+    return pd.read_csv(io.BytesIO(header + data), usecols=columns)
+
+
+def _find_table(prefix: str):
+    for ext in ['.parquet', '.csv']:
+        if os.path.exists(prefix + ext):
+            return prefix + ext
+    raise FileNotFoundError(f'no table found for {prefix}')
+
+
+class ResultsStore:
+    """Write association results into a store partitioned by chromosome.
+
+    Key arguments:
+    --------------
+    store: str
+        path of the store directory
+    top_n: int
+        number of strongest hits kept in the _top table
+    row_group_size: int
+        rows per parquet row group (or csv chunk) of the partitions (region
+        queries only read the row groups overlapping the region)
+    """
+    def __init__(self, store: str, top_n: int=1000, row_group_size: int=65536):
+        self.store = store
+        self.top_n = top_n
+        self.row_group_size = row_group_size
+        self.index = []
+        self.top = []
+        os.makedirs(store, exist_ok=True)
+
+    def add_partition(self, chrom: str, results: pd.DataFrame):
+        """Write the results of one chromosome.
+
+        Key arguments:
+        --------------
+        chrom: str
+            chromosome code
+        results: pd.DataFrame
+            association results with at least the CHR, BP and P columns
+        """
+        results = results.sort_values('BP', kind='stable').reset_index(drop=True)
+        part_dir = os.path.join(self.store, f'chrom={chrom}')
+        os.makedirs(part_dir, exist_ok=True)
+        path = _write_partition(results, os.path.join(part_dir, "part"), self.row_group_size)
+        self.index.append({'CHR': str(chrom), 'PATH': os.path.relpath(path, self.store),
+                           'N': len(results), 'BP_MIN': results['BP'].min(),
+                           'BP_MAX': results['BP'].max(), 'P_MIN': results['P'].min()})
+        self.top.append(results.nsmallest(self.top_n, 'P'))
+
+    def close(self):
+        """Write the partition index and the top hits table."""
+        index = pd.DataFrame(self.index, columns=INDEX_COLUMNS)
+        write_table(index, os.path.join(self.store, "_index"))
+        top = pd.concat(self.top, ignore_index=True) if self.top else pd.DataFrame(columns=['CHR', 'BP', 'P'])
+        write_table(top.nsmallest(self.top_n, 'P'), os.path.join(self.store, "_top"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # a store whose writing failed has no index, so it is not mistaken for a complete one
+        if exc_type is None:
+            self.close()
+
+
+def read_index(store: str):
+    """Read the partition index of a results store (one row per chromosome)."""
+    return read_table(_find_table(os.path.join(store, "_index")))
+
+
+def query_region(store: str, chrom: str, start: int=None, end: int=None, columns: list=None):
+    """Get the results of a chromosome region.
+
+    Only the partition of the chromosome is opened, and only its row groups
+    (parquet) or chunks (csv, through the offsets table) overlapping the region
+    are read.
+
+    Key arguments:
+    --------------
+    store: str
+        path of the store directory
+    chrom: str
+        chromosome code
+    start: int
+        first base pair position (default: start of the chromosome)
+    end: int
+        last base pair position (default: end of the chromosome)
+    columns: list
+        optional subset of columns to read
+
+    Returns:
+    --------
+    results: pd.DataFrame
+        results in the region, sorted by position
+    """
+    index = read_index(store)
+    part = index[index['CHR'].astype(str) == str(chrom)]
+    if part.empty:
+        return pd.DataFrame(columns=columns)
+    path = os.path.join(store, part['PATH'].iloc[0])
+    if columns is not None and 'BP' not in columns:
+        read_columns = list(columns) + ['BP']
+    else:
+        read_columns = columns
+    if path.endswith(".parquet"):
+        filters = []
+        if start is not None:
+            filters.append(('BP', '>=', start))
+        if end is not None:
+            filters.append(('BP', '<=', end))
+        results = pd.read_parquet(path, columns=read_columns, filters=filters or None)
+    else:
+        results = _read_csv_region(path, start, end, read_columns)
+        bp = results['BP'].to_numpy()
+        lo = 0 if start is None else np.searchsorted(bp, start, side='left')
+        hi = len(bp) if end is None else np.searchsorted(bp, end, side='right')
+        results = results.iloc[lo:hi]
+    results = results.reset_index(drop=True)
+    return results if columns is None else results[columns]
+
+
+def top_hits(store: str, n: int=None, p_threshold: float=None):
+    """Get the strongest associations of a results store.
+
+    Answered from the _top table when it covers the request; otherwise only
+    the partitions whose smallest p-value passes the threshold are read.
+
+    Key arguments:
+    --------------
+    store: str
+        path of the store directory
+    n: int
+        number of hits to return
+    p_threshold: float
+        only return hits with a p-value below this threshold
+
+    Returns:
+    --------
+    hits: pd.DataFrame
+        hits sorted by p-value
+    """
+    if n is None and p_threshold is None:
+        raise ValueError('please specify n and/or p_threshold')
+    top = read_table(_find_table(os.path.join(store, "_top")))
+    index = read_index(store)
+    n_top = len(top)
+    stored = top if p_threshold is None else top[top['P'] < p_threshold]
+    # the _top table is complete if it holds every result, or if results beyond it
+    # cannot be in the answer
+    complete = n_top == index['N'].sum() or (n is not None and len(stored) >= n) \
+        or (p_threshold is not None and n_top > 0 and top['P'].max() >= p_threshold)
+    if complete:
+        return stored.head(n).reset_index(drop=True) if n is not None else stored.reset_index(drop=True)
+    parts = index if p_threshold is None else index[index['P_MIN'] < p_threshold]
+    hits = []
+    for path in parts.sort_values('P_MIN')['PATH']:
+        results = read_table(os.path.join(store, path))
+        hits.append(results if p_threshold is None else results[results['P'] < p_threshold])
+    hits = pd.concat(hits, ignore_index=True) if hits else top.iloc[:0]
+    hits = hits.sort_values('P', kind='stable')
+    return (hits.head(n) if n is not None else hits).reset_index(drop=True)
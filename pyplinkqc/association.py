@@ -1,9 +1,116 @@
 import pandas as pd
+import numpy as np
 import os
+import shutil
+from .id_index import IDIndex
+from .plink_io import read_fam, write_fam
+from .utils import case_control_phenotypes
+
+def _reflink(src: str, dest: str):
+    """Clone src to dest sharing its blocks (copy-on-write), or copy it where cloning is unsupported."""
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+            # FICLONE (btrfs, xfs, ...); later writes to either file do not show in the other
+            fcntl.ioctl(fdest.fileno(), 0x40049409, fsrc.fileno())
+    except (ImportError, OSError):
+        shutil.copyfile(src, dest)
+
+def link_bfile(bfile: str, outfile: str, extensions: tuple=('.bed', '.bim'), link: str="sym"):
+    """Make plink binary files available under a new prefix without copying them.
+
+    Symlinks and hardlinks share the data of the original files: a tool that
+    rewrites a linked file in place (instead of replacing it) also changes the
+    original. A hardlink keeps the original's data even if it is later
+    replaced, but is indistinguishable from an independent file, so it is only
+    used on request. "reflink" clones the files copy-on-write where the
+    filesystem supports it, and copies them otherwise.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        new prefix
+    extensions: tuple
+        files to link
+    link: str
+        "sym" for symlinks, "reflink" for copy-on-write clones (falls back to
+        copies), "hard" for hardlinks (falls back to symlinks across
+        filesystems) or "copy" to copy the files
+    """
+    links = ['sym', 'reflink', 'hard', 'copy']
+    if link not in links:
+        raise ValueError(f'{link} not a valid choice, please choose from {links}')
+    for ext in extensions:
+        src = os.path.abspath(bfile + ext)
+        dest = outfile + ext
+        if os.path.abspath(dest) == src:
+            continue
+        if os.path.lexists(dest):
+            os.remove(dest)
+        if link == "hard":
+            try:
+                os.link(src, dest)
+                continue
+            except OSError:
+                pass
+        if link == "copy":
+            shutil.copyfile(src, dest)
+        elif link == "reflink":
+            _reflink(src, dest)
+        else:
+            os.symlink(src, dest)
+
+def attach_pheno(bfile: str, phenofile: str, outfile: str, link: str="sym",
+                 sidecar: bool=False):
+    """Attach case-control phenotypes to plink binary files without rewriting the .bed.
+
+    Only a new .fam (or a --pheno sidecar file) is written; the .bed and .bim
+    are linked under the output prefix.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    phenofile: str
+        file that contains the IDs of the individuals that have the phenotype,
+        either FID and IID columns or a list of IIDs
+    outfile: str
+        prefix for the output plink binary files
+    link: str
+        how the .bed/.bim (and .fam with sidecar) are made available under
+        outfile: "sym", "reflink", "hard" or "copy" (see link_bfile)
+    sidecar: bool
+        write the phenotypes to <outfile>.pheno (FID, IID, PHENO; for plink --pheno)
+        and link the original .fam instead of writing a new one
+
+    Returns:
+    --------
+    cases: int
+        number of samples set as cases
+    """
+    index = IDIndex.from_bfile(bfile, snps=False)
+    phenos = case_control_phenotypes(index.sample_mask_from_file(phenofile))
+    if sidecar:
+        pd.DataFrame({'FID': index.fids, 'IID': index.iids, 'PHENO': phenos}).to_csv(
+            outfile + ".pheno", sep=" ", index=False)
+        link_bfile(bfile, outfile, ('.bed', '.bim', '.fam'), link)
+    else:
+        fam = read_fam(bfile + ".fam")
+        fam['pheno'] = phenos
+        tmp = outfile + ".fam.tmp"
+        write_fam(fam, tmp)
+        os.replace(tmp, outfile + ".fam")
+        link_bfile(bfile, outfile, ('.bed', '.bim'), link)
+    return int((phenos == 2).sum())
 
 def generate_pheno_plink(bfile: str, phenofile: str, outfile: str):
     """Generates plink binary files annotated with case-control phenotypes.
 
+    Equivalent to plink --make-pheno <phenofile> '*' --make-bed, but the .bed is
+    linked rather than copied (see attach_pheno).
+
     Key arguments:
     --------------
     bfile: str
@@ -13,11 +120,11 @@ def generate_pheno_plink(bfile: str, phenofile: str, outfile: str):
     outfile: str
         prefix for the output plink binary files
     """
-    command = "./plink --bfile {} --make-pheno {} '*' --out {} --make-bed".format(bfile, phenofile, outfile)
-    os.system(command)
+    attach_pheno(bfile, phenofile, outfile)
 
 
-def perform_simple_assoc(bfile: str, outfile: str, adjust: bool=False):
+def perform_simple_assoc(bfile: str, outfile: str, adjust: bool=False, native: bool=False,
+                         phenofile: str=None, processes: int=1, plink_conf: str="../plink.conf"):
     """Performs 1 df chi-squared allelic assocation test. Assumes the plink binary files contain phenotype annotations (6th column of the .fam/.ped file). PLINK automatically infers qualitative vs quantitative (contains values other than 0, 1, 2 or missing) phenotypes.
 
     Key arguments:
@@ -28,15 +135,28 @@ def perform_simple_assoc(bfile: str, outfile: str, adjust: bool=False):
         optional parameter specifying whether to employ Bonferroni Correction for adjustment of the p-values
     outfile: str
         prefix for the output plink binary files
+    native: bool
+        run the test in-process on the packed genotypes (native_assoc.allelic_assoc)
+        instead of calling plink; results are written as columnar tables
+    phenofile: str
+        optional multi-column case/control phenotype file, all phenotypes are
+        tested in one pass over the genotypes (native only)
+    processes: int
+        number of worker processes the variant blocks are split over (native only)
+    plink_conf: str
+        path to the plink config file
     """
-    if adjust:
-        command = "./plink --bfile {} --adjust --assoc --out {}".format(bfile, outfile)
-    else:
-        command = "./plink --bfile {} --assoc --out {}".format(bfile, outfile)
-    os.system(command)
+    if native:
+        from .native_assoc import allelic_assoc
+        allelic_assoc(bfile, outfile, phenofile=phenofile, adjust=adjust, processes=processes)
+        return
+    from .run_plink import run_plink
+    run_plink(bfile, *_assoc_flags("assoc", adjust), f'--out {outfile}', make_bed=False,
+              plink_conf=plink_conf)
 
 
-def perform_cov_assoc(bfile: str, outfile: str, type: str="log", cov: str=""):
+def perform_cov_assoc(bfile: str, outfile: str, type: str="log", cov: str="", native: bool=False,
+                      phenofile: str=None, processes: int=1, plink_conf: str="../plink.conf"):
     """Performs linear/logistic regression association analysis.
 
     Key arguments:
@@ -49,13 +169,335 @@ def perform_cov_assoc(bfile: str, outfile: str, type: str="log", cov: str=""):
         optional parameter that specifies a covariate file (e.g txt file listing a covariate)
     outfile: str
         prefix for the output plink binary files
+    native: bool
+        run the regressions in-process (native_assoc.regression_assoc) instead
+        of calling plink; results are written as columnar tables
+    phenofile: str
+        optional multi-column phenotype file (native only)
+    processes: int
+        number of worker processes the variant blocks are split over (native only)
+    plink_conf: str
+        path to the plink config file
     """
-    if type=="linear":
-        command = "./plink --bfile {} --linear --out {}".format(bfile, outfile)
-    elif type=="log":
-        command = "./plink --bfile {} --logistic --out {}".format(bfile, outfile)
-    else:
+    if native:
+        from .native_assoc import regression_assoc
+        regression_assoc(bfile, outfile, type=type, cov=cov or None, phenofile=phenofile,
+                         processes=processes)
+        return
+    if type not in ["linear", "log"]:
         raise Exception("{} is not a supported regression model. Please try linear or log".format(type))
+    from .run_plink import run_plink
+    run_plink(bfile, *_assoc_flags(type, cov=cov), f'--out {outfile}', make_bed=False,
+              plink_conf=plink_conf)
+
+
+def _assoc_flags(type: str, adjust: bool=False, cov: str=""):
+    """Plink flags for an association test ("assoc", "linear" or "log")."""
+    types = {'assoc': '--assoc', 'linear': '--linear', 'log': '--logistic'}
+    if type not in types:
+        raise Exception("{} is not a supported association test. Please try {}".format(type, list(types)))
+    flags = [types[type]]
+    if adjust:
+        flags.append('--adjust')
     if cov != "":
-        command = command + " --cov {}".format(cov)
-    os.system(command)    
+        flags.append(f'--covar {cov}')
+    return flags
+
+
+def perform_multi_assoc(bfile: str, phenofile: str, outfile: str, type: str="assoc",
+                        adjust: bool=False, cov: str="", processes: int=1,
+                        plink_conf: str="../plink.conf"):
+    """Performs association tests for every phenotype of a multi-column phenotype file.
+
+    Plink is run with --pheno <phenofile> --all-pheno, so the genotypes are read
+    once for all phenotypes instead of once per phenotype. With processes > 1 the
+    phenotype columns are split into that many groups, each run by its own plink
+    process (one genotype pass per group) with its own output prefix
+    <outfile>.shard<i>. Results are written to <outfile>.<phenotype>.assoc (or
+    .assoc.linear/.assoc.logistic), and the logs of the shards are merged into
+    <outfile>.log.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    phenofile: str
+        phenotype file with a "FID IID <names...>" header
+        (generated by utils.generate_multi_phenofile)
+    outfile: str
+        prefix for the output files
+    type: str
+        "assoc" (1 df chi-squared allelic test), "linear" or "log" (logistic regression)
+    adjust: bool
+        also report multiple-testing adjusted p-values (plink --adjust)
+    cov: str
+        optional covariate file
+    processes: int
+        number of plink processes the phenotypes are sharded over
+    plink_conf: str
+        path to the plink config file
+
+    Returns:
+    --------
+    names: list
+        phenotype names that were tested
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .run_plink import run_plink
+
+    flags = _assoc_flags(type, adjust, cov)
+    phenos = pd.read_csv(phenofile, sep=r'\s+', dtype=str)
+    names = list(phenos.columns[2:])
+    groups = [names[i::processes] for i in range(processes) if names[i::processes]]
+    if len(groups) == 1:
+        shard_files = [phenofile]
+    else:
+        shard_files = []
+        for i, group in enumerate(groups):
+            shard_file = f'{outfile}.pheno_shard{i}.txt'
+            phenos[list(phenos.columns[:2]) + group].to_csv(shard_file, sep=" ", index=False)
+            shard_files.append(shard_file)
+
+    shard_outs = [outfile] if len(shard_files) == 1 else [f'{outfile}.shard{i}' for i in range(len(shard_files))]
+
+    def run_shard(shard_file, shard_out):
+        run_plink(bfile, f'--pheno {shard_file}', '--all-pheno', *flags, f'--out {shard_out}',
+                  make_bed=False, plink_conf=plink_conf)
+
+    with ThreadPoolExecutor(max_workers=len(shard_files)) as pool:
+        list(pool.map(run_shard, shard_files, shard_outs))
+    for shard_file in shard_files:
+        if shard_file != phenofile:
+            os.remove(shard_file)
+    if len(shard_outs) > 1:
+        _merge_shard_outputs(outfile, shard_outs)
+    return names
+
+
+def _merge_shard_outputs(outfile: str, shard_outs: list):
+    """Move the per-phenotype outputs of plink shards to outfile and merge their logs.
+
+    The .log files are concatenated (in shard order) into <outfile>.log and
+    only the first .nosex file is kept, since every shard reads the same .fam.
+    """
+    import glob
+
+    logs = []
+    for i, shard_out in enumerate(shard_outs):
+        for path in sorted(glob.glob(glob.escape(shard_out) + ".*")):
+            suffix = path[len(shard_out):]
+            if suffix == ".log":
+                logs.append(path)
+            elif suffix == ".nosex" and i > 0:
+                os.remove(path)
+            else:
+                os.replace(path, outfile + suffix)
+    with open(outfile + ".log", "w") as merged:
+        for path in logs:
+            merged.write(f'# {os.path.basename(path)}\n')
+            with open(path) as log:
+                shutil.copyfileobj(log, merged)
+            os.remove(path)
+
+
+def _assoc_shards(bfile: str, shard_size: int=None):
+    """Split the variants of a bfile by chromosome, and optionally into ranges of shard_size variants."""
+    from .plink_io import read_bim
+
+    bim = read_bim(bfile + ".bim")
+    shards = []
+    for chrom, pos in bim.groupby('chrom', sort=False)['pos']:
+        pos = np.sort(pos.to_numpy())
+        if shard_size is None or len(pos) <= shard_size:
+            shards.append((chrom, None, None))
+            continue
+        for i in range(0, len(pos), shard_size):
+            # ranges never split a position, so every variant is in exactly one shard
+            start = pos[i]
+            if i > 0 and start == pos[i - 1]:
+                continue
+            stop_index = min(i + shard_size, len(pos)) - 1
+            while stop_index + 1 < len(pos) and pos[stop_index + 1] == pos[stop_index]:
+                stop_index += 1
+            shards.append((chrom, start, pos[stop_index]))
+    return shards
+
+
+def perform_sharded_assoc(bfile: str, outfile: str, type: str="assoc", adjust: bool=False,
+                          cov: str="", shard_size: int=None, processes: int=1, threads: int=1,
+                          top_n: int=1000, plink_conf: str="../plink.conf"):
+    """Performs a plink association test sharded by chromosome (or variant range), merged into a results store.
+
+    Each shard is a separate plink process restricted with --chr (and
+    --from-bp/--to-bp) and using threads threads. The shard outputs are merged
+    into a results store at <outfile>.results with one table per chromosome
+    sorted by position (see assoc_store), so regions and top hits can be
+    queried without reading all results (assoc_store.query_region/top_hits).
+    With adjust, adjusted p-values are computed over all shards (see
+    native_assoc.adjust_pvalues) and written to <outfile>.results/_adjusted.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        prefix for the output files
+    type: str
+        "assoc" (1 df chi-squared allelic test), "linear" or "log" (logistic regression)
+    adjust: bool
+        also report multiple-testing adjusted p-values
+    cov: str
+        optional covariate file
+    shard_size: int
+        maximum number of variants per shard (default: one shard per chromosome)
+    processes: int
+        number of plink processes run at the same time
+    threads: int
+        number of threads of each plink process
+    top_n: int
+        number of strongest hits kept in the top hits table of the store
+    plink_conf: str
+        path to the plink config file
+
+    Returns:
+    --------
+    store: str
+        path of the results store
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .run_plink import run_plink
+    from .assoc_store import ResultsStore
+
+    flags = _assoc_flags(type, False, cov)
+    if type != "assoc":
+        flags.append('--hide-covar')
+    suffix = {'assoc': '.assoc', 'linear': '.assoc.linear', 'log': '.assoc.logistic'}[type]
+    shards = _assoc_shards(bfile, shard_size)
+    remaining = {}
+    for chrom, _, _ in shards:
+        remaining[chrom] = remaining.get(chrom, 0) + 1
+
+    def run_shard(i):
+        chrom, start, stop = shards[i]
+        shard_flags = [f'--chr {chrom}', f'--threads {threads}', f'--out {outfile}.shard{i}']
+        if start is not None:
+            shard_flags += [f'--from-bp {start}', f'--to-bp {stop}']
+        run_plink(bfile, *flags, *shard_flags, make_bed=False, plink_conf=plink_conf)
+        results = pd.read_csv(f'{outfile}.shard{i}{suffix}', sep=r'\s+', dtype={'CHR': str})
+        for ext in [suffix, '.log', '.nosex']:
+            if os.path.exists(f'{outfile}.shard{i}{ext}'):
+                os.remove(f'{outfile}.shard{i}{ext}')
+        return chrom, results
+
+    store_path = outfile + ".results"
+    pending = {}
+    with ResultsStore(store_path, top_n=top_n) as store, \
+            ThreadPoolExecutor(max_workers=processes) as pool:
+        # shards are merged as soon as all shards of their chromosome are done
+        for chrom, results in pool.map(run_shard, range(len(shards))):
+            pending.setdefault(chrom, []).append(results)
+            remaining[chrom] -= 1
+            if remaining[chrom] == 0:
+                store.add_partition(chrom, pd.concat(pending.pop(chrom), ignore_index=True))
+    if adjust:
+        from .native_assoc import adjust_pvalues
+        from .assoc_store import read_index
+        from .utils import read_table, write_table
+
+        index = read_index(store_path)
+        results = pd.concat([read_table(os.path.join(store_path, path), ['CHR', 'SNP', 'P'])
+                             for path in index['PATH']], ignore_index=True)
+        from scipy import stats
+        p = results['P'].to_numpy(dtype=float)
+        adjusted = adjust_pvalues(p, stats.chi2.isf(p, 1))
+        adjusted.insert(0, 'SNP', results['SNP'])
+        adjusted.insert(0, 'CHR', results['CHR'])
+        write_table(adjusted.sort_values('UNADJ', kind='stable'), os.path.join(store_path, "_adjusted"))
+    return store_path
+
+
+def clump_assoc(bfile: str, results, outfile: str, p1: float=1e-4, p2: float=1e-2,
+                r2: float=0.5, kb: int=250, cache_dir: str=None, tile_size: int=1000):
+    """Clumps association hits by LD (equivalent to plink --clump).
+
+    Variants with a p-value below p1 are taken as index variants, strongest
+    first. Each index variant forms a clump with the not yet clumped variants
+    within kb kilobases that have a p-value below p2 and an r2 of at least r2
+    with it. r2 is computed from the .bed in tiles that are cached on disk by
+    genotype fingerprint (see ld_cache.LDCache), so clumping other phenotypes
+    of the same genotypes reuses them.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam) used as LD reference
+    results: str or pd.DataFrame
+        association results with CHR, SNP, BP and P columns (a DataFrame, or a
+        file/results store readable by qc_plot.read_assoc_chunks)
+    outfile: str
+        prefix for the output file (<outfile>.clumped, see utils.write_table)
+    p1: float
+        p-value threshold of index variants
+    p2: float
+        p-value threshold of clumped variants
+    r2: float
+        LD threshold of clumped variants
+    kb: int
+        clump window in kilobases on each side of the index variant
+    cache_dir: str
+        LD cache directory (default: .ld_cache next to the bfile)
+    tile_size: int
+        number of variants per cached LD tile
+
+    Returns:
+    --------
+    clumps: pd.DataFrame
+        one row per clump with CHR, SNP, BP, P, TOTAL (clumped variants), NSIG
+        (clumped variants with P < 0.05), S05, S01, S001, S0001 (counts by
+        p-value bin) and SP2 (clumped variant IDs)
+    """
+    from .ld_cache import LDCache
+    from .utils import write_table
+
+    if isinstance(results, str):
+        from .qc_plot import read_assoc_chunks
+        results = pd.concat(read_assoc_chunks(results, ['CHR', 'SNP', 'BP', 'P']), ignore_index=True)
+    cache = LDCache(bfile, cache_dir=cache_dir, tile_size=tile_size)
+    index = IDIndex.from_bfile(bfile)
+    p = pd.to_numeric(results['P'], errors='coerce').to_numpy(dtype=float)
+    positions = index.snp_positions(results['SNP'])
+    keep = (positions >= 0) & (p < p2)
+    candidates = pd.DataFrame({'pos': positions[keep], 'P': p[keep]}).sort_values('P', kind='stable')
+    pvalues = np.full(cache.bim.shape[0], np.nan)
+    pvalues[candidates['pos']] = candidates['P']
+    bp = cache.bim['pos'].to_numpy()
+    chroms = cache.bim['chrom'].to_numpy()
+    snps = cache.bim['snp'].to_numpy()
+    available = ~np.isnan(pvalues)
+    clumps = []
+    for pos, pval in zip(candidates['pos'], candidates['P']):
+        if pval >= p1:
+            break
+        if not available[pos]:
+            continue
+        available[pos] = False
+        chrom = chroms[pos]
+        start, stop = cache.chrom_start[chrom], cache.chrom_stop[chrom]
+        lo = start + np.searchsorted(bp[start:stop], bp[pos] - kb * 1000, side='left')
+        hi = start + np.searchsorted(bp[start:stop], bp[pos] + kb * 1000, side='right')
+        window = lo + np.flatnonzero(available[lo:hi])
+        members = window[cache.r2(pos, window) >= r2] if len(window) else window
+        available[members] = False
+        member_p = pvalues[members]
+        clumps.append({'CHR': chrom, 'SNP': snps[pos], 'BP': bp[pos], 'P': pval,
+                       'TOTAL': len(members), 'NSIG': int((member_p < 0.05).sum()),
+                       'S05': int(((member_p >= 0.01) & (member_p < 0.05)).sum()),
+                       'S01': int(((member_p >= 0.001) & (member_p < 0.01)).sum()),
+                       'S001': int(((member_p >= 0.0001) & (member_p < 0.001)).sum()),
+                       'S0001': int((member_p < 0.0001).sum()),
+                       'SP2': ",".join(snps[members]) if len(members) else "NONE"})
+    clumps = pd.DataFrame(clumps, columns=['CHR', 'SNP', 'BP', 'P', 'TOTAL', 'NSIG', 'S05', 'S01',
+                                           'S001', 'S0001', 'SP2'])
+    write_table(clumps, outfile + ".clumped")
+    print(f'{len(clumps)} clumps, LD tiles: {cache.hits} from cache, {cache.misses} computed')
+    return clumps
@@ -0,0 +1,328 @@
+import os
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from .plink_io import BedWriter, encode_genotypes, write_bim, write_fam, plink_chrom
+from .utils import write_table
+
+# Streaming reader of BGEN files (v1.1 layout 1 and v1.2/v1.3 layout 2, zlib
+# or zstd compressed) of biallelic variants. Variant records are read in
+# order; their genotype probability blocks are decompressed and decoded by a
+# thread pool (zlib and zstd release the GIL) while the next variants are
+# read. Per variant, the A1 dosage, the hard calls, the MAF and the IMPUTE
+# INFO score are computed on the fly, with A1 the first allele of the BGEN.
+
+_COMPRESSION = {0: None, 1: 'zlib', 2: 'zstd'}
+
+
+def _zstd_decompress(data: bytes, size: int):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("reading zstd compressed bgen files requires zstandard, please install it")
+    return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+
+
+def read_bgen_header(bgen_file: str):
+    """Read the header (and embedded sample IDs) of a BGEN file.
+
+    Key arguments:
+    --------------
+    bgen_file: str
+        path to the .bgen file
+
+    Returns:
+    --------
+    header: dict
+        offset of the first variant block, n_variants, n_samples, compression
+        (None, "zlib" or "zstd"), layout (1 or 2) and sample_ids (None if the
+        file has no sample identifier block)
+    """
+    with open(bgen_file, "rb") as f:
+        offset, header_size, n_variants, n_samples = struct.unpack('<4I', f.read(16))
+        magic = f.read(4)
+        if magic not in (b'bgen', b'\x00\x00\x00\x00'):
+            raise ValueError(f'{bgen_file} is not a bgen file')
+        f.seek(4 + header_size - 4)
+        flags, = struct.unpack('<I', f.read(4))
+        compression = _COMPRESSION.get(flags & 3)
+        layout = (flags >> 2) & 15
+        if layout not in (1, 2):
+            raise ValueError(f'{bgen_file} has bgen layout {layout}, only layouts 1 and 2 are supported')
+        if layout == 1 and compression == 'zstd':
+            raise ValueError(f'{bgen_file} is not a valid bgen file (zstd compression with layout 1)')
+        sample_ids = None
+        if flags >> 31:
+            f.seek(4 + header_size)
+            _, n = struct.unpack('<2I', f.read(8))
+            sample_ids = []
+            for _ in range(n):
+                length, = struct.unpack('<H', f.read(2))
+                sample_ids.append(f.read(length).decode())
+    return {'offset': offset, 'n_variants': n_variants, 'n_samples': n_samples,
+            'compression': compression, 'layout': layout, 'sample_ids': sample_ids}
+
+
+def read_bgen_samples(bgen_file: str, sample_file: str=None):
+    """Get the samples of a BGEN file as a plink .fam table.
+
+    Key arguments:
+    --------------
+    bgen_file: str
+        path to the .bgen file
+    sample_file: str
+        optional Oxford .sample file (ID_1, ID_2 and optionally sex columns);
+        by default the IDs embedded in the .bgen are used (FID = IID), or the
+        sample numbers if there are none
+
+    Returns:
+    --------
+    fam: pd.DataFrame
+        table with the columns of plink_io.read_fam
+    """
+    header = read_bgen_header(bgen_file)
+    if sample_file is not None:
+        # the second line of a .sample file holds the column types
+        samples = pd.read_csv(sample_file, sep=r'\s+', skiprows=[1], dtype=str)
+        fid, iid = samples.iloc[:, 0].to_numpy(), samples.iloc[:, 1].to_numpy()
+        sex = pd.to_numeric(samples['sex'], errors='coerce').fillna(0).astype('int8') \
+            if 'sex' in samples.columns else 0
+    else:
+        ids = header['sample_ids'] or [str(i + 1) for i in range(header['n_samples'])]
+        fid, iid, sex = ids, ids, 0
+    fam = pd.DataFrame({'fid': fid, 'iid': iid, 'pat': '0', 'mat': '0', 'sex': sex, 'pheno': '-9'})
+    if len(fam) != header['n_samples']:
+        raise ValueError(f'{len(fam)} samples in {sample_file}, {header["n_samples"]} in {bgen_file}')
+    return fam
+
+
+def _read_string(f, size: int):
+    length, = struct.unpack('<I' if size == 4 else '<H', f.read(size))
+    return f.read(length).decode()
+
+
+def _read_variant(f, layout: int, compression: str, n_samples: int):
+    """Read one variant record: its identifiers and its (still compressed) probability block."""
+    if layout == 1:
+        f.read(4)
+    snp_id = _read_string(f, 2)
+    rsid = _read_string(f, 2)
+    chrom = _read_string(f, 2)
+    pos, = struct.unpack('<I', f.read(4))
+    n_alleles = 2 if layout == 1 else struct.unpack('<H', f.read(2))[0]
+    alleles = [_read_string(f, 4) for _ in range(n_alleles)]
+    if n_alleles != 2:
+        raise ValueError(f'variant {rsid} has {n_alleles} alleles, only biallelic variants are supported')
+    if layout == 1:
+        if compression is None:
+            size = 6 * n_samples
+            data = f.read(size)
+        else:
+            length, = struct.unpack('<I', f.read(4))
+            size, data = 6 * n_samples, f.read(length)
+    else:
+        length, = struct.unpack('<I', f.read(4))
+        if compression is None:
+            size, data = length, f.read(length)
+        else:
+            size, = struct.unpack('<I', f.read(4))
+            data = f.read(length - 4)
+    return (chrom, rsid if rsid not in ('', '.') else snp_id, pos, alleles[0], alleles[1]), data, size
+
+
+def _unpack_bits(buf: np.ndarray, bits: int, count: int):
+    """Unpack count little-endian values of the given bit width."""
+    if bits in (8, 16, 32):
+        return np.frombuffer(buf[:count * bits // 8].tobytes(), dtype=f'<u{bits // 8}').astype(np.float64)
+    raw = np.unpackbits(buf[:(count * bits + 7) // 8], bitorder='little')[:count * bits]
+    return raw.reshape(count, bits) @ (2.0 ** np.arange(bits))
+
+
+def _genotype_probabilities(data: bytes, layout: int, n_samples: int):
+    """Probabilities of 2, 1 and 0 copies of the first allele (each of shape (n_samples,)) and the missing mask."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if layout == 1:
+        probs = np.frombuffer(data, dtype='<u2').reshape(n_samples, 3) / 32768
+        missing = probs.sum(axis=1) == 0
+        return probs[:, 0], probs[:, 1], probs[:, 2], missing
+    n, = struct.unpack_from('<I', data)
+    if n != n_samples:
+        raise ValueError(f'probability block has {n} samples, expected {n_samples}')
+    ploidy = buf[8:8 + n] & 63
+    missing = (buf[8:8 + n] & 128) > 0
+    phased, bits = buf[8 + n], buf[9 + n]
+    # biallelic: one stored value per allele copy, phased or not
+    values = _unpack_bits(buf[10 + n:], int(bits), int(ploidy.sum())) / (2 ** int(bits) - 1)
+    first = np.cumsum(ploidy) - ploidy
+    diploid = ploidy == 2
+    v0 = values[np.minimum(first, len(values) - 1)] if len(values) else np.zeros(n)
+    v1 = np.where(diploid, values[np.minimum(first + 1, len(values) - 1)], 0) if len(values) else np.zeros(n)
+    if phased:
+        # haplotype probabilities of the first allele
+        p2 = np.where(diploid, v0 * v1, v0)
+        p1 = np.where(diploid, v0 * (1 - v1) + v1 * (1 - v0), 0)
+    else:
+        p2, p1 = v0, v1
+    # haploid genotypes are coded as homozygous, like plink does for male X
+    missing |= (ploidy == 0) | (ploidy > 2)
+    return p2, p1, np.clip(1 - p2 - p1, 0, 1), missing
+
+
+def _decode_variant(data: bytes, size: int, layout: int, compression: str, n_samples: int,
+                    hard_call_threshold: float):
+    """Dosages, hard calls, A1 frequency and INFO score of one variant (run in a worker thread)."""
+    if compression == 'zlib':
+        data = zlib.decompress(data, bufsize=size)
+    elif compression == 'zstd':
+        data = _zstd_decompress(data, size)
+    p2, p1, p0, missing = _genotype_probabilities(data, layout, n_samples)
+    dosage = 2 * p2 + p1
+    probs = np.stack([p0, p1, p2])
+    calls = probs.argmax(axis=0).astype(np.int8)
+    calls[(probs.max(axis=0) < 1 - hard_call_threshold) | missing] = -1
+    called = ~missing
+    n = called.sum()
+    if n == 0:
+        return np.full(n_samples, -1, dtype=np.float32), calls, np.nan, 0.0
+    theta = dosage[called].sum() / (2 * n)
+    if 0 < theta < 1:
+        variance = (4 * p2 + p1 - dosage ** 2)[called].sum()
+        info = 1 - variance / (2 * n * theta * (1 - theta))
+    else:
+        info = 1.0
+    dosage = np.where(missing, -1, dosage).astype(np.float32)
+    return dosage, calls, theta, info
+
+
+def iter_bgen(bgen_file: str, block_size: int=None, threads: int=None, hard_call_threshold: float=0.1):
+    """Stream the variants of a BGEN file in blocks.
+
+    Key arguments:
+    --------------
+    bgen_file: str
+        path to the .bgen file (biallelic variants)
+    block_size: int
+        number of variants per block (default: about 32 MB of dosages)
+    threads: int
+        number of threads decompressing and decoding variants (default: all cores)
+    hard_call_threshold: float
+        genotypes whose most likely call has a probability below
+        1 - hard_call_threshold are hard-called as missing (as plink does)
+
+    Returns:
+    --------
+    generator of (variants, dosages, genotypes) tuples:
+        variants: pd.DataFrame
+            .bim columns (A1 is the first allele) plus A1 frequency (freq),
+            MAF (maf) and INFO score (info)
+        dosages: np.ndarray
+            float32 A1 dosages of shape (n_variants, n_samples), -1 if missing
+        genotypes: np.ndarray
+            int8 hard-called A1 counts of shape (n_variants, n_samples), -1 if missing
+    """
+    header = read_bgen_header(bgen_file)
+    n_samples, n_variants = header['n_samples'], header['n_variants']
+    layout, compression = header['layout'], header['compression']
+    if block_size is None:
+        block_size = max(1, (1 << 23) // max(n_samples, 1))
+
+    def collect(records, futures):
+        results = [future.result() for future in futures]
+        variants = pd.DataFrame(records, columns=['chrom', 'snp', 'pos', 'a1', 'a2'])
+        variants['chrom'] = variants['chrom'].map(plink_chrom)
+        variants.insert(2, 'cm', 0.0)
+        variants['freq'] = [result[2] for result in results]
+        variants['maf'] = np.minimum(variants['freq'], 1 - variants['freq'])
+        variants['info'] = [result[3] for result in results]
+        dosages = np.stack([result[0] for result in results])
+        genotypes = np.stack([result[1] for result in results])
+        return variants, dosages, genotypes
+
+    pending = deque()
+    with open(bgen_file, "rb", buffering=1 << 20) as f, \
+            ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        f.seek(header['offset'] + 4)
+        for start in range(0, n_variants, block_size):
+            records, futures = [], []
+            for _ in range(min(block_size, n_variants - start)):
+                record, data, size = _read_variant(f, layout, compression, n_samples)
+                records.append(record)
+                futures.append(pool.submit(_decode_variant, data, size, layout, compression,
+                                           n_samples, hard_call_threshold))
+            pending.append((records, futures))
+            # the next block is read while the previous one is decoded
+            if len(pending) > 1:
+                yield collect(*pending.popleft())
+        while pending:
+            yield collect(*pending.popleft())
+
+
+def bgen_qc(bgen_file: str, outfile: str, sample_file: str=None, info_threshold: float=0.8,
+            maf_threshold: float=0.0, hard_call_threshold: float=0.1, output: str="bed",
+            block_size: int=None, threads: int=None):
+    """Filter an imputed BGEN file by INFO score and MAF in one streaming pass.
+
+    Variants with an INFO score above info_threshold and a MAF of at least
+    maf_threshold are written as hard calls to a plink bfile, or as dosages
+    to <outfile>.dosage (one float32 row per variant of <outfile>.bim, -1 if
+    missing) that native_assoc.regression_assoc(..., dosage=True) tests
+    directly. The MAF and INFO score of every variant, and whether it passed,
+    are written to <outfile>.bgen_info.
+
+    Key arguments:
+    --------------
+    bgen_file: str
+        path to the .bgen file
+    outfile: str
+        prefix for the output files
+    sample_file: str
+        optional Oxford .sample file (see read_bgen_samples)
+    info_threshold: float
+        variants with an INFO score up to info_threshold are removed
+    maf_threshold: float
+        variants with a MAF below maf_threshold are removed
+    hard_call_threshold: float
+        see iter_bgen
+    output: str
+        "bed" (hard calls) or "dosage"
+    block_size: int
+        number of variants per block (see iter_bgen)
+    threads: int
+        number of decoding threads (see iter_bgen)
+
+    Returns:
+    --------
+    n_kept: int
+        number of variants written
+    n_variants: int
+        number of variants in the .bgen file
+    """
+    outputs = ['bed', 'dosage']
+    if output not in outputs:
+        raise ValueError(f'{output} not a valid choice, please choose from {outputs}')
+    write_fam(read_bgen_samples(bgen_file, sample_file), outfile + ".fam")
+    stats = []
+    kept = []
+    writer = BedWriter(outfile + ".bed") if output == "bed" else open(outfile + ".dosage", "wb")
+    with writer:
+        for variants, dosages, genotypes in iter_bgen(bgen_file, block_size, threads, hard_call_threshold):
+            passed = (variants['info'] > info_threshold) & (variants['maf'] >= maf_threshold)
+            mask = passed.to_numpy()
+            if output == "bed":
+                writer.write(encode_genotypes(genotypes[mask]))
+            else:
+                writer.write(np.ascontiguousarray(dosages[mask]).tobytes())
+            kept.append(variants.loc[mask])
+            stats.append(variants.assign(passed=mask))
+    bim = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame(columns=['chrom', 'snp', 'cm', 'pos', 'a1', 'a2'])
+    write_bim(bim, outfile + ".bim")
+    stats = pd.concat(stats, ignore_index=True) if stats else pd.DataFrame(
+        columns=['chrom', 'snp', 'pos', 'a1', 'a2', 'maf', 'info', 'passed'])
+    write_table(pd.DataFrame({'CHR': stats['chrom'], 'SNP': stats['snp'], 'BP': stats['pos'],
+                              'A1': stats['a1'], 'A2': stats['a2'], 'MAF': stats['maf'],
+                              'INFO': stats['info'], 'PASS': stats['passed']}), outfile + ".bgen_info")
+    print(f'{len(bim)}/{len(stats)} variants passed INFO > {info_threshold} and MAF >= {maf_threshold}')
+    return len(bim), len(stats)
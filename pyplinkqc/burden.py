@@ -0,0 +1,248 @@
+import re
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from .plink_io import read_bim, decode_genotypes, plink_chrom
+from .native_assoc import (load_phenotypes, load_covariates, impute_missing, regression_stats,
+                           _regression_model, _init_regression, _REGRESSION)
+from .utils import write_table
+
+def read_regions(regionfile: str, feature: str="gene"):
+    """Read gene/region intervals from a BED or GTF file.
+
+    Key arguments:
+    --------------
+    regionfile: str
+        BED file (chrom, 0-based start, end, name; further columns are ignored)
+        or GTF/GFF file (.gtf/.gff, optionally gzipped)
+    feature: str
+        GTF feature type to keep; regions are named by gene_name (or gene_id)
+
+    Returns:
+    --------
+    regions: pd.DataFrame
+        CHR (plink code), START and END (1-based, inclusive) and NAME columns
+    """
+    if re.search(r'\.(gtf|gff3?)(\.gz)?$', regionfile):
+        gtf = pd.read_csv(regionfile, sep="\t", comment="#", header=None, usecols=[0, 2, 3, 4, 8],
+                          names=['CHR', 'FEATURE', 'START', 'END', 'ATTRIBUTES'],
+                          dtype={'CHR': str, 'FEATURE': str, 'ATTRIBUTES': str})
+        gtf = gtf[gtf['FEATURE'] == feature]
+        names = gtf['ATTRIBUTES'].str.extract(r'gene_name "?([^";]+)', expand=False)
+        ids = gtf['ATTRIBUTES'].str.extract(r'gene_id "?([^";]+)', expand=False)
+        regions = pd.DataFrame({'CHR': gtf['CHR'], 'START': gtf['START'], 'END': gtf['END'],
+                                'NAME': names.fillna(ids)})
+    else:
+        bed = pd.read_csv(regionfile, sep=r'\s+', comment="#", header=None, usecols=[0, 1, 2, 3],
+                          names=['CHR', 'START', 'END', 'NAME'], dtype={'CHR': str, 'NAME': str})
+        bed = bed[~bed['CHR'].isin(['track', 'browser'])]
+        regions = pd.DataFrame({'CHR': bed['CHR'], 'START': bed['START'].astype('int64') + 1,
+                                'END': bed['END'].astype('int64'), 'NAME': bed['NAME']})
+    regions['CHR'] = regions['CHR'].map(plink_chrom)
+    return regions.reset_index(drop=True)
+
+
+class RegionIndex:
+    """Interval index of gene/region intervals, per chromosome sorted by start.
+
+    Variants are joined to the (possibly overlapping) regions containing them
+    with two binary searches per region over the sorted variant positions,
+    instead of comparing every variant with every region.
+
+    Key arguments:
+    --------------
+    regions: pd.DataFrame
+        CHR, START, END (1-based, inclusive) and NAME columns (see read_regions)
+    """
+    def __init__(self, regions: pd.DataFrame):
+        self.regions = regions.sort_values(['CHR', 'START', 'END'], kind='stable').reset_index(drop=True)
+        self.chroms = {chrom: group.index.to_numpy()
+                       for chrom, group in self.regions.groupby('CHR', sort=False)}
+
+    @classmethod
+    def from_file(cls, regionfile: str, feature: str="gene"):
+        """Build the index of a BED or GTF file (see read_regions)."""
+        return cls(read_regions(regionfile, feature))
+
+    def __len__(self):
+        return len(self.regions)
+
+    def join(self, chrom: str, positions: np.ndarray):
+        """Join variants of a chromosome to the regions containing them.
+
+        Key arguments:
+        --------------
+        chrom: str
+            plink chromosome code
+        positions: np.ndarray
+            base pair positions of the variants, sorted ascending
+
+        Returns:
+        --------
+        region_ids: np.ndarray
+            region (row of self.regions) of each (region, variant) pair
+        variant_ids: np.ndarray
+            index into positions of each (region, variant) pair
+        """
+        ids = self.chroms.get(chrom, np.zeros(0, dtype=np.int64))
+        lo = np.searchsorted(positions, self.regions['START'].to_numpy()[ids], side='left')
+        hi = np.searchsorted(positions, self.regions['END'].to_numpy()[ids], side='right')
+        counts = np.maximum(hi - lo, 0)
+        region_ids = np.repeat(ids, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        variant_ids = np.arange(counts.sum()) - first + np.repeat(lo, counts)
+        return region_ids, variant_ids
+
+
+def _burden_chunk(start: int, stop: int, region_ids: np.ndarray, pair_regions: np.ndarray,
+                  pair_variants: np.ndarray, maf_max: float, weights: str, block_size: int):
+    """Burden scores and tests of a group of regions whose variants are in [start, stop)."""
+    n_regions = len(region_ids)
+    local = np.searchsorted(region_ids, pair_regions)
+    n_samples = _REGRESSION['n_samples']
+    burden = np.zeros((n_regions, n_samples))
+    nvar = np.zeros(n_regions, dtype=np.int64)
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        G, called = impute_missing(decode_genotypes(_REGRESSION['bed'][block_start:block_stop], n_samples))
+        a1_freq = G.mean(axis=1) / 2
+        # count minor alleles
+        flip = a1_freq > 0.5
+        G[flip] = 2 - G[flip]
+        maf = np.where(flip, 1 - a1_freq, a1_freq)
+        rare = (maf > 0) & (maf <= maf_max) & (called > 0)
+        with np.errstate(divide='ignore'):
+            w = np.ones(len(G)) if weights == "uniform" else 1 / np.sqrt(maf * (1 - maf))
+        sel = (pair_variants >= block_start) & (pair_variants < block_stop)
+        v = pair_variants[sel] - block_start
+        sel_rare = rare[v]
+        W = sparse.csr_matrix((w[v][sel_rare], (local[sel][sel_rare], v[sel_rare])),
+                              shape=(n_regions, len(G)))
+        burden += W @ G
+        nvar += np.bincount(local[sel][sel_rare], minlength=n_regions)
+    results = [regression_stats(model, burden[:, model['kept']]) for model in _REGRESSION['models']]
+    return region_ids, nvar, results
+
+
+def burden_assoc(bfile: str, regionfile: str, outfile: str, type: str="log", cov: str=None,
+                 phenofile: str=None, maf_max: float=0.01, weights: str="uniform",
+                 feature: str="gene", regions_per_chunk: int=64, block_size: int=None,
+                 gate: float=1e-3, processes: int=1):
+    """Gene/region-based rare-variant burden tests.
+
+    The regions of a BED/GTF file are joined to the .bim variants with a
+    RegionIndex. Per-sample burden scores (weighted minor allele counts of the
+    rare variants in each region, missing genotypes mean-imputed) are summed
+    over variant blocks as sparse region x variant weight matrix products, and
+    tested against each phenotype with the regression models of native_assoc.
+    Groups of regions_per_chunk consecutive regions are processed in parallel,
+    so all regions are tested in about one pass over the genotypes. Results are
+    written per phenotype to <outfile>.burden (<outfile>.<phenotype>.burden with
+    phenofile), with one row per region: regions without rare variants (e.g.
+    on chromosomes missing from the .bim) have NVAR 0 and NaN statistics.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    regionfile: str
+        BED or GTF file of the regions (see read_regions)
+    outfile: str
+        prefix for the output files
+    type: str
+        "linear" or "log" (logistic regression)
+    cov: str
+        optional covariate file (see native_assoc.load_covariates)
+    phenofile: str
+        optional multi-column phenotype file (see native_assoc.load_phenotypes)
+    maf_max: float
+        variants with a minor allele frequency up to maf_max are aggregated
+    weights: str
+        "uniform" or "madsen-browning" (1 / sqrt(maf * (1 - maf))) variant weights
+    feature: str
+        GTF feature type of the regions
+    regions_per_chunk: int
+        number of regions per parallel task
+    block_size: int
+        number of variants decoded at a time (default: about 32 MB of decoded genotypes)
+    gate: float
+        score test p-value below which logistic models are refined by IRLS
+    processes: int
+        number of worker processes
+
+    Returns:
+    --------
+    results: dict
+        maps phenotype names to result DataFrames
+    """
+    types = {'linear': 'linear', 'log': 'logistic'}
+    if type not in types:
+        raise ValueError(f'{type} not a valid choice, please choose from {list(types)}')
+    weight_choices = ['uniform', 'madsen-browning']
+    if weights not in weight_choices:
+        raise ValueError(f'{weights} not a valid choice, please choose from {weight_choices}')
+    index = RegionIndex.from_file(regionfile, feature)
+    if len(index) == 0:
+        raise ValueError(f'{regionfile} has no regions, please check the file (and the GTF feature {feature})')
+    bim = read_bim(bfile + ".bim")
+    names, phenos = load_phenotypes(bfile, phenofile, binary=type == "log")
+    n_samples = phenos.shape[1]
+    covs = np.empty((n_samples, 0)) if cov is None else load_covariates(bfile, cov)[1]
+    models = [_regression_model(type, pheno, covs, gate) for pheno in phenos]
+    if block_size is None:
+        block_size = max(1, (1 << 22) // n_samples)
+
+    tasks = []
+    chroms = bim['chrom'].map(plink_chrom).to_numpy()
+    for chrom in pd.unique(chroms):
+        offset = np.flatnonzero(chroms == chrom)
+        order = np.argsort(bim['pos'].to_numpy()[offset], kind='stable')
+        region_ids, variant_ids = index.join(chrom, bim['pos'].to_numpy()[offset][order])
+        variant_ids = offset[order][variant_ids]
+        chrom_regions = index.chroms.get(chrom, [])
+        for i in range(0, len(chrom_regions), regions_per_chunk):
+            chunk = chrom_regions[i:i + regions_per_chunk]
+            sel = (region_ids >= chunk[0]) & (region_ids <= chunk[-1])
+            variants = variant_ids[sel]
+            start, stop = (variants.min(), variants.max() + 1) if len(variants) else (0, 0)
+            tasks.append((start, stop, chunk, region_ids[sel], variants, maf_max, weights, block_size))
+
+    init_args = (bfile + ".bed", n_samples, len(bim), models)
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_regression,
+                                 initargs=init_args) as pool:
+            chunks = list(pool.map(_burden_chunk, *zip(*tasks)))
+    else:
+        _init_regression(*init_args)
+        chunks = [_burden_chunk(*task) for task in tasks]
+
+    # regions on chromosomes without variants get rows too (after the others, with NVAR 0)
+    tested = [chunk[0] for chunk in chunks]
+    untested = np.setdiff1d(np.arange(len(index)), np.concatenate(tested + [np.zeros(0, dtype=np.int64)]))
+    if len(untested):
+        print(f'{len(untested)} regions are on chromosomes without variants in {bfile}.bim')
+    region_ids = np.concatenate(tested + [untested])
+    regions = index.regions.iloc[region_ids].reset_index(drop=True)
+    nvar = np.concatenate([chunk[1] for chunk in chunks] + [np.zeros(len(untested), dtype=np.int64)])
+    if not (nvar > 0).any():
+        print(f'no region of {regionfile} holds variants with MAF <= {maf_max}, no region was tested')
+    tables = {}
+    for i, name in enumerate(names):
+        # regions without rare variants are not tested
+        columns = {key: np.where(nvar > 0, np.concatenate([chunk[2][i][key] for chunk in chunks]
+                                                          + [np.full(len(untested), np.nan)]), np.nan)
+                   for key in ['BETA', 'SE', 'STAT', 'P']}
+        table = pd.DataFrame({'CHR': regions['CHR'], 'NAME': regions['NAME'],
+                              'START': regions['START'], 'END': regions['END'], 'NVAR': nvar})
+        if type == "linear":
+            table['BETA'] = columns['BETA']
+        else:
+            table['OR'] = np.exp(columns['BETA'])
+        table['SE'] = columns['SE']
+        table['STAT'] = columns['STAT']
+        table['P'] = columns['P']
+        prefix = outfile if phenofile is None else f'{outfile}.{name}'
+        write_table(table, f'{prefix}.burden')
+        tables[name] = table
+    return tables
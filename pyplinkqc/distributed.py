@@ -0,0 +1,631 @@
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import socket
+import fnmatch
+import logging
+import importlib
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+# Layout of a queue directory on the shared filesystem:
+# tasks/<task_id>.json                task definitions written by the coordinator
+# leases/<task_id>.<attempt>.lease    lease of every attempt at a task; the highest
+#                                     attempt is the current one
+# done/<task_id>.json                 completion records written by workers
+# failed/<task_id>.json               tasks that ran out of attempts, or whose
+#                                     dependencies failed
+# results/                            outputs published by workers
+# scratch/                            private working directories of running tasks
+#
+# Leases are never renamed or deleted while a task is pending: a worker claims
+# attempt k by creating <task_id>.<k>.lease with a hard link from a private
+# file, which fails if the file exists. An expired attempt k is taken over by
+# creating attempt k + 1 the same way, so exactly one worker wins every attempt
+# and a slow worker can never remove a lease another worker has just taken.
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_DIRS = ['tasks', 'leases', 'done', 'failed', 'results', 'scratch']
+
+
+def init_queue(queue_dir: str):
+    """Create the directory layout of a task queue.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        directory on a filesystem shared by the coordinator and all workers
+
+    Returns:
+    --------
+    queue_dir: str
+        absolute path to the queue directory
+    """
+    queue_dir = os.path.abspath(queue_dir)
+    for name in _QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+    return queue_dir
+
+
+def _write_json(path: str, record: dict):
+    """Atomically write a json record (write to a temporary file, then rename)."""
+    tmp = f'{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, "w") as f:
+        json.dump(record, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _create_json(path: str, record: dict):
+    """Atomically create a json record, failing if the file exists.
+
+    Returns:
+    --------
+    created: bool
+        False if the file already exists
+    """
+    tmp = f'{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, "w") as f:
+        json.dump(record, f, indent=1)
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+    return True
+
+
+def _read_json(path: str):
+    """Read a json record, returning None if it does not exist (yet)."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def submit_task(queue_dir: str, task_id: str, stage: str, args: list=None,
+                kwargs: dict=None, depends_on: list=None, outputs: list=None,
+                max_attempts: int=3):
+    """Write a QC stage task to the queue.
+
+    String arguments may contain "{results}", which workers replace with the
+    path to the shared results directory, so that a stage can read the outputs
+    published by the stages it depends on. Stages run in a private working
+    directory, so relative string arguments naming existing files or plink
+    prefixes (e.g. "data/cohort" for data/cohort.bed) are made absolute against
+    the current working directory when the task is submitted. Other relative
+    paths, such as output prefixes, are left relative: the stage writes them
+    into its working directory, from which the outputs are published.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    task_id: str
+        unique name of the task
+    stage: str
+        dotted path to the function running the stage (e.g. "pyplinkqc.qc_filter.maf")
+    args: list
+        positional arguments passed to the stage function
+    kwargs: dict
+        keyword arguments passed to the stage function
+    depends_on: list
+        IDs of tasks that must be completed before this task can be claimed
+    outputs: list
+        file names or glob patterns (relative to the task working directory,
+        e.g. "maf_filtered.*" for the outfile "maf_filtered") that are
+        published to the results directory when the stage succeeds
+    max_attempts: int
+        number of times the task is retried after a failure or an expired lease
+
+    Returns:
+    --------
+    task: dict
+        task definition written to the queue
+    """
+    outputs = list(outputs or [])
+    absolute = [pattern for pattern in outputs if os.path.isabs(pattern)]
+    if absolute:
+        raise ValueError(f'outputs {absolute} must be relative to the task working directory')
+    queue_dir = init_queue(queue_dir)
+    cwd = os.getcwd()
+    task = {'id': task_id,
+            'stage': stage,
+            'args': _resolve_inputs(list(args or []), cwd, outputs),
+            'kwargs': _resolve_inputs(dict(kwargs or {}), cwd, outputs),
+            'depends_on': list(depends_on or []),
+            'outputs': outputs,
+            'max_attempts': max_attempts,
+            'submitted': time.time()}
+    _write_json(os.path.join(queue_dir, 'tasks', f'{task_id}.json'), task)
+    return task
+
+
+def _is_input(path: str, cwd: str, outputs: list):
+    """Check whether a relative path names an existing file or plink prefix, and no output."""
+    if not path or os.path.isabs(path) or "{results}" in path:
+        return False
+    if any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(path + ".bed", pattern) for pattern in outputs):
+        return False
+    full = os.path.join(cwd, path)
+    return os.path.exists(full) or bool(glob.glob(glob.escape(full) + ".*"))
+
+
+def _resolve_inputs(value, cwd: str, outputs: list):
+    """Make the relative paths of existing inputs in (nested) task arguments absolute."""
+    if isinstance(value, str):
+        return os.path.join(cwd, value) if _is_input(value, cwd, outputs) else value
+    if isinstance(value, list):
+        return [_resolve_inputs(v, cwd, outputs) for v in value]
+    if isinstance(value, dict):
+        return {k: _resolve_inputs(v, cwd, outputs) for k, v in value.items()}
+    return value
+
+
+def submit_dag(queue_dir: str, tasks: list):
+    """Write a DAG of QC stage tasks to the queue.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    tasks: list
+        list of dictionaries with the arguments of submit_task
+        (task_id, stage, args, kwargs, depends_on, outputs, max_attempts)
+
+    Returns:
+    --------
+    task_ids: list
+        IDs of the submitted tasks
+    """
+    ids = set(task['task_id'] for task in tasks)
+    for task in tasks:
+        missing = [dep for dep in task.get('depends_on', []) if dep not in ids
+                   and not os.path.isfile(os.path.join(queue_dir, 'tasks', f'{dep}.json'))]
+        if missing:
+            raise ValueError(f'task {task["task_id"]} depends on unknown tasks {missing}')
+    for task in tasks:
+        submit_task(queue_dir, **task)
+    return [task['task_id'] for task in tasks]
+
+
+def _lease_file(queue_dir: str, task_id: str, attempt: int):
+    return os.path.join(queue_dir, 'leases', f'{task_id}.{attempt}.lease')
+
+
+def _lease_attempts(queue_dir: str, task_id: str):
+    """Get the attempt numbers of the lease files of a task."""
+    pattern = re.compile(re.escape(task_id) + r'\.(\d+)\.lease$')
+    paths = glob.glob(os.path.join(queue_dir, 'leases', f'{glob.escape(task_id)}.*.lease'))
+    matches = (pattern.match(os.path.basename(path)) for path in paths)
+    return [int(match.group(1)) for match in matches if match]
+
+
+def _current_lease(queue_dir: str, task_id: str):
+    """Get the highest attempt at a task and its lease record ((0, None) if never claimed)."""
+    attempts = _lease_attempts(queue_dir, task_id)
+    if not attempts:
+        return 0, None
+    attempt = max(attempts)
+    return attempt, _read_json(_lease_file(queue_dir, task_id, attempt))
+
+
+def _read_tasks(queue_dir: str):
+    """Read all task definitions, in task ID order."""
+    tasks = []
+    for task_file in sorted(glob.glob(os.path.join(queue_dir, 'tasks', '*.json'))):
+        task = _read_json(task_file)
+        if task is not None:
+            tasks.append(task)
+    return tasks
+
+
+def _fail_task(queue_dir: str, task_id: str, attempts: int, error: str):
+    """Write the failure record of a task (the first record written wins)."""
+    record = {'id': task_id, 'attempts': attempts, 'error': error, 'failed': time.time()}
+    _create_json(os.path.join(queue_dir, 'failed', f'{task_id}.json'), record)
+
+
+def fail_blocked_tasks(queue_dir: str):
+    """Mark the tasks depending (directly or not) on a failed task as failed.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+
+    Returns:
+    --------
+    task_ids: list
+        IDs of the tasks marked as failed
+    """
+    tasks = _read_tasks(queue_dir)
+    failed_dir = os.path.join(queue_dir, 'failed')
+    done_dir = os.path.join(queue_dir, 'done')
+    failed = set(os.path.basename(path)[:-len('.json')] for path in glob.glob(os.path.join(failed_dir, '*.json')))
+    marked = []
+    changed = True
+    while changed:
+        changed = False
+        for task in tasks:
+            task_id = task['id']
+            if task_id in failed or os.path.isfile(os.path.join(done_dir, f'{task_id}.json')):
+                continue
+            failed_deps = [dep for dep in task['depends_on'] if dep in failed]
+            if failed_deps:
+                _fail_task(queue_dir, task_id, 0, f'dependencies failed: {failed_deps}')
+                failed.add(task_id)
+                marked.append(task_id)
+                changed = True
+    return marked
+
+
+def task_status(queue_dir: str):
+    """Get the status of every task in the queue.
+
+    Expired tasks without attempts left, and tasks depending on a failed task
+    (see fail_blocked_tasks), are marked as failed.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+
+    Returns:
+    --------
+    status: dict
+        maps task IDs to one of "done", "failed", "running", "expired" or "pending"
+    """
+    status = {}
+    now = time.time()
+    for task in _read_tasks(queue_dir):
+        task_id = task['id']
+        attempt, lease = _current_lease(queue_dir, task_id)
+        if lease is not None and lease['expires'] < now and attempt >= task['max_attempts']:
+            _fail_task(queue_dir, task_id, attempt, lease.get('error', "lease expired"))
+    fail_blocked_tasks(queue_dir)
+    for task_file in sorted(glob.glob(os.path.join(queue_dir, 'tasks', '*.json'))):
+        task_id = os.path.basename(task_file)[:-len('.json')]
+        if os.path.isfile(os.path.join(queue_dir, 'done', f'{task_id}.json')):
+            status[task_id] = "done"
+        elif os.path.isfile(os.path.join(queue_dir, 'failed', f'{task_id}.json')):
+            status[task_id] = "failed"
+        else:
+            _, lease = _current_lease(queue_dir, task_id)
+            if lease is None:
+                status[task_id] = "pending"
+            elif lease['expires'] < now:
+                status[task_id] = "expired"
+            else:
+                status[task_id] = "running"
+    return status
+
+
+def _lease_record(worker_id: str, attempt: int, lease_seconds: float):
+    return {'worker': worker_id,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'attempt': attempt,
+            'claimed': time.time(),
+            'expires': time.time() + lease_seconds}
+
+
+def _try_claim(queue_dir: str, task: dict, worker_id: str, lease_seconds: float):
+    """Try to take the lease of a task.
+
+    A task is claimed by exclusively creating the lease of its next attempt
+    (attempt 1 for a free task, k + 1 if the lease of attempt k expired), so
+    only one worker can win each attempt.
+
+    Returns:
+    --------
+    lease: dict
+        lease record if the task was claimed, otherwise None
+    """
+    task_id = task['id']
+    attempt, current = _current_lease(queue_dir, task_id)
+    if attempt > 0:
+        if current is None or current['expires'] >= time.time():
+            # running (or the lease is being written)
+            return None
+        if attempt >= task['max_attempts']:
+            _fail_task(queue_dir, task_id, attempt, current.get('error', "lease expired"))
+            return None
+    lease = _lease_record(worker_id, attempt + 1, lease_seconds)
+    if not _create_json(_lease_file(queue_dir, task_id, attempt + 1), lease):
+        return None
+    return lease
+
+
+def claim_task(queue_dir: str, worker_id: str, lease_seconds: float=300):
+    """Claim the next task whose dependencies are completed.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    worker_id: str
+        unique name of the claiming worker
+    lease_seconds: float
+        time after which the lease expires unless it is renewed
+
+    Returns:
+    --------
+    task: dict
+        claimed task definition (with its lease under the "lease" key),
+        or None if no task is ready
+    """
+    fail_blocked_tasks(queue_dir)
+    done_dir = os.path.join(queue_dir, 'done')
+    failed_dir = os.path.join(queue_dir, 'failed')
+    for task in _read_tasks(queue_dir):
+        task_id = task['id']
+        if (os.path.isfile(os.path.join(done_dir, f'{task_id}.json')) or
+                os.path.isfile(os.path.join(failed_dir, f'{task_id}.json'))):
+            continue
+        if not all(os.path.isfile(os.path.join(done_dir, f'{dep}.json')) for dep in task['depends_on']):
+            continue
+        lease = _try_claim(queue_dir, task, worker_id, lease_seconds)
+        if lease is not None:
+            task['lease'] = lease
+            return task
+    return None
+
+
+def renew_lease(queue_dir: str, task: dict, lease_seconds: float=300, error: str=None):
+    """Extend (or, with lease_seconds=0, release) the lease of a claimed task.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    task: dict
+        task returned by claim_task
+    lease_seconds: float
+        new lease duration, counted from now
+    error: str
+        optional error message recorded in the lease
+
+    Returns:
+    --------
+    renewed: bool
+        False if the lease has been taken over by another worker
+    """
+    lease = task['lease']
+    if not owns_lease(queue_dir, task):
+        return False
+    lease_file = _lease_file(queue_dir, task['id'], lease['attempt'])
+    lease['expires'] = time.time() + lease_seconds
+    if error is not None:
+        lease['error'] = error
+    _write_json(lease_file, lease)
+    return True
+
+
+def owns_lease(queue_dir: str, task: dict):
+    """Check that the lease of a claimed task is still the current attempt and held by its worker."""
+    lease = task['lease']
+    attempt, current = _current_lease(queue_dir, task['id'])
+    return (attempt == lease['attempt'] and current is not None and current['worker'] == lease['worker']
+            and current['claimed'] == lease['claimed'])
+
+
+def _resolve_stage(stage: str):
+    """Import the function referenced by a dotted stage path."""
+    module_name, _, func_name = stage.rpartition('.')
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def _substitute(value, results_dir: str):
+    if isinstance(value, str):
+        return value.replace("{results}", results_dir)
+    if isinstance(value, list):
+        return [_substitute(v, results_dir) for v in value]
+    if isinstance(value, dict):
+        return {k: _substitute(v, results_dir) for k, v in value.items()}
+    return value
+
+
+def publish_outputs(workdir: str, patterns: list, results_dir: str):
+    """Move task outputs from the task working directory to the results directory.
+
+    Files are first copied next to their destination and then renamed, so other
+    hosts never see partially written outputs.
+
+    Key arguments:
+    --------------
+    workdir: str
+        working directory the task was run in
+    patterns: list
+        file names or glob patterns relative to workdir
+    results_dir: str
+        shared results directory
+
+    Returns:
+    --------
+    published: dict
+        maps published file names to their size in bytes
+    """
+    published = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.join(workdir, pattern)))
+        if not matches:
+            raise FileNotFoundError(f'stage did not produce output {pattern}')
+        for path in matches:
+            name = os.path.relpath(path, workdir)
+            dest = os.path.join(results_dir, name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f'{dest}.{socket.gethostname()}.{os.getpid()}.tmp'
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, dest)
+            published[name] = os.path.getsize(dest)
+    return published
+
+
+def _run_stage(workdir: str, stage: str, args: list, kwargs: dict):
+    """Run a stage function in workdir (in a worker process, so the working directory is private)."""
+    os.chdir(workdir)
+    func = _resolve_stage(stage)
+    func(*args, **kwargs)
+
+
+def run_task(queue_dir: str, task: dict, lease_seconds: float=300):
+    """Run a claimed task and write its completion record.
+
+    The stage runs in a child process, in a private working directory under
+    scratch/, while a background thread keeps renewing the lease. On success
+    the declared outputs are published to results/ and a record is written to
+    done/, unless the lease was taken over by another worker in the meantime.
+    On failure the lease is released with the traceback, so another attempt
+    can be made (the error is logged by the "pyplinkqc.distributed" logger).
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    task: dict
+        task returned by claim_task
+    lease_seconds: float
+        lease duration, renewed every third of it while the stage runs
+
+    Returns:
+    --------
+    record: dict
+        completion record, or None if the stage failed or the lease was lost
+    """
+    results_dir = os.path.join(queue_dir, 'results')
+    workdir = os.path.join(queue_dir, 'scratch', f'{task["id"]}.{task["lease"]["attempt"]}')
+    os.makedirs(workdir, exist_ok=True)
+
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(lease_seconds / 3):
+            if not renew_lease(queue_dir, task, lease_seconds):
+                break
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    started = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            pool.submit(_run_stage, workdir, task['stage'], _substitute(task['args'], results_dir),
+                        _substitute(task['kwargs'], results_dir)).result()
+        if not owns_lease(queue_dir, task):
+            raise RuntimeError("lease was taken over by another worker")
+        published = publish_outputs(workdir, task['outputs'], results_dir)
+    except Exception as e:
+        stop.set()
+        heartbeat_thread.join()
+        error = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+        logger.warning('task %s failed on attempt %s: %r', task['id'], task['lease']['attempt'], e)
+        renew_lease(queue_dir, task, 0, error=error)
+        return None
+    stop.set()
+    heartbeat_thread.join()
+
+    record = {'id': task['id'],
+              'stage': task['stage'],
+              'worker': task['lease']['worker'],
+              'host': task['lease']['host'],
+              'attempt': task['lease']['attempt'],
+              'started': started,
+              'finished': time.time(),
+              'outputs': published}
+    if not owns_lease(queue_dir, task) or not _create_json(os.path.join(queue_dir, 'done', f'{task["id"]}.json'), record):
+        logger.warning('task %s attempt %s finished after its lease was taken over, result discarded',
+                       task['id'], task['lease']['attempt'])
+        return None
+    for attempt in _lease_attempts(queue_dir, task['id']):
+        try:
+            os.remove(_lease_file(queue_dir, task['id'], attempt))
+        except FileNotFoundError:
+            pass
+    shutil.rmtree(workdir, ignore_errors=True)
+    return record
+
+
+def run_worker(queue_dir: str, worker_id: str=None, lease_seconds: float=300,
+               poll_interval: float=5, max_tasks: int=None, idle_timeout: float=None):
+    """Claim and run tasks from the queue until it is drained.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    worker_id: str
+        unique name of this worker (default: <hostname>-<pid>)
+    lease_seconds: float
+        lease duration for claimed tasks
+    poll_interval: float
+        seconds to wait before polling again when no task is ready
+    max_tasks: int
+        stop after running this many tasks
+    idle_timeout: float
+        stop after waiting this long without finding a ready task
+
+    Returns:
+    --------
+    records: list
+        completion records of the tasks run successfully by this worker
+    """
+    queue_dir = init_queue(queue_dir)
+    if worker_id is None:
+        worker_id = f'{socket.gethostname()}-{os.getpid()}'
+    records = []
+    ran = 0
+    idle_since = time.time()
+    while max_tasks is None or ran < max_tasks:
+        task = claim_task(queue_dir, worker_id, lease_seconds)
+        if task is None:
+            status = task_status(queue_dir)
+            if all(s in ("done", "failed") for s in status.values()):
+                break
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+        record = run_task(queue_dir, task, lease_seconds)
+        if record is not None:
+            records.append(record)
+        ran += 1
+        idle_since = time.time()
+    return records
+
+
+def wait_for_tasks(queue_dir: str, task_ids: list=None, poll_interval: float=5,
+                   timeout: float=None):
+    """Block the coordinator until tasks are done or failed.
+
+    Key arguments:
+    --------------
+    queue_dir: str
+        task queue directory (see init_queue)
+    task_ids: list
+        tasks to wait for (default: all tasks in the queue)
+    poll_interval: float
+        seconds between polls of the queue
+    timeout: float
+        raise TimeoutError after waiting this long
+
+    Returns:
+    --------
+    status: dict
+        final status of the awaited tasks
+    """
+    start = time.time()
+    while True:
+        status = task_status(queue_dir)
+        if task_ids is not None:
+            status = {task_id: status.get(task_id, "pending") for task_id in task_ids}
+        if all(s in ("done", "failed") for s in status.values()):
+            return status
+        if timeout is not None and time.time() - start > timeout:
+            raise TimeoutError(f'tasks still running after {timeout} seconds: {status}')
+        time.sleep(poll_interval)
@@ -0,0 +1,182 @@
+import os
+import functools
+import numpy as np
+import pandas as pd
+from .plink_io import read_fam, read_bim
+
+
+def _as_str(ids):
+    """Convert IDs to strings, so IDs parsed as numbers in other files still match."""
+    return np.asarray(ids).astype(str)
+
+
+def _pair_keys(iids, fids):
+    """Join family and within-family IDs to "FID IID" keys."""
+    return np.char.add(np.char.add(_as_str(fids), " "), _as_str(iids))
+
+
+def _get_positions(index: pd.Index, keys: np.ndarray):
+    """Look up keys in an index that may hold repeats (the first occurrence wins)."""
+    if index.is_unique:
+        return index.get_indexer(keys)
+    first = ~index.duplicated(keep='first')
+    positions = index[first].get_indexer(keys)
+    return np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+
+
+class IDIndex:
+    """Cohort-level index mapping sample and variant IDs to int32 positions.
+
+    Sample (IID and FID/IID pair) and SNP IDs are stored in hashed pandas
+    Index objects, so translating a list of IDs to positions or to a boolean
+    mask is a single vectorized hash lookup. Positions follow the order of the
+    .fam and .bim files, i.e. the sample and variant order of the .bed file.
+    IDs may repeat (e.g. the same IID in two families, or "." variant IDs):
+    masks then select every match and positions give the first one.
+
+    Key arguments:
+    --------------
+    fids: list
+        family IDs, in .fam order
+    iids: list
+        within-family IDs, in .fam order
+    snps: list
+        variant IDs, in .bim order
+    """
+    def __init__(self, fids, iids, snps=None):
+        self.fids = _as_str(fids)
+        self.iids = pd.Index(_as_str(iids))
+        self.snps = pd.Index(_as_str(snps if snps is not None else []))
+        self._pairs = None
+
+    @classmethod
+    def from_bfile(cls, bfile: str, snps: bool=True):
+        """Build (or reuse) the index of a set of plink binary files.
+
+        Indexes are cached per file and modification time, so repeated calls
+        on an unchanged bfile do not re-read the .fam/.bim.
+
+        Key arguments:
+        --------------
+        bfile: str
+            prefix for plink binary files (.bed, .bim, .fam)
+        snps: bool
+            also index the variant IDs of the .bim file
+
+        Returns:
+        --------
+        IDIndex object
+        """
+        fam_file = os.path.abspath(bfile + ".fam")
+        bim_file = os.path.abspath(bfile + ".bim") if snps else ""
+        return _cached_index(fam_file, os.path.getmtime(fam_file), bim_file,
+                             os.path.getmtime(bim_file) if snps else 0)
+
+    @classmethod
+    def from_fam(cls, fam_file: str):
+        """Build the sample index of a .fam file (see from_bfile)."""
+        fam_file = os.path.abspath(fam_file)
+        return _cached_index(fam_file, os.path.getmtime(fam_file), "", 0)
+
+    @property
+    def n_samples(self):
+        return len(self.iids)
+
+    @property
+    def n_snps(self):
+        return len(self.snps)
+
+    @property
+    def pairs(self):
+        """Hashed index of "FID IID" keys (built on first use)."""
+        if self._pairs is None:
+            self._pairs = pd.Index(_pair_keys(self.iids.to_numpy(), self.fids))
+        return self._pairs
+
+    def sample_positions(self, iids, fids=None):
+        """Translate sample IDs to positions in the .fam file.
+
+        Key arguments:
+        --------------
+        iids: list
+            within-family IDs
+        fids: list
+            optional family IDs; if given, samples are matched on FID and IID
+            (pass them when the same IID may occur in several families)
+
+        Returns:
+        --------
+        positions: np.ndarray
+            int32 positions (of the first match for repeated IDs), -1 for IDs
+            that are not in the cohort
+        """
+        if fids is None:
+            return _get_positions(self.iids, _as_str(iids)).astype(np.int32)
+        return _get_positions(self.pairs, _pair_keys(iids, fids)).astype(np.int32)
+
+    def sample_mask(self, iids, fids=None):
+        """Translate sample IDs to a boolean mask over the samples of the cohort.
+
+        Key arguments:
+        --------------
+        iids: list
+            within-family IDs
+        fids: list
+            optional family IDs; if given, samples are matched on FID and IID
+
+        Returns:
+        --------
+        mask: np.ndarray
+            True for every cohort sample listed in iids
+        """
+        if fids is None:
+            return self.iids.isin(_as_str(iids))
+        return self.pairs.isin(_pair_keys(iids, fids))
+
+    def snp_positions(self, snps):
+        """Translate variant IDs to int32 positions in the .bim file (first match, -1 if absent)."""
+        return _get_positions(self.snps, _as_str(snps)).astype(np.int32)
+
+    def snp_mask(self, snps):
+        """Translate variant IDs to a boolean mask over the variants of the cohort."""
+        return self.snps.isin(_as_str(snps))
+
+    def sample_mask_from_file(self, ids_file: str):
+        """Translate an external sample ID file to a boolean mask in one pass.
+
+        Plink keep/remove files (whitespace-delimited FID and IID columns) are
+        matched on FID and IID; files with a single column of IDs, or
+        comma-separated lists written by utils.write_txt_file, are matched on IID.
+
+        Key arguments:
+        --------------
+        ids_file: str
+            path to the ID file
+
+        Returns:
+        --------
+        mask: np.ndarray
+            True for every cohort sample listed in the file
+        """
+        with open(ids_file, "r") as f:
+            text = f.read()
+        rows = [line.split() for line in text.splitlines() if line.strip()]
+        if rows and all(len(row) >= 2 for row in rows) and "," not in text:
+            fids = [row[0] for row in rows]
+            iids = [row[1] for row in rows]
+            return self.sample_mask(iids, fids)
+        ids = [i.strip() for i in text.replace("\n", ",").split(",") if i.strip()]
+        return self.sample_mask(ids)
+
+    def snp_mask_from_file(self, snps_file: str):
+        """Translate a file listing one variant ID per line (e.g. .prune.in) to a boolean mask."""
+        with open(snps_file, "r") as f:
+            snps = [line.split()[0] for line in f if line.strip()]
+        return self.snp_mask(snps)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_index(fam_file: str, fam_mtime: float, bim_file: str, bim_mtime: float):
+    fam = read_fam(fam_file)
+    snps = read_bim(bim_file)['snp'] if bim_file else None
+    return IDIndex(fam['fid'], fam['iid'], snps)
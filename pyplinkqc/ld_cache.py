@@ -0,0 +1,156 @@
+import os
+import hashlib
+import numpy as np
+from .plink_io import read_bim, count_lines, open_bed, decode_genotypes
+
+
+def bfile_fingerprint(bfile: str, sample_bytes: int=1 << 20):
+    """Fingerprint the genotypes of a set of plink binary files.
+
+    Only the .bed and .bim are used (sizes, modification times and the first
+    and last sample_bytes of each), so bfiles that share their genotypes and
+    only differ in the .fam phenotypes (e.g. from association.attach_pheno)
+    have the same fingerprint.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    sample_bytes: int
+        number of bytes read from the start and the end of each file
+
+    Returns:
+    --------
+    fingerprint: str
+        hex digest
+    """
+    digest = hashlib.sha1()
+    for ext in ['.bed', '.bim']:
+        path = bfile + ext
+        stat = os.stat(path)
+        digest.update(f'{stat.st_size} {stat.st_mtime_ns}'.encode())
+        with open(path, "rb") as f:
+            digest.update(f.read(sample_bytes))
+            if stat.st_size > sample_bytes:
+                f.seek(max(stat.st_size - sample_bytes, sample_bytes))
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class LDCache:
+    """r2 between variants of a bfile, computed in tiles and cached on disk.
+
+    The variants of each chromosome (contiguous in the .bim, as written by
+    plink) are split into tiles of tile_size consecutive variants. The r2 matrix between two tiles is computed
+    once from the .bed (genotype correlation, missing genotypes mean-imputed)
+    and stored as float16 under
+    <cache_dir>/<fingerprint>/n<n_samples>_t<tile_size>/<chrom>/<tile>_<tile>.npy,
+    so later runs on the same genotypes (e.g. other phenotypes) reuse it. The
+    tile size and the number of samples are part of the key, as tiles computed
+    for other variant ranges or samples must not be reused.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    cache_dir: str
+        cache directory (default: .ld_cache next to the bfile)
+    tile_size: int
+        number of variants per tile
+    """
+    def __init__(self, bfile: str, cache_dir: str=None, tile_size: int=1000):
+        self.bfile = bfile
+        self.tile_size = tile_size
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(bfile) or ".", ".ld_cache")
+        self.fingerprint = bfile_fingerprint(bfile)
+        self.bim = read_bim(bfile + ".bim")
+        self.n_samples = count_lines(bfile + ".fam")
+        self.cache_dir = os.path.join(cache_dir, self.fingerprint, f'n{self.n_samples}_t{tile_size}')
+        self.bed = open_bed(bfile, self.n_samples, len(self.bim))
+        chroms = self.bim['chrom'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, chroms[1:] != chroms[:-1]])
+        self.chrom_start = dict(zip(chroms[starts], starts))
+        self.chrom_stop = dict(zip(chroms[starts], np.r_[starts[1:], len(chroms)]))
+        self.hits = 0
+        self.misses = 0
+        self._tiles = {}
+
+    def _tile_range(self, chrom: str, tile: int):
+        start = self.chrom_start[chrom] + tile * self.tile_size
+        return start, min(start + self.tile_size, self.chrom_stop[chrom])
+
+    def _standardized(self, chrom: str, tile: int):
+        """Standardized (mean-imputed) genotypes of a tile, kept in memory for the last tiles."""
+        key = (chrom, tile)
+        if key not in self._tiles:
+            start, stop = self._tile_range(chrom, tile)
+            G = decode_genotypes(self.bed[start:stop], self.n_samples).astype(float)
+            missing = G < 0
+            called = (~missing).sum(axis=1)
+            G[missing] = 0
+            means = np.divide(G.sum(axis=1), called, out=np.zeros(len(G)), where=called > 0)
+            G -= means[:, None]
+            G[missing] = 0
+            norms = np.sqrt((G ** 2).sum(axis=1))
+            G = np.divide(G, norms[:, None], out=np.zeros_like(G), where=norms[:, None] > 0)
+            if len(self._tiles) >= 8:
+                self._tiles.pop(next(iter(self._tiles)))
+            self._tiles[key] = G
+        return self._tiles[key]
+
+    def block(self, chrom: str, tile_a: int, tile_b: int):
+        """Get the r2 matrix between two tiles of a chromosome (from the cache if present).
+
+        Key arguments:
+        --------------
+        chrom: str
+            chromosome code
+        tile_a, tile_b: int
+            tile numbers within the chromosome
+
+        Returns:
+        --------
+        r2: np.ndarray
+            float16 array of shape (variants in tile_a, variants in tile_b)
+        """
+        if tile_a > tile_b:
+            return self.block(chrom, tile_b, tile_a).T
+        path = os.path.join(self.cache_dir, str(chrom), f'{tile_a}_{tile_b}.npy')
+        if os.path.exists(path):
+            self.hits += 1
+            return np.load(path, mmap_mode='r')
+        self.misses += 1
+        r = self._standardized(chrom, tile_a) @ self._standardized(chrom, tile_b).T
+        r2 = (r ** 2).astype(np.float16)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp.npy'
+        np.save(tmp, r2)
+        os.replace(tmp, path)
+        return r2
+
+    def r2(self, index: int, others: np.ndarray):
+        """Get the r2 between one variant and other variants of the same chromosome.
+
+        Key arguments:
+        --------------
+        index: int
+            position of the variant in the .bim file
+        others: np.ndarray
+            positions of the other variants in the .bim file
+
+        Returns:
+        --------
+        r2: np.ndarray
+            float array aligned to others
+        """
+        others = np.asarray(others, dtype=np.int64)
+        chrom = self.bim['chrom'].iat[index]
+        offset = self.chrom_start[chrom]
+        tile_a, row = divmod(index - offset, self.tile_size)
+        tiles, columns = np.divmod(others - offset, self.tile_size)
+        r2 = np.empty(len(others))
+        for tile in np.unique(tiles):
+            sel = tiles == tile
+            r2[sel] = self.block(chrom, tile_a, tile)[row, columns[sel]]
+        return r2
@@ -0,0 +1,156 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from .id_index import IDIndex
+from .plink_io import (BED_MAGIC, open_bed, read_fam, read_bim, write_fam, bytes_per_variant,
+                       iter_blocks, pack_codes, unpack_codes)
+
+# Streaming merges of plink binary files, without plink --bmerge/--merge-list.
+# Files with the same samples (e.g. per-chromosome files) are merged along the
+# variant axis by appending their .bed payloads byte for byte. Files with the
+# same variants (e.g. batches of samples) are merged along the sample axis by
+# joining the packed rows of each variant block. The IDs are checked with the
+# ID index before any genotypes are written, and memory use is bounded by the
+# block size, not the size of the data.
+
+# homozygous A1 (00) <-> homozygous A2 (11), for inputs with swapped alleles
+_FLIP_CODES = np.array([3, 1, 2, 0], dtype=np.uint8)
+
+
+def concat_variants(bfiles: list, outfile: str):
+    """Concatenate the .bed payloads and .bim files of bfiles with the same samples.
+
+    No IDs are checked (see merge_variants); the .fam is not written.
+
+    Key arguments:
+    --------------
+    bfiles: list
+        prefixes of the input plink binary files, in output variant order
+    outfile: str
+        prefix for the output .bed and .bim files
+    """
+    with open(outfile + ".bed", "wb") as bed, open(outfile + ".bim", "wb") as bim:
+        bed.write(BED_MAGIC)
+        for bfile in bfiles:
+            with open(bfile + ".bed", "rb") as f:
+                f.seek(len(BED_MAGIC))
+                shutil.copyfileobj(f, bed, 1 << 24)
+            with open(bfile + ".bim", "rb") as f:
+                shutil.copyfileobj(f, bim, 1 << 24)
+
+
+def merge_variants(bfiles: list, outfile: str, check_duplicates: bool=True):
+    """Merge plink binary files with identical samples along the variant axis.
+
+    Every input must have the same samples (FID and IID) in the same .fam
+    order. The .bed payloads are then appended byte for byte.
+
+    Key arguments:
+    --------------
+    bfiles: list
+        prefixes of the input plink binary files (e.g. one per chromosome), in
+        output variant order
+    outfile: str
+        prefix for the output plink binary files
+    check_duplicates: bool
+        raise a ValueError if a variant ID occurs in more than one input
+
+    Returns:
+    --------
+    n_snps: int
+        number of variants of the merged files
+    """
+    first = IDIndex.from_bfile(bfiles[0], snps=False)
+    snps = []
+    n_snps = 0
+    for bfile in bfiles:
+        index = IDIndex.from_bfile(bfile, snps=check_duplicates)
+        if not index.pairs.equals(first.pairs):
+            raise ValueError(f'{bfile}.fam does not have the samples of {bfiles[0]}.fam (in the same order)')
+        # checks the .bed size against the .fam and .bim
+        n_snps += open_bed(bfile, index.n_samples).shape[0]
+        if check_duplicates:
+            snps.append(index.snps)
+    if check_duplicates:
+        all_snps = pd.Index(np.concatenate([index.to_numpy() for index in snps]))
+        if all_snps.has_duplicates:
+            duplicated = all_snps[all_snps.duplicated()].unique()
+            raise ValueError(f'{len(duplicated)} variant IDs occur more than once, e.g. {list(duplicated[:5])}')
+    concat_variants(bfiles, outfile)
+    if os.path.abspath(bfiles[0] + ".fam") != os.path.abspath(outfile + ".fam"):
+        shutil.copyfile(bfiles[0] + ".fam", outfile + ".fam")
+    print(f'{len(bfiles)} files merged into {outfile}')
+    return n_snps
+
+
+def merge_samples(bfiles: list, outfile: str, block_size: int=None):
+    """Merge plink binary files with identical variants along the sample axis.
+
+    Every input must have the same variants (ID, chromosome and position) in
+    the same .bim order, with the same alleles (inputs with swapped A1/A2 are
+    recoded). Sample IDs must be unique across the inputs. The packed rows of
+    the inputs are joined variant block by variant block: byte for byte when
+    every input but the last has a multiple of 4 samples, and by re-packing the
+    2-bit codes otherwise.
+
+    Key arguments:
+    --------------
+    bfiles: list
+        prefixes of the input plink binary files (e.g. one per batch), in
+        output sample order
+    outfile: str
+        prefix for the output plink binary files
+    block_size: int
+        number of variants per block (default: about 16 MB of packed rows)
+
+    Returns:
+    --------
+    n_samples: int
+        number of samples of the merged files
+    """
+    bim = read_bim(bfiles[0] + ".bim")
+    fams, beds, flips = [], [], []
+    for bfile in bfiles:
+        other = read_bim(bfile + ".bim") if bfile != bfiles[0] else bim
+        if not (other['snp'].equals(bim['snp']) and other['chrom'].equals(bim['chrom'])
+                and other['pos'].equals(bim['pos'])):
+            raise ValueError(f'{bfile}.bim does not have the variants of {bfiles[0]}.bim (in the same order)')
+        same = (other['a1'] == bim['a1']) & (other['a2'] == bim['a2'])
+        swapped = (other['a1'] == bim['a2']) & (other['a2'] == bim['a1']) & ~same
+        if not (same | swapped).all():
+            raise ValueError(f'{bfile}.bim has {(~(same | swapped)).sum()} variants with other alleles '
+                             f'than {bfiles[0]}.bim')
+        flips.append(swapped.to_numpy() if swapped.any() else None)
+        fam = read_fam(bfile + ".fam")
+        fams.append(fam)
+        beds.append(open_bed(bfile, len(fam), len(bim)))
+    fam = pd.concat(fams, ignore_index=True)
+    index = IDIndex(fam['fid'], fam['iid'])
+    if index.pairs.has_duplicates:
+        duplicated = index.pairs[index.pairs.duplicated()].unique()
+        raise ValueError(f'{len(duplicated)} samples occur in more than one input, e.g. {list(duplicated[:5])}')
+
+    n_samples = [len(f) for f in fams]
+    aligned = all(n % 4 == 0 for n in n_samples[:-1]) and all(flip is None for flip in flips)
+    if block_size is None:
+        block_size = max(1, (1 << 24) // bytes_per_variant(sum(n_samples)))
+    with open(outfile + ".bed", "wb") as out:
+        out.write(BED_MAGIC)
+        for start, stop in iter_blocks(len(bim), block_size):
+            if aligned:
+                block = np.concatenate([bed[start:stop] for bed in beds], axis=1)
+            else:
+                codes = []
+                for bed, n, flip in zip(beds, n_samples, flips):
+                    part = unpack_codes(bed[start:stop], n)
+                    if flip is not None:
+                        rows = flip[start:stop]
+                        part[rows] = _FLIP_CODES[part[rows]]
+                    codes.append(part)
+                block = pack_codes(np.concatenate(codes, axis=1))
+            out.write(np.ascontiguousarray(block).tobytes())
+    shutil.copyfile(bfiles[0] + ".bim", outfile + ".bim")
+    write_fam(fam, outfile + ".fam")
+    print(f'{len(bfiles)} files merged into {outfile}')
+    return len(fam)
@@ -0,0 +1,560 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+from .id_index import IDIndex
+from .plink_io import (read_fam, read_bim, open_bed, open_dosage, bytes_per_variant, iter_blocks,
+                       decode_genotypes)
+from .utils import write_table, TableWriter
+
+# Per-byte lookup tables (4 samples per byte): number of A1 alleles and of
+# non-missing genotypes. Samples outside a mask are set to the missing code
+# before the lookup, so the same tables count any subset of samples.
+_CODES = (np.arange(256)[:, None] >> (2 * np.arange(4))) & 3
+A1_COUNT_LUT = np.select([_CODES == 0, _CODES == 2], [2, 1], 0).sum(axis=1).astype(np.int16)
+CALLED_COUNT_LUT = (_CODES != 1).sum(axis=1).astype(np.int16)
+_ALL_MISSING = np.uint8(0x55)
+
+
+def pack_sample_mask(mask: np.ndarray):
+    """Pack a boolean sample mask into .bed byte masks (bits 11 for selected samples).
+
+    Key arguments:
+    --------------
+    mask: np.ndarray
+        boolean mask over the samples of the .fam file
+
+    Returns:
+    --------
+    byte_mask: np.ndarray
+        uint8 array of length bytes_per_variant(len(mask))
+    """
+    n_samples = len(mask)
+    codes = np.zeros(bytes_per_variant(n_samples) * 4, dtype=np.uint8)
+    codes[:n_samples][np.asarray(mask, dtype=bool)] = 3
+    codes = codes.reshape(-1, 4)
+    return codes[:, 0] | (codes[:, 1] << 2) | (codes[:, 2] << 4) | (codes[:, 3] << 6)
+
+
+def masked_allele_counts(block: np.ndarray, byte_mask: np.ndarray):
+    """Count A1 alleles and called genotypes of a subset of samples.
+
+    Key arguments:
+    --------------
+    block: np.ndarray
+        packed .bed rows, uint8 array of shape (n_variants, n_bytes)
+    byte_mask: np.ndarray
+        packed sample mask (see pack_sample_mask)
+
+    Returns:
+    --------
+    a1: np.ndarray
+        number of A1 alleles per variant
+    called: np.ndarray
+        number of called (non-missing) genotypes per variant
+    """
+    masked = (block & byte_mask) | (_ALL_MISSING & ~byte_mask)
+    a1 = A1_COUNT_LUT[masked].sum(axis=1, dtype=np.int64)
+    called = CALLED_COUNT_LUT[masked].sum(axis=1, dtype=np.int64)
+    return a1, called
+
+
+def _block_stats(bed_file: str, n_samples: int, n_snps: int, start: int, stop: int,
+                 byte_masks: list):
+    """Allelic test results of one variant block for every (case, control) mask pair."""
+    bed = open_bed(bed_file[:-len(".bed")], n_samples, n_snps)
+    block = np.asarray(bed[start:stop])
+    results = []
+    for case_mask, control_mask in byte_masks:
+        results.append(allelic_chisq(*masked_allele_counts(block, case_mask),
+                                     *masked_allele_counts(block, control_mask)))
+    return results
+
+
+def _ordered_map(pool, fn, args: list, window: int):
+    """Like pool.map, but with at most window tasks in flight, so finished results don't pile up."""
+    from collections import deque
+    pending = deque()
+    for a in args:
+        pending.append(pool.submit(fn, *a))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def load_phenotypes(bfile: str, phenofile: str=None, binary: bool=True):
+    """Load phenotypes aligned to the samples of a bfile.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    phenofile: str
+        optional phenotype file with a "FID IID <names...>" header
+        (see utils.generate_multi_phenofile); by default the 6th column of the
+        .fam file is used
+    binary: bool
+        case/control phenotypes (anything but 1 and 2 is missing); otherwise
+        quantitative phenotypes (-9 is missing)
+
+    Returns:
+    --------
+    names: list
+        phenotype names
+    phenos: np.ndarray
+        float array of shape (n_phenotypes, n_samples), 2=case, 1=control for
+        binary phenotypes, NaN if missing
+    """
+    if phenofile is None:
+        fam = read_fam(bfile + ".fam")
+        values = pd.to_numeric(fam['pheno'], errors='coerce').to_numpy(dtype=float, copy=True)
+        return ['PHENO'], _set_missing(values[None, :], binary)
+    index = IDIndex.from_bfile(bfile, snps=False)
+    table = pd.read_csv(phenofile, sep=r'\s+', dtype={'FID': str, 'IID': str})
+    positions = index.sample_positions(table['IID'], table['FID'])
+    found = positions >= 0
+    names = list(table.columns[2:])
+    phenos = np.full((len(names), index.n_samples), np.nan)
+    for i, name in enumerate(names):
+        values = pd.to_numeric(table[name], errors='coerce').to_numpy(dtype=float)
+        phenos[i, positions[found]] = values[found]
+    return names, _set_missing(phenos, binary)
+
+
+def _set_missing(phenos: np.ndarray, binary: bool):
+    if binary:
+        phenos[~np.isin(phenos, [1, 2])] = np.nan
+    else:
+        phenos[phenos == -9] = np.nan
+    return phenos
+
+
+def allelic_chisq(case_a1, case_called, control_a1, control_called):
+    """1 df allelic chi-squared test from allele counts (vectorized).
+
+    Key arguments:
+    --------------
+    case_a1, case_called, control_a1, control_called: np.ndarray
+        A1 allele and called genotype counts in cases and controls
+
+    Returns:
+    --------
+    results: dict
+        F_A, F_U (A1 frequency in cases/controls), CHISQ, P and OR arrays
+    """
+    a = case_a1.astype(float)
+    b = 2.0 * case_called - a
+    c = control_a1.astype(float)
+    d = 2.0 * control_called - c
+    n = a + b + c + d
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chisq = n * (a * d - b * c) ** 2 / ((a + b) * (c + d) * (a + c) * (b + d))
+        return {'F_A': a / (a + b),
+                'F_U': c / (c + d),
+                'CHISQ': chisq,
+                'P': stats.chi2.sf(chisq, 1),
+                'OR': (a * d) / (b * c)}
+
+
+def adjust_pvalues(pvalues: np.ndarray, chisq: np.ndarray=None):
+    """Multiple-testing adjusted p-values, as reported by plink --adjust.
+
+    Key arguments:
+    --------------
+    pvalues: np.ndarray
+        unadjusted p-values (NaN values are ignored)
+    chisq: np.ndarray
+        optional 1 df test statistics, used for genomic-control (GC) adjustment
+
+    Returns:
+    --------
+    adjusted: pd.DataFrame
+        UNADJ, GC, BONF, HOLM, SIDAK_SS, SIDAK_SD, FDR_BH and FDR_BY columns,
+        aligned to pvalues
+    """
+    p = np.asarray(pvalues, dtype=float)
+    valid = ~np.isnan(p)
+    m = int(valid.sum())
+    adjusted = pd.DataFrame({'UNADJ': p})
+    order = np.argsort(np.where(valid, p, np.inf), kind='stable')[:m]
+    sorted_p = p[order]
+    ranks = np.arange(1, m + 1)
+
+    def put(values):
+        out = np.full(len(p), np.nan)
+        out[order] = values
+        return out
+
+    if chisq is not None:
+        chisq = np.asarray(chisq, dtype=float)
+        lambda_gc = max(np.nanmedian(chisq) / stats.chi2.ppf(0.5, 1), 1.0) if m else 1.0
+        adjusted['GC'] = stats.chi2.sf(chisq / lambda_gc, 1)
+    adjusted['BONF'] = np.minimum(p * m, 1)
+    adjusted['HOLM'] = put(np.minimum(np.maximum.accumulate(sorted_p * (m - ranks + 1)), 1))
+    adjusted['SIDAK_SS'] = 1 - (1 - p) ** m
+    adjusted['SIDAK_SD'] = put(np.maximum.accumulate(1 - (1 - sorted_p) ** (m - ranks + 1)))
+    bh = np.minimum.accumulate((sorted_p * m / ranks)[::-1])[::-1]
+    adjusted['FDR_BH'] = put(np.minimum(bh, 1))
+    c_m = np.sum(1.0 / ranks) if m else 1.0
+    adjusted['FDR_BY'] = put(np.minimum(bh * c_m, 1))
+    return adjusted
+
+
+def allelic_assoc(bfile: str, outfile: str, phenofile: str=None, adjust: bool=False,
+                  block_size: int=None, processes: int=1):
+    """In-process 1 df chi-squared allelic association test (equivalent to plink --assoc).
+
+    Variant blocks are read from the memory-mapped .bed and case/control allele
+    counts are computed with per-byte lookup tables, for all phenotypes from
+    the same decoded block. Blocks are tested by a process pool and the rows of
+    every block are appended to the outputs as soon as they arrive, so memory
+    does not grow with the number of variants (with adjust, the P and CHISQ
+    values are kept to compute the adjusted p-values). Results are written per
+    phenotype to <outfile>.assoc (phenotype from the .fam) or
+    <outfile>.<phenotype>.assoc, as parquet if pyarrow is installed and csv
+    otherwise (see utils.TableWriter); with adjust, adjusted p-values go to
+    <...>.assoc.adjusted.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        prefix for the output files
+    phenofile: str
+        optional multi-column phenotype file (see load_phenotypes)
+    adjust: bool
+        also write multiple-testing adjusted p-values (see adjust_pvalues)
+    block_size: int
+        number of variants per block (default: about 16 MB of genotypes)
+    processes: int
+        number of worker processes
+
+    Returns:
+    --------
+    results: dict
+        maps phenotype names to the paths of their result tables
+    """
+    bim = read_bim(bfile + ".bim")
+    names, phenos = load_phenotypes(bfile, phenofile)
+    n_samples = phenos.shape[1]
+    n_snps = len(bim)
+    byte_masks = [(pack_sample_mask(pheno == 2), pack_sample_mask(pheno == 1)) for pheno in phenos]
+    if block_size is None:
+        block_size = max(1, (1 << 24) // bytes_per_variant(n_samples))
+    blocks = list(iter_blocks(n_snps, block_size))
+    bed_file = bfile + ".bed"
+    args = [(bed_file, n_samples, n_snps, start, stop, byte_masks) for start, stop in blocks]
+    prefixes = [outfile if phenofile is None else f'{outfile}.{name}' for name in names]
+    writers = [TableWriter(prefix + ".assoc") for prefix in prefixes]
+    if adjust:
+        p_values = np.empty((len(names), n_snps))
+        chisq = np.empty((len(names), n_snps))
+
+    pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    try:
+        if pool is None:
+            block_results = (_block_stats(*a) for a in args)
+        else:
+            block_results = _ordered_map(pool, _block_stats, args, 2 * processes)
+        for (start, stop), results in zip(blocks, block_results):
+            rows = bim.iloc[start:stop]
+            for i, result in enumerate(results):
+                writers[i].write(pd.DataFrame({'CHR': rows['chrom'], 'SNP': rows['snp'],
+                                               'BP': rows['pos'], 'A1': rows['a1'],
+                                               'F_A': result['F_A'], 'F_U': result['F_U'],
+                                               'A2': rows['a2'], 'CHISQ': result['CHISQ'],
+                                               'P': result['P'], 'OR': result['OR']}))
+                if adjust:
+                    p_values[i, start:stop] = result['P']
+                    chisq[i, start:stop] = result['CHISQ']
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        for writer in writers:
+            writer.close()
+
+    if adjust:
+        for i, prefix in enumerate(prefixes):
+            adjusted = adjust_pvalues(p_values[i], chisq[i])
+            adjusted.insert(0, 'SNP', bim['snp'].to_numpy())
+            adjusted.insert(0, 'CHR', bim['chrom'].to_numpy())
+            write_table(adjusted.sort_values('UNADJ', kind='stable'), prefix + ".assoc.adjusted")
+    return {name: writer.path for name, writer in zip(names, writers)}
+
+
+def load_covariates(bfile: str, covfile: str):
+    """Load a plink covariate file aligned to the samples of a bfile.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    covfile: str
+        whitespace-delimited file with FID, IID and one column per covariate,
+        optionally with a "FID IID <names...>" header; -9 is missing
+
+    Returns:
+    --------
+    names: list
+        covariate names
+    covs: np.ndarray
+        float array of shape (n_samples, n_covariates), NaN if missing (or if
+        the sample is not in the covariate file)
+    """
+    index = IDIndex.from_bfile(bfile, snps=False)
+    table = pd.read_csv(covfile, sep=r'\s+', header=None, dtype=str)
+    if list(table.iloc[0, :2]) == ['FID', 'IID']:
+        names = list(table.iloc[0, 2:])
+        table = table.iloc[1:]
+    else:
+        names = [f'COV{i}' for i in range(1, table.shape[1] - 1)]
+    positions = index.sample_positions(table[1], table[0])
+    found = positions >= 0
+    values = table.iloc[:, 2:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, copy=True)
+    values[values == -9] = np.nan
+    covs = np.full((index.n_samples, len(names)), np.nan)
+    covs[positions[found]] = values[found]
+    return names, covs
+
+
+def _fit_logistic(X: np.ndarray, y: np.ndarray, beta: np.ndarray=None, max_iter: int=25,
+                  tol: float=1e-8):
+    """Fit logistic regressions by IRLS, batched over the leading axis.
+
+    Key arguments:
+    --------------
+    X: np.ndarray
+        design matrices of shape (n_models, n_samples, n_parameters)
+    y: np.ndarray
+        0/1 outcome of length n_samples
+    beta: np.ndarray
+        optional starting values of shape (n_models, n_parameters)
+
+    Returns:
+    --------
+    beta: np.ndarray
+        coefficients of shape (n_models, n_parameters)
+    cov: np.ndarray
+        covariance matrices of the coefficients, shape (n_models, n_parameters, n_parameters)
+    """
+    beta = np.zeros(X.shape[::2]) if beta is None else beta.copy()
+    for _ in range(max_iter):
+        mu = 1 / (1 + np.exp(-np.einsum('mnp,mp->mn', X, beta)))
+        w = mu * (1 - mu)
+        info = np.einsum('mnp,mn,mnq->mpq', X, w, X)
+        step = np.linalg.solve(info, np.einsum('mnp,mn->mp', X, y - mu)[..., None])[..., 0]
+        beta += step
+        if np.abs(step).max() < tol:
+            break
+    mu = 1 / (1 + np.exp(-np.einsum('mnp,mp->mn', X, beta)))
+    info = np.einsum('mnp,mn,mnq->mpq', X, mu * (1 - mu), X)
+    return beta, np.linalg.inv(info)
+
+
+def _regression_model(type: str, pheno: np.ndarray, covs: np.ndarray, gate: float):
+    """Precompute the covariate projection of one phenotype (done once per run)."""
+    kept = np.flatnonzero(~np.isnan(pheno) & ~np.isnan(covs).any(axis=1))
+    C = np.column_stack([np.ones(len(kept)), covs[kept]])
+    y = pheno[kept]
+    model = {'type': type, 'kept': kept, 'df': len(kept) - C.shape[1] - 1}
+    if type == "linear":
+        Q, _ = np.linalg.qr(C)
+        y_r = y - Q @ (Q.T @ y)
+        model.update(Q=Q, y_r=y_r, yy=y_r @ y_r)
+    else:
+        y = (y == 2).astype(float)
+        beta0, _ = _fit_logistic(C[None], y)
+        mu = 1 / (1 + np.exp(-C @ beta0[0]))
+        sqrt_w = np.sqrt(mu * (1 - mu))
+        Q, _ = np.linalg.qr(C * sqrt_w[:, None])
+        model.update(C=C, y=y, beta0=beta0[0], resid=y - mu, sqrt_w=sqrt_w, Q=Q, gate=gate)
+    return model
+
+
+_REGRESSION = {}
+
+
+def _init_regression(bed_file: str, n_samples: int, n_snps: int, models: list):
+    """Set up a worker: the covariate projections are sent once per process.
+
+    bed_file is a .bed file, or a .dosage file (see plink_io.open_dosage)
+    whose dosages are tested instead of hard-called genotypes.
+    """
+    _REGRESSION.clear()
+    if bed_file.endswith(".dosage"):
+        _REGRESSION['dosage'] = open_dosage(bed_file[:-len(".dosage")], n_samples, n_snps)
+    else:
+        _REGRESSION['bed'] = open_bed(bed_file[:-len(".bed")], n_samples, n_snps)
+    _REGRESSION.update(n_samples=n_samples, models=models)
+
+
+def regression_stats(model: dict, G: np.ndarray):
+    """Test predictors against the phenotype of a regression model.
+
+    Key arguments:
+    --------------
+    model: dict
+        phenotype model with the precomputed covariate projection
+    G: np.ndarray
+        predictors (e.g. genotypes or burden scores) of the model samples,
+        float array of shape (n_predictors, n_samples), without missing values
+
+    Returns:
+    --------
+    results: dict
+        BETA, SE, STAT and P arrays (one value per predictor)
+    """
+    Q = model['Q']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if model['type'] == "linear":
+            G_r = G - (G @ Q) @ Q.T
+            gg = np.einsum('vn,vn->v', G_r, G_r)
+            beta = G_r @ model['y_r'] / gg
+            se = np.sqrt((model['yy'] - beta ** 2 * gg) / model['df'] / gg)
+            stat = beta / se
+            p = 2 * stats.t.sf(np.abs(stat), model['df'])
+        else:
+            # score test against the null (covariates only) model
+            G_w = G * model['sqrt_w']
+            G_wr = G_w - (G_w @ Q) @ Q.T
+            info = np.einsum('vn,vn->v', G_wr, G_wr)
+            score = G @ model['resid']
+            beta = score / info
+            se = 1 / np.sqrt(info)
+            stat = score * se
+            p = stats.chi2.sf(stat ** 2, 1)
+            # IRLS refinement (Wald test) only for predictors passing the gate
+            refine = np.flatnonzero(p < model['gate'])
+            if len(refine):
+                C = model['C']
+                X = np.concatenate([np.broadcast_to(C, (len(refine),) + C.shape),
+                                    G[refine][:, :, None]], axis=2)
+                start_beta = np.column_stack([np.tile(model['beta0'], (len(refine), 1)), beta[refine]])
+                fit, cov = _fit_logistic(X, model['y'], start_beta)
+                beta[refine] = fit[:, -1]
+                se[refine] = np.sqrt(cov[:, -1, -1])
+                stat[refine] = beta[refine] / se[refine]
+                p[refine] = stats.chi2.sf(stat[refine] ** 2, 1)
+    return {'BETA': beta, 'SE': se, 'STAT': stat, 'P': p}
+
+
+def impute_missing(genotypes: np.ndarray):
+    """Mean-impute missing (-1) genotypes per variant.
+
+    Key arguments:
+    --------------
+    genotypes: np.ndarray
+        array of shape (n_variants, n_samples) with 0, 1, 2, or -1 if missing
+
+    Returns:
+    --------
+    G: np.ndarray
+        float array with missing genotypes replaced by the variant mean
+    called: np.ndarray
+        number of non-missing genotypes per variant
+    """
+    G = genotypes.astype(float)
+    missing = G < 0
+    called = (~missing).sum(axis=1)
+    G[missing] = 0
+    means = np.divide(G.sum(axis=1), called, out=np.zeros(len(G)), where=called > 0)
+    G[missing] = np.broadcast_to(means[:, None], G.shape)[missing]
+    return G, called
+
+
+def _regression_block(start: int, stop: int):
+    """Regression results of one variant block for every phenotype model."""
+    if 'dosage' in _REGRESSION:
+        genotypes = np.asarray(_REGRESSION['dosage'][start:stop])
+    else:
+        genotypes = decode_genotypes(_REGRESSION['bed'][start:stop], _REGRESSION['n_samples'])
+    results = []
+    for model in _REGRESSION['models']:
+        # missing genotypes are mean-imputed, so the covariate projection is shared by all variants
+        G, nmiss = impute_missing(genotypes[:, model['kept']])
+        results.append({'NMISS': nmiss, **regression_stats(model, G)})
+    return results
+
+
+def regression_assoc(bfile: str, outfile: str, type: str="linear", cov: str=None,
+                     phenofile: str=None, gate: float=1e-3, block_size: int=None,
+                     processes: int=1, dosage: bool=False):
+    """In-process covariate-adjusted association tests (equivalent to plink --linear/--logistic).
+
+    The covariates are projected out once per phenotype (QR decomposition), so
+    each variant only costs a few vectorized products. Linear models are solved
+    exactly on the residualized genotypes and phenotype. Logistic models use a
+    score test against the covariate-only model, and a full IRLS fit (Wald
+    test) only for variants with a score p-value below gate. Missing genotypes
+    are mean-imputed. Variant blocks are read from the memory-mapped .bed by a
+    process pool. Results are written per phenotype to <outfile>.assoc.linear
+    (or .assoc.logistic; <outfile>.<phenotype>.assoc.* with phenofile).
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        prefix for the output files
+    type: str
+        "linear" or "log" (logistic regression)
+    cov: str
+        optional covariate file (see load_covariates)
+    phenofile: str
+        optional multi-column phenotype file (see load_phenotypes)
+    gate: float
+        score test p-value below which logistic models are refined by IRLS
+    block_size: int
+        number of variants per block (default: about 32 MB of decoded genotypes)
+    processes: int
+        number of worker processes
+    dosage: bool
+        test the dosages of <bfile>.dosage (e.g. written by bgen.bgen_qc)
+        instead of the genotypes of the .bed
+
+    Returns:
+    --------
+    results: dict
+        maps phenotype names to result DataFrames
+    """
+    types = {'linear': 'linear', 'log': 'logistic'}
+    if type not in types:
+        raise ValueError(f'{type} not a valid choice, please choose from {list(types)}')
+    bim = read_bim(bfile + ".bim")
+    names, phenos = load_phenotypes(bfile, phenofile, binary=type == "log")
+    n_samples = phenos.shape[1]
+    n_snps = len(bim)
+    covs = np.empty((n_samples, 0)) if cov is None else load_covariates(bfile, cov)[1]
+    models = [_regression_model(type, pheno, covs, gate) for pheno in phenos]
+    if block_size is None:
+        block_size = max(1, (1 << 22) // n_samples)
+    blocks = iter_blocks(n_snps, block_size)
+    init_args = (bfile + (".dosage" if dosage else ".bed"), n_samples, n_snps, models)
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_regression,
+                                 initargs=init_args) as pool:
+            block_results = list(pool.map(_regression_block, *zip(*blocks)))
+    else:
+        _init_regression(*init_args)
+        block_results = [_regression_block(start, stop) for start, stop in blocks]
+
+    tables = {}
+    for i, name in enumerate(names):
+        columns = {key: np.concatenate([block[i][key] for block in block_results])
+                   if block_results else np.array([])
+                   for key in ['NMISS', 'BETA', 'SE', 'STAT', 'P']}
+        table = pd.DataFrame({'CHR': bim['chrom'], 'SNP': bim['snp'], 'BP': bim['pos'],
+                              'A1': bim['a1'], 'TEST': 'ADD', 'NMISS': columns['NMISS']})
+        if type == "linear":
+            table['BETA'] = columns['BETA']
+        else:
+            table['OR'] = np.exp(columns['BETA'])
+        table['SE'] = columns['SE']
+        table['STAT'] = columns['STAT']
+        table['P'] = columns['P']
+        prefix = outfile if phenofile is None else f'{outfile}.{name}'
+        write_table(table, f'{prefix}.assoc.{types[type]}')
+        tables[name] = table
+    return tables
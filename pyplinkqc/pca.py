@@ -0,0 +1,187 @@
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from .id_index import IDIndex
+from .plink_io import open_bed, read_fam, decode_genotypes, iter_blocks
+
+# Out-of-core principal component analysis of the samples, for population
+# structure/ancestry checks without pre-computed ancestry. The genotypes of
+# the (LD-pruned) SNPs are standardized block by block as they are read from
+# the .bed file, as in plink --pca/EIGENSOFT: (g - 2p) / sqrt(2p(1 - p)), with
+# missing genotypes set to the mean (0). The top PCs are found by randomized
+# subspace iteration on the sample-by-sample matrix X'X: every pass over the
+# .bed file multiplies the current (n_samples x k + oversamples) basis by X'X,
+# summing the products of the variant blocks in a thread pool (the matrix
+# products release the GIL). Passes are repeated until the Ritz values (the
+# eigenvalue estimates within the basis) stop changing, up to n_iter passes.
+# Memory use is a few bases of n_samples rows plus one basis product and one
+# block per thread, whatever the number of SNPs, so the default number of
+# threads is capped to keep the per-thread buffers within about 1 GB.
+
+
+def _standardized_block(bed: np.ndarray, rows: np.ndarray, n_samples: int):
+    """Standardize the genotypes of the variant rows of a .bed memmap (float32)."""
+    genotypes = decode_genotypes(bed[rows], n_samples)
+    missing = genotypes < 0
+    called = (~missing).sum(axis=1)
+    G = genotypes.astype(np.float32)
+    G[missing] = 0
+    freqs = np.divide(G.sum(axis=1), 2 * called, out=np.zeros(len(G)), where=called > 0)
+    sds = np.sqrt(2 * freqs * (1 - freqs))
+    G -= (2 * freqs)[:, None].astype(np.float32)
+    G[missing] = 0
+    # monomorphic variants carry no information and are zeroed
+    scale = np.divide(1, sds, out=np.zeros(len(G)), where=sds > 0).astype(np.float32)
+    return G * scale[:, None]
+
+
+def _project_blocks(bed: np.ndarray, snps: np.ndarray, blocks: list, n_samples: int, Q: np.ndarray):
+    """Get X'X Q and Q'X'X Q over the variant blocks [(start, stop)] of the SNP indices."""
+    Q32 = Q.astype(np.float32)
+    Z = np.zeros_like(Q)
+    B = np.zeros((Q.shape[1], Q.shape[1]))
+    for start, stop in blocks:
+        X = _standardized_block(bed, snps[start:stop], n_samples)
+        Y = X @ Q32
+        Z += X.T @ Y
+        B += Y.T.astype(float) @ Y
+    return Z, B
+
+
+def _outliers(pcs: np.ndarray, sd: float, n_iter: int):
+    """Flag samples more than sd standard deviations from the mean of any PC.
+
+    As EIGENSOFT does, the mean and standard deviation are recomputed without
+    the outliers, n_iter times or until no new outlier is found.
+    """
+    outliers = np.zeros(len(pcs), dtype=bool)
+    for _ in range(n_iter):
+        kept = pcs[~outliers]
+        if len(kept) < 2:
+            break
+        means = kept.mean(axis=0)
+        sds = kept.std(axis=0)
+        new = (np.abs(pcs - means) > sd * np.where(sds > 0, sds, np.inf)).any(axis=1)
+        if not (new & ~outliers).any():
+            break
+        outliers |= new
+    return outliers
+
+
+def pca(bfile: str, outfile: str, snpfile: str=None, n_components: int=20, oversamples: int=10,
+        n_iter: int=20, tol: float=1e-3, outlier_sd: float=6.0, outlier_pcs: int=10,
+        outlier_iter: int=5, block_size: int=None, threads: int=None, seed: int=0):
+    """Compute the top principal components of the samples with randomized SVD.
+
+    Writes <outfile>.eigenvec (FID, IID and PC1..PCk, with a header),
+    <outfile>.eigenval (one eigenvalue per line, as plink --pca) and
+    <outfile>.pca_outliers (FID and IID of the outlying samples, with a header;
+    see qc_report.samples_failed). Eigenvalues are those of the genetic
+    relationship matrix X'X / n_snps.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        prefix for the output files
+    snpfile: str
+        file of the SNPs to use, e.g. the <snpfile>.prune.in file written by
+        qc_filter.ld_pruning (default: all SNPs)
+    n_components: int
+        number of principal components
+    oversamples: int
+        extra basis vectors of the randomized SVD, for accuracy
+    n_iter: int
+        maximum number of passes over the .bed file (power iterations); a
+        warning is issued if the eigenvalues have not converged by then
+    tol: float
+        the iterations stop when no eigenvalue changes by more than tol
+        (relative) between two passes
+    outlier_sd: float
+        samples more than outlier_sd standard deviations from the mean of one
+        of the first outlier_pcs PCs are outliers
+    outlier_pcs: int
+        number of PCs checked for outliers
+    outlier_iter: int
+        maximum number of outlier removal iterations
+    block_size: int
+        number of variants per block (default: about 16 MB of standardized genotypes)
+    threads: int
+        number of threads (default: number of cpus, at most 8 and as many as
+        fit about 1 GB of per-thread buffers)
+    seed: int
+        seed of the random starting basis
+
+    Returns:
+    --------
+    eigenvec: pd.DataFrame
+        FID, IID and the principal components of every sample
+    eigenval: np.ndarray
+        eigenvalues of the principal components
+    """
+    index = IDIndex.from_bfile(bfile, snps=snpfile is not None)
+    n_samples = index.n_samples
+    bed = open_bed(bfile, n_samples)
+    if snpfile is not None:
+        snps = np.flatnonzero(index.snp_mask_from_file(snpfile))
+    else:
+        snps = np.arange(bed.shape[0])
+    rank = n_components + oversamples
+    if n_components < 1 or rank > min(n_samples, len(snps)):
+        raise ValueError(f'{n_components} components (+ {oversamples} oversamples) do not fit '
+                         f'{n_samples} samples and {len(snps)} SNPs')
+    if n_iter < 1:
+        raise ValueError(f'n_iter {n_iter} must be at least 1')
+    if block_size is None:
+        block_size = max(1, (1 << 22) // n_samples)
+    if threads is None:
+        # every thread holds its own product (n_samples x rank) and standardized block
+        thread_bytes = 8 * n_samples * rank + 4 * block_size * n_samples
+        threads = max(1, min(os.cpu_count() or 1, 8, (1 << 30) // thread_bytes))
+    blocks = iter_blocks(len(snps), block_size)
+    # every thread sums the products of an interleaved share of the blocks
+    shares = [blocks[i::threads] for i in range(threads) if blocks[i::threads]]
+
+    def power(Q):
+        with ThreadPoolExecutor(max_workers=len(shares)) as pool:
+            results = list(pool.map(lambda share: _project_blocks(bed, snps, share, n_samples, Q), shares))
+        return sum(result[0] for result in results), sum(result[1] for result in results)
+
+    Q = np.linalg.qr(np.random.default_rng(seed).standard_normal((n_samples, rank)))[0]
+    previous = None
+    for i in range(n_iter):
+        Z, B = power(Q)
+        # Rayleigh-Ritz: eigenvectors of X'X within the current basis
+        values, vectors = np.linalg.eigh((B + B.T) / 2)
+        top = np.sort(values)[::-1][:n_components]
+        change = np.inf if previous is None else np.max(np.abs(top - previous) / np.maximum(top, 1e-12))
+        print(f'pca: pass {i + 1} done (eigenvalue change {change:.2g})')
+        if change <= tol:
+            break
+        previous = top
+        if i + 1 < n_iter:
+            Q = np.linalg.qr(Z)[0]
+    else:
+        warnings.warn(f'pca: eigenvalues did not converge in {n_iter} passes (change {change:.2g} > {tol}), '
+                      f'please increase n_iter', RuntimeWarning)
+    order = np.argsort(values)[::-1][:n_components]
+    eigenval = values[order] / len(snps)
+    pcs = Q @ vectors[:, order]
+    # sign convention: the largest loading of every PC is positive
+    pcs *= np.where(pcs[np.abs(pcs).argmax(axis=0), np.arange(n_components)] < 0, -1, 1)
+
+    fam = read_fam(bfile + ".fam")
+    eigenvec = pd.DataFrame(pcs, columns=[f'PC{i + 1}' for i in range(n_components)])
+    eigenvec.insert(0, 'IID', fam['iid'].to_numpy())
+    eigenvec.insert(0, 'FID', fam['fid'].to_numpy())
+    eigenvec.to_csv(outfile + ".eigenvec", sep=" ", index=False)
+    np.savetxt(outfile + ".eigenval", eigenval, fmt="%.6g")
+
+    outliers = _outliers(pcs[:, :outlier_pcs], outlier_sd, outlier_iter)
+    eigenvec.loc[outliers, ['FID', 'IID']].to_csv(outfile + ".pca_outliers", sep=" ", index=False)
+    print(f'{outliers.sum()}/{n_samples} samples are PCA outliers (> {outlier_sd} SD on the first '
+          f'{min(outlier_pcs, n_components)} PCs)')
+    return eigenvec, eigenval
@@ -0,0 +1,258 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# .bed files start with 2 magic bytes and a byte for variant-major mode, followed by
+# one row of ceil(n_samples / 4) bytes per variant. Each byte holds 4 samples,
+# lowest bits first, coded 00 = homozygous A1, 01 = missing, 10 = heterozygous,
+# 11 = homozygous A2. Genotypes are decoded to A1 allele counts (2, 1, 0, or -1
+# for missing).
+BED_MAGIC = b'\x6c\x1b\x01'
+_CODE_TO_GENO = np.array([2, -1, 1, 0], dtype=np.int8)
+_GENO_TO_CODE = np.array([1, 3, 2, 0], dtype=np.uint8)  # indexed by genotype + 1
+# 2-bit codes of every byte value, lowest bits first
+CODE_LUT = ((np.arange(256)[:, None] >> (2 * np.arange(4))) & 3).astype(np.uint8)
+DECODE_LUT = _CODE_TO_GENO[CODE_LUT]
+
+FAM_COLUMNS = ['fid', 'iid', 'pat', 'mat', 'sex', 'pheno']
+BIM_COLUMNS = ['chrom', 'snp', 'cm', 'pos', 'a1', 'a2']
+_CHROM_CODES = {'X': '23', 'Y': '24', 'XY': '25', 'M': '26', 'MT': '26'}
+
+
+def plink_chrom(chrom: str):
+    """Normalize a chromosome name to a plink 1.9 chromosome code ("chr1" -> "1", "chrX" -> "23")."""
+    chrom = re.sub('^chr', '', str(chrom), flags=re.IGNORECASE)
+    if chrom.isdigit():
+        return str(int(chrom))
+    return _CHROM_CODES.get(chrom.upper(), chrom)
+
+
+def read_fam(fam_file: str):
+    """Read a plink .fam file.
+
+    Key arguments:
+    --------------
+    fam_file: str
+        path to the .fam file
+
+    Returns:
+    --------
+    fam: pd.DataFrame
+        one row per sample, with columns fid, iid, pat, mat, sex and pheno
+        (IDs are read as strings)
+    """
+    return pd.read_csv(fam_file, sep=r'\s+', header=None, names=FAM_COLUMNS,
+                       dtype={'fid': str, 'iid': str, 'pat': str, 'mat': str,
+                              'sex': 'int8', 'pheno': str})
+
+
+def read_bim(bim_file: str):
+    """Read a plink .bim file.
+
+    Key arguments:
+    --------------
+    bim_file: str
+        path to the .bim file
+
+    Returns:
+    --------
+    bim: pd.DataFrame
+        one row per variant, with columns chrom, snp, cm, pos, a1 and a2
+        (chromosome codes and IDs are read as strings)
+    """
+    return pd.read_csv(bim_file, sep=r'\s+', header=None, names=BIM_COLUMNS,
+                       dtype={'chrom': str, 'snp': str, 'cm': float, 'pos': 'int64',
+                              'a1': str, 'a2': str})
+
+
+def write_fam(fam: pd.DataFrame, fam_file: str):
+    """Write a plink .fam file.
+
+    Key arguments:
+    --------------
+    fam: pd.DataFrame
+        table with the columns returned by read_fam
+    fam_file: str
+        path to the .fam file
+    """
+    fam[FAM_COLUMNS].to_csv(fam_file, sep=" ", index=False, header=False)
+
+
+def write_bim(bim: pd.DataFrame, bim_file: str):
+    """Write a plink .bim file.
+
+    Key arguments:
+    --------------
+    bim: pd.DataFrame
+        table with the columns returned by read_bim
+    bim_file: str
+        path to the .bim file
+    """
+    bim[BIM_COLUMNS].to_csv(bim_file, sep="\t", index=False, header=False)
+
+
+def bytes_per_variant(n_samples: int):
+    """Number of bytes of one variant row of a .bed file."""
+    return (n_samples + 3) // 4
+
+
+def open_bed(bfile: str, n_samples: int=None, n_snps: int=None):
+    """Memory-map the genotype payload of a .bed file.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    n_samples: int
+        number of samples (default: counted from the .fam file)
+    n_snps: int
+        number of variants (default: counted from the .bim file)
+
+    Returns:
+    --------
+    bed: np.memmap
+        read-only uint8 array of shape (n_snps, bytes_per_variant(n_samples))
+    """
+    if n_samples is None:
+        n_samples = count_lines(bfile + ".fam")
+    if n_snps is None:
+        n_snps = count_lines(bfile + ".bim")
+    with open(bfile + ".bed", "rb") as f:
+        magic = f.read(3)
+    if magic != BED_MAGIC:
+        raise ValueError(f'{bfile}.bed is not a variant-major plink 1 .bed file')
+    expected = 3 + n_snps * bytes_per_variant(n_samples)
+    size = os.path.getsize(bfile + ".bed")
+    if size != expected:
+        raise ValueError(f'{bfile}.bed has {size} bytes, expected {expected} for '
+                         f'{n_snps} variants and {n_samples} samples')
+    return np.memmap(bfile + ".bed", dtype=np.uint8, mode='r', offset=3,
+                     shape=(n_snps, bytes_per_variant(n_samples)))
+
+
+def open_dosage(prefix: str, n_samples: int=None, n_snps: int=None):
+    """Memory-map a .dosage file (see bgen.bgen_qc).
+
+    A .dosage file holds one row of float32 A1 dosages (0 to 2, -1 for missing)
+    per variant of the matching .bim file, for the samples of the .fam file.
+
+    Key arguments:
+    --------------
+    prefix: str
+        prefix of the .dosage, .bim and .fam files
+    n_samples: int
+        number of samples (default: counted from the .fam file)
+    n_snps: int
+        number of variants (default: counted from the .bim file)
+
+    Returns:
+    --------
+    dosage: np.memmap
+        read-only float32 array of shape (n_snps, n_samples)
+    """
+    if n_samples is None:
+        n_samples = count_lines(prefix + ".fam")
+    if n_snps is None:
+        n_snps = count_lines(prefix + ".bim")
+    expected = 4 * n_snps * n_samples
+    size = os.path.getsize(prefix + ".dosage")
+    if size != expected:
+        raise ValueError(f'{prefix}.dosage has {size} bytes, expected {expected} for '
+                         f'{n_snps} variants and {n_samples} samples')
+    return np.memmap(prefix + ".dosage", dtype=np.float32, mode='r', shape=(n_snps, n_samples))
+
+
+def count_lines(path: str):
+    """Count the lines of a text file (e.g. the samples of a .fam or variants of a .bim)."""
+    lines = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            lines += chunk.count(b'\n')
+    return lines
+
+
+def decode_genotypes(block: np.ndarray, n_samples: int):
+    """Decode packed .bed rows to A1 allele counts.
+
+    Key arguments:
+    --------------
+    block: np.ndarray
+        uint8 array of shape (n_variants, bytes_per_variant(n_samples))
+    n_samples: int
+        number of samples
+
+    Returns:
+    --------
+    genotypes: np.ndarray
+        int8 array of shape (n_variants, n_samples) with 0, 1, 2, or -1 if missing
+    """
+    block = np.asarray(block)
+    return DECODE_LUT[block].reshape(block.shape[0], -1)[:, :n_samples]
+
+
+def encode_genotypes(genotypes: np.ndarray):
+    """Pack A1 allele counts (0, 1, 2, or -1 if missing) into .bed rows.
+
+    Key arguments:
+    --------------
+    genotypes: np.ndarray
+        integer array of shape (n_variants, n_samples)
+
+    Returns:
+    --------
+    block: np.ndarray
+        uint8 array of shape (n_variants, bytes_per_variant(n_samples))
+    """
+    genotypes = np.asarray(genotypes)
+    return pack_codes(_GENO_TO_CODE[genotypes.astype(np.int16) + 1])
+
+
+def unpack_codes(block: np.ndarray, n_samples: int):
+    """Unpack .bed rows to their 2-bit genotype codes (uint8 array of shape (n_variants, n_samples))."""
+    block = np.asarray(block)
+    return CODE_LUT[block].reshape(block.shape[0], -1)[:, :n_samples]
+
+
+def pack_codes(codes: np.ndarray):
+    """Pack 2-bit genotype codes of shape (n_variants, n_samples) into .bed rows (zero padded)."""
+    n_variants, n_samples = codes.shape
+    padded = np.zeros((n_variants, bytes_per_variant(n_samples) * 4), dtype=np.uint8)
+    padded[:, :n_samples] = codes
+    padded = padded.reshape(n_variants, bytes_per_variant(n_samples), 4)
+    return padded[:, :, 0] | (padded[:, :, 1] << 2) | (padded[:, :, 2] << 4) | (padded[:, :, 3] << 6)
+
+
+class BedWriter:
+    """Write a .bed file block by block.
+
+    Key arguments:
+    --------------
+    bed_file: str
+        path to the .bed file to write
+    """
+    def __init__(self, bed_file: str):
+        self.bed_file = bed_file
+        self.file = open(bed_file, "wb")
+        self.file.write(BED_MAGIC)
+        self.n_variants = 0
+
+    def write(self, block: np.ndarray):
+        """Append packed variant rows (see encode_genotypes)."""
+        block = np.ascontiguousarray(block, dtype=np.uint8)
+        self.file.write(block.tobytes())
+        self.n_variants += block.shape[0]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_blocks(n_snps: int, block_size: int, start: int=0):
+    """Split variant indices [start, n_snps) into (start, stop) blocks."""
+    return [(i, min(i + block_size, n_snps)) for i in range(start, n_snps, block_size)]
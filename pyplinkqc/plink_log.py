@@ -0,0 +1,197 @@
+import re
+from datetime import datetime
+
+# Parser of the .log files plink 1.9 writes next to every --out prefix (also
+# with --silent). The log holds exact counts of the variants and samples each
+# filter removed, so QC summaries can be built from it without re-reading the
+# (large) report files. Only the standard library is imported, to keep
+# run_plink fast to import.
+
+_TIME_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+# filter name: pattern whose first group is the number removed
+_REMOVED = {
+    'geno': r'(\d+) variants? removed due to missing genotype data \(--geno\)',
+    'mind': r'(\d+) (?:people|person) removed due to missing genotype data \(--mind\)',
+    'maf': r'(\d+) variants? removed due to minor allele threshold',
+    'hwe': r'--hwe: (\d+) variants? removed due to Hardy-Weinberg exact test',
+    'indep': r'Pruning complete\.\s+(\d+) of \d+ variants? removed',
+}
+# filters reporting the number remaining (removed = count before - remaining)
+_REMAINING = r'--(\S+?): (\d+) (variants?|people|person) remaining'
+
+
+class PlinkLog:
+    """Metrics of one plink run, parsed from its .log file (see parse_plink_log).
+
+    variants_in/samples_in are the counts loaded from the .bim/.fam files and
+    variants_out/samples_out the counts passing filters and QC. removed maps
+    each filter (e.g. "geno", "mind", "maf", "hwe", "remove", "extract") to the
+    number of variants or samples it removed. Counts plink did not report are None.
+    """
+    def __init__(self, logfile: str):
+        self.logfile = logfile
+        self.version = None
+        self.options = []
+        self.start_time = None
+        self.end_time = None
+        self.threads = None
+        self.ram_mb = None
+        self.workspace_mb = None
+        self.variants_in = None
+        self.samples_in = None
+        self.variants_out = None
+        self.samples_out = None
+        self.removed = {}
+        self.warnings = []
+        self.errors = []
+
+    @property
+    def runtime(self):
+        """Run time in seconds (whole seconds, as logged)."""
+        if self.start_time is None or self.end_time is None:
+            return None
+        return (self.end_time - self.start_time).total_seconds()
+
+    @property
+    def variants_removed(self):
+        if self.variants_in is None or self.variants_out is None:
+            return None
+        return self.variants_in - self.variants_out
+
+    @property
+    def samples_removed(self):
+        if self.samples_in is None or self.samples_out is None:
+            return None
+        return self.samples_in - self.samples_out
+
+    def as_dict(self):
+        """Get the metrics as a dictionary (e.g. to store them as JSON)."""
+        return {'logfile': self.logfile, 'version': self.version, 'options': self.options,
+                'start_time': self.start_time.isoformat() if self.start_time else None,
+                'end_time': self.end_time.isoformat() if self.end_time else None,
+                'runtime': self.runtime, 'threads': self.threads, 'ram_mb': self.ram_mb,
+                'workspace_mb': self.workspace_mb, 'variants_in': self.variants_in,
+                'samples_in': self.samples_in, 'variants_out': self.variants_out,
+                'samples_out': self.samples_out, 'variants_removed': self.variants_removed,
+                'samples_removed': self.samples_removed, 'removed': dict(self.removed),
+                'warnings': list(self.warnings), 'errors': list(self.errors)}
+
+    def __repr__(self):
+        return (f'PlinkLog({self.logfile!r}, variants {self.variants_in} -> {self.variants_out}, '
+                f'samples {self.samples_in} -> {self.samples_out}, removed {self.removed})')
+
+
+def _time(text: str, label: str):
+    match = re.search(rf'^{label} time: (.+)$', text, re.MULTILINE)
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(' '.join(match.group(1).split()), _TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def parse_plink_log(logfile: str):
+    """Parse a plink 1.9 .log file into a PlinkLog.
+
+    Key arguments:
+    --------------
+    logfile: str
+        path to the .log file (<--out prefix>.log)
+
+    Returns:
+    --------
+    log: PlinkLog
+        metrics of the run
+    """
+    with open(logfile) as f:
+        text = f.read()
+    log = PlinkLog(logfile)
+
+    match = re.search(r'^PLINK (v\S+)', text, re.MULTILINE)
+    if match:
+        log.version = match.group(1)
+    options = re.search(r'^Options in effect:\n((?:  .*\n)+)', text, re.MULTILINE)
+    if options:
+        log.options = [line.strip() for line in options.group(1).splitlines()]
+    log.start_time = _time(text, 'Start')
+    log.end_time = _time(text, 'End')
+
+    match = re.search(r'(\d+) MB RAM detected; reserving (\d+) MB for main\s+workspace', text)
+    if match:
+        log.ram_mb, log.workspace_mb = int(match.group(1)), int(match.group(2))
+    # the last thread count logged is the number of threads the calculation used
+    threads = re.findall(r'Using (?:up to )?(\d+) threads?', text)
+    if threads:
+        log.threads = int(threads[-1])
+
+    match = re.search(r'(\d+) variants? loaded from \.bim file', text)
+    if match:
+        log.variants_in = int(match.group(1))
+    match = re.search(r'(\d+) (?:people|person) \([^)]*\) loaded from \.fam', text)
+    if match:
+        log.samples_in = int(match.group(1))
+    match = re.search(r'(\d+) variants? and (\d+) (?:people|person) pass filters and QC', text)
+    if match:
+        log.variants_out, log.samples_out = int(match.group(1)), int(match.group(2))
+
+    for name, pattern in _REMOVED.items():
+        counts = [int(count) for count in re.findall(pattern, text)]
+        if counts:
+            log.removed[name] = sum(counts)
+    # --extract, --remove, ... report what is left, in the order they are applied
+    current = {'variants': log.variants_in, 'samples': log.samples_in}
+    for flag, remaining, unit in re.findall(_REMAINING, text):
+        axis = 'variants' if unit.startswith('variant') else 'samples'
+        if current[axis] is not None:
+            log.removed[flag] = log.removed.get(flag, 0) + current[axis] - int(remaining)
+        current[axis] = int(remaining)
+
+    # wrapped message lines are joined
+    for kind, messages in [('Warning', log.warnings), ('Error', log.errors)]:
+        for match in re.finditer(rf'^{kind}: (.+(?:\n(?![A-Z0-9\-]).+)*)', text, re.MULTILINE):
+            messages.append(' '.join(match.group(1).split()))
+    return log
+
+
+def out_prefix(flags):
+    """Get the --out prefix of a list of plink flags (plink's default is "plink")."""
+    for flag in flags:
+        parts = flag.split()
+        if parts and parts[0] == '--out' and len(parts) > 1:
+            return parts[1]
+    return "plink"
+
+
+def removed_counts(logs: dict, axis: str):
+    """Count the variants or samples removed by a sequence of QC stages.
+
+    Key arguments:
+    --------------
+    logs: dict
+        maps QC test names to the .log files (or PlinkLog objects) of the plink
+        runs filtering them, in pipeline order
+    axis: str
+        "variants" or "samples"
+
+    Returns:
+    --------
+    counts: dict
+        maps QC test names to the number removed by their stage
+    total: int
+        number of variants or samples going into the first stage (None if unknown)
+    """
+    axes = ['variants', 'samples']
+    if axis not in axes:
+        raise ValueError(f'{axis} not a valid choice, please choose from {axes}')
+    counts = {}
+    total = None
+    for test, log in logs.items():
+        if not isinstance(log, PlinkLog):
+            log = parse_plink_log(log)
+        removed = log.variants_removed if axis == "variants" else log.samples_removed
+        counts[test] = removed or 0
+        if total is None:
+            total = log.variants_in if axis == "variants" else log.samples_in
+    return counts, total
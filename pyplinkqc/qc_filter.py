@@ -1,7 +1,4 @@
-import pandas as pd
-import numpy as np
 import os
-import subprocess
 from .run_plink import run_plink
 
 
@@ -19,9 +16,10 @@ def snp_genotypes(bfile: str, threshold: float, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
-    run_plink(bfile, f'--geno {threshold}', f'--out {outfile}')
+    return run_plink(bfile, f'--geno {threshold}', f'--out {outfile}')
 
 def samples_genotypes(bfile: str, threshold: float, outfile: str):
     """Filters samples based on missing genotype rate.
@@ -37,11 +35,12 @@ def samples_genotypes(bfile: str, threshold: float, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # command = "./plink --bfile {} --mind {} --silent --make-bed --out {}".format(bfile, cutoff, outfile)
     # os.system(command)
-    run_plink(bfile, f'--mind {threshold}', f'--out {outfile}')
+    return run_plink(bfile, f'--mind {threshold}', f'--out {outfile}')
 
 def individuals(bfile: str, keepfile: str, outfile: str):
     """Filters out individuals based on sample ID
@@ -59,11 +58,68 @@ def individuals(bfile: str, keepfile: str, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # command = "./plink --bfile {} --keep {} --silent --make-bed --out {}".format(bfile, keepfile, outfile)
     # os.system(command)
-    run_plink(bfile, f'-- keep {keepfile}', f'--out {outfile}')
+    return run_plink(bfile, f'--keep {keepfile}', f'--out {outfile}')
+
+
+def split_samples(bfile: str, keepfiles: list, outfiles: list, block_size: int=None):
+    """Split plink binary files into sample subsets, reading the .bed file once.
+
+    Like individuals (plink --keep) run once per keep-list, but every variant
+    block is read once and re-packed into the .bed file of every subset, so the
+    cost is one read of the source plus one write per subset. Samples keep
+    their .fam order; the .bim file is copied to every subset.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    keepfiles: list
+        paths to keep-lists (plink keep files with FID and IID columns, or lists of IIDs)
+    outfiles: list
+        prefix for the output plink binary files of every keep-list
+    block_size: int
+        number of variants per block (default: about 16 MB of packed rows)
+
+    Returns:
+    --------
+    n_samples: list
+        number of samples written to every subset
+    """
+    import shutil
+    from contextlib import ExitStack
+    import numpy as np
+    from .id_index import IDIndex
+    from .plink_io import (BedWriter, open_bed, read_fam, write_fam, bytes_per_variant, iter_blocks,
+                           pack_codes, unpack_codes)
+
+    if len(keepfiles) != len(outfiles):
+        raise ValueError(f'{len(keepfiles)} keep-lists but {len(outfiles)} output prefixes')
+    index = IDIndex.from_bfile(bfile, snps=False)
+    masks = [index.sample_mask_from_file(keepfile) for keepfile in keepfiles]
+    columns = [np.flatnonzero(mask) for mask in masks]
+    bed = open_bed(bfile, index.n_samples)
+    if block_size is None:
+        block_size = max(1, (1 << 24) // bytes_per_variant(index.n_samples))
+
+    with ExitStack() as stack:
+        writers = [stack.enter_context(BedWriter(outfile + ".bed")) for outfile in outfiles]
+        for start, stop in iter_blocks(bed.shape[0], block_size):
+            codes = unpack_codes(bed[start:stop], index.n_samples)
+            for writer, subset in zip(writers, columns):
+                writer.write(pack_codes(codes[:, subset]))
+
+    fam = read_fam(bfile + ".fam")
+    for outfile, mask in zip(outfiles, masks):
+        write_fam(fam[mask], outfile + ".fam")
+        shutil.copyfile(bfile + ".bim", outfile + ".bim")
+    n_samples = [int(mask.sum()) for mask in masks]
+    print(f'{bfile} split into {len(outfiles)} subsets of {n_samples} samples')
+    return n_samples
 
 
 def impute_sex(bfile: str, outfile: str):
@@ -80,11 +136,12 @@ def impute_sex(bfile: str, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # command = "./plink --bfile {} --impute-sex --silent --make-bed --out {}".format(bfile, outfile)
     # os.system(command)
-    run_plink(bfile, '--impute sex', f'--out {outfile}')
+    return run_plink(bfile, '--impute-sex', f'--out {outfile}')
 
 def remove_sex(bfile: str, removefile: str, outfile: str):
     """Remove individuals with sex discrepancies.
@@ -102,12 +159,13 @@ def remove_sex(bfile: str, removefile: str, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     if os.path.isfile(removefile):
         # command = "./plink --bfile {} --remove {} --make-bed --out {}".format(bfile, remove_file, out)
         # os.system(command)
-        run_plink(bfile, f'--remove {removefile}', f'--out {outfile}')
+        return run_plink(bfile, f'--remove {removefile}', f'--out {outfile}')
     else:
         print("error in remove_sex function! {} file is not found!").format(removefile)
 
@@ -125,6 +183,8 @@ def _autosomal_snps_file(bfile: str, outfile: str):
     --------
 
     """
+    import pandas as pd
+
     bim_file = bfile + ".bim"
     bim = pd.read_csv(bim_file, delimiter="\t", skipinitialspace=True)
     bim.columns = ['chrom', 'snp', 'cm', 'pos', 'a0', 'a1']
@@ -149,11 +209,12 @@ def autosomal_snp(bfile: str, autofile: str, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # # command = "./plink --bfile {} --extract {} --silent --make-bed --out {}".format(bfile, auto_file, outfile)
     # os.system(command)
-    run_plink(bfile, f'--extract {autofile}')
+    return run_plink(bfile, f'--extract {autofile}')
 
 def maf(bfile: str, threshold: float, outfile: str):
     """Filter variants with minor allele frequency below threshold.
@@ -169,11 +230,12 @@ def maf(bfile: str, threshold: float, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # command = "./plink --bfile {} --maf {} --make-bed --out {}".format(bfile, threshold, outfile)
     # os.system(command)
-    run_plink(bfile, f'--maf {threshold}', f'--out {outfile}')
+    return run_plink(bfile, f'--maf {threshold}', f'--out {outfile}')
 
 def hardy_weinberg_test(bfile: str, control: bool, threshold: float, outfile: str):
     """Filter out variants with HWE exact test p-value below threshold.
@@ -191,14 +253,15 @@ def hardy_weinberg_test(bfile: str, control: bool, threshold: float, outfile: st
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     if control:
         # command = "./plink --bfile {} --hwe {} --silent --make-bed --out {}".format(bfile, threshold, outfile)
-        run_plink(bfile, f'--hwe {threshold}', f'--out {outfile}')
+        return run_plink(bfile, f'--hwe {threshold}', f'--out {outfile}')
     else:
         # command = "./plink --bfile {} --hwe include-nonctrl {} --silent --make-bed --out {}".format(bfile, threshold, outfile)
-        run_plink(bfile, f'--hwe include-nonctrl {threshold}', f'--out {outfile}')
+        return run_plink(bfile, f'--hwe include-nonctrl {threshold}', f'--out {outfile}')
     # os.system(command)
     #os.system(command2)
 
@@ -226,7 +289,8 @@ def ld_pruning(bfile: str, snpfile: str, outfile: str, window: int=50, shift: in
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     correlation_methods = ['multiple', 'pairwise']
     if correlation_method not in correlation_methods:
@@ -241,7 +305,7 @@ def ld_pruning(bfile: str, snpfile: str, outfile: str, window: int=50, shift: in
         run_plink(bfile, f'--indep-pairwise {window} {shift} {correlation_threshold}', f'--out {snpfile}', make_bed=False)
     snp_in = snpfile + ".prune.in"
     # command2 = "./plink --bfile {} --extract {} --het --out {}".format(bfile, snp_in, outfile)
-    run_plink(bfile, f'--extract {snp_in}', f'--out {outfile}')
+    return run_plink(bfile, f'--extract {snp_in}', f'--out {outfile}')
     # os.system(command)
     # os.system(command2)
 
@@ -261,11 +325,12 @@ def heterozygosity_snps(bfile: str, failedfile: str, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # command = "./plink --bfile {} --remove {} --make-bed --out {}".format(bfile, failed_file, outfile)
     # os.system(command)
-    run_plink(bfile, f'--remove {failedfile}', f'--out {outfile}')
+    return run_plink(bfile, f'--remove {failedfile}', f'--out {outfile}')
 
 def relatedness_samples(bfile: str, removefile: str, outfile: str):
     """Filter samples that are related.
@@ -283,8 +348,9 @@ def relatedness_samples(bfile: str, removefile: str, outfile: str):
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the plink .log file (see plink_log.parse_plink_log)
     """
     # command = "./plink --bfile {} --remove {} --make-bed --out {}".format(bfile, remove_file, outfile)
     # os.system(command)
-    run_plink(bfile, f'--remove {removefile}', f'--out {outfile}')
+    return run_plink(bfile, f'--remove {removefile}', f'--out {outfile}')
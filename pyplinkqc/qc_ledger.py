@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+
+class FailureLedger:
+    """Record of which samples or variants failed which QC tests.
+
+    Every ID is mapped to a dense integer position (through a hashed pandas
+    Index) and the failures are kept as one bit per QC test in a single uint32
+    array, so unions, intersections and exact totals are vectorized bit
+    operations and IDs failing several tests are only counted once.
+
+    Key arguments:
+    --------------
+    ids: list
+        all sample or variant IDs the QC tests were run on
+    """
+    max_tests = 32
+
+    def __init__(self, ids):
+        self.ids = pd.Index(pd.unique(np.asarray(ids)))
+        self.flags = np.zeros(len(self.ids), dtype=np.uint32)
+        self.tests = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _bit(self, test: str):
+        """Get the bit of a test, adding the test if it is new."""
+        if test not in self.tests:
+            if len(self.tests) == self.max_tests:
+                raise ValueError(f'a FailureLedger holds at most {self.max_tests} tests')
+            self.tests.append(test)
+        return np.uint32(1 << self.tests.index(test))
+
+    def add_mask(self, test: str, mask):
+        """Record failures of a test from a boolean mask aligned to the ledger IDs.
+
+        Key arguments:
+        --------------
+        test: str
+            name of the QC test
+        mask: np.ndarray
+            True for every ID that failed the test
+        """
+        bit = self._bit(test)
+        self.flags[np.asarray(mask, dtype=bool)] |= bit
+
+    def add_ids(self, test: str, failed_ids):
+        """Record failures of a test from a list of failed IDs.
+
+        IDs that are not in the ledger yet (e.g. from a report generated on a
+        different subset) are appended to it.
+
+        Key arguments:
+        --------------
+        test: str
+            name of the QC test
+        failed_ids: list
+            IDs that failed the test (duplicates are allowed)
+        """
+        bit = self._bit(test)
+        failed_ids = pd.unique(np.asarray(failed_ids))
+        positions = self.ids.get_indexer(failed_ids)
+        unknown = positions < 0
+        if unknown.any():
+            new_ids = failed_ids[unknown]
+            self.ids = self.ids.append(pd.Index(new_ids))
+            self.flags = np.concatenate([self.flags, np.zeros(len(new_ids), dtype=np.uint32)])
+            positions[unknown] = np.arange(len(self.ids) - len(new_ids), len(self.ids))
+        self.flags[positions] |= bit
+
+    def failed(self, tests: list=None, how: str="any"):
+        """Get a boolean mask of IDs failing the given tests.
+
+        Key arguments:
+        --------------
+        tests: list
+            tests to combine (default: all tests)
+        how: str
+            "any" for the union, "all" for the intersection of the failures
+
+        Returns:
+        --------
+        mask: np.ndarray
+            boolean mask aligned to the ledger IDs
+        """
+        hows = ['any', 'all']
+        if how not in hows:
+            raise ValueError(f'{how} not a valid choice, please choose from {hows}')
+        tests = self.tests if tests is None else tests
+        bits = np.uint32(0)
+        for test in tests:
+            bits |= np.uint32(1 << self.tests.index(test))
+        if how == "any":
+            return (self.flags & bits) != 0
+        return (self.flags & bits) == bits
+
+    def counts(self):
+        """Get the number of IDs failing each test.
+
+        Returns:
+        --------
+        counts: dict
+            maps test names to the number of failed IDs
+        """
+        return {test: int(np.count_nonzero(self.flags & np.uint32(1 << bit)))
+                for bit, test in enumerate(self.tests)}
+
+    def total_failed(self):
+        """Get the number of distinct IDs failing at least one test."""
+        return int(np.count_nonzero(self.flags))
+
+    def failed_ids(self, tests: list=None, how: str="any"):
+        """Get the IDs failing the given tests (see failed)."""
+        return self.ids[self.failed(tests, how)]
+
+    def to_long(self):
+        """Convert the ledger to a long-format table with one row per (ID, failed test).
+
+        Returns:
+        --------
+        long: pd.DataFrame
+            table with "ID" and "TEST" columns
+        """
+        ids = []
+        tests = []
+        for bit, test in enumerate(self.tests):
+            positions = np.flatnonzero(self.flags & np.uint32(1 << bit))
+            ids.append(self.ids[positions])
+            tests.append(np.full(len(positions), bit, dtype=np.int8))
+        if not ids:
+            return pd.DataFrame({'ID': [], 'TEST': pd.Categorical([], categories=self.tests)})
+        codes = np.concatenate(tests)
+        return pd.DataFrame({'ID': np.concatenate([np.asarray(i) for i in ids]),
+                             'TEST': pd.Categorical.from_codes(codes, categories=self.tests)})
+
+    def write(self, outfile: str):
+        """Write the ledger as a long-format csv table (<outfile>.csv, with ID and TEST columns).
+
+        Key arguments:
+        --------------
+        outfile: str
+            prefix of the output file
+
+        Returns:
+        --------
+        path: str
+            path of the written file
+        """
+        path = outfile + ".csv"
+        self.to_long().to_csv(path, index=False)
+        return path
@@ -1,43 +1,329 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-rcParams.update({'figure.autolayout': True})
-from matplotlib.backends.backend_pdf import PdfPages
+import numpy as np
 import os
+from . import tracing
 
-def missingness_hist(missfile: str="plink"):
+def get_pyplot():
+    """Import matplotlib.pyplot on first use, using the non-interactive Agg backend.
+
+    Matplotlib is not imported at module load, so modules that only filter
+    genotype data start up quickly.
+
+    Returns:
+    --------
+    matplotlib.pyplot module
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def get_pdf_pages():
+    """Import the matplotlib PdfPages writer on first use.
+
+    Returns:
+    --------
+    PdfPages class
+    """
+    get_pyplot()
+    from matplotlib.backends.backend_pdf import PdfPages
+    return PdfPages
+
+class HistPanel:
+    """Binned histogram counts for one panel of a QC figure.
+
+    Key arguments:
+    --------------
+    counts: np.ndarray
+        number of values in each bin
+    edges: np.ndarray
+        bin edges (len(counts) + 1 values)
+    title: str
+        panel title
+    xlabel: str
+        x axis label
+    ylabel: str
+        y axis label
+    thresholds: list
+        x positions of the QC threshold lines
+    """
+    def __init__(self, counts, edges, title: str="", xlabel: str="", ylabel: str="",
+                 thresholds: list=None):
+        self.counts = np.asarray(counts)
+        self.edges = np.asarray(edges)
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.thresholds = list(thresholds or [])
+
+    def draw(self, ax):
+        ax.hist(self.edges[:-1], bins=self.edges, weights=self.counts)
+        for threshold in self.thresholds:
+            ax.axvline(threshold, c='red', ls='--')
+        ax.set_title(self.title)
+        ax.set_xlabel(self.xlabel)
+        ax.set_ylabel(self.ylabel)
+
+class ScatterPanel:
+    """2D binned counts of one or more point series for one panel of a QC figure.
+
+    Each series is drawn as a rasterized density image (log colour scale).
+
+    Key arguments:
+    --------------
+    series: dict
+        maps series labels to 2D arrays of counts per (x bin, y bin)
+    xedges: np.ndarray
+        bin edges along the x axis
+    yedges: np.ndarray
+        bin edges along the y axis
+    title: str
+        panel title
+    xlabel: str
+        x axis label
+    ylabel: str
+        y axis label
+    """
+    def __init__(self, series: dict, xedges, yedges, title: str="", xlabel: str="",
+                 ylabel: str=""):
+        self.series = series
+        self.xedges = np.asarray(xedges)
+        self.yedges = np.asarray(yedges)
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+
+    def draw(self, ax):
+        from matplotlib.colors import LogNorm
+        from matplotlib.patches import Patch
+        cmaps = ['Blues', 'Oranges', 'Greens', 'Reds', 'Purples']
+        handles = []
+        for (label, counts), cmap in zip(self.series.items(), cmaps):
+            masked = np.ma.masked_equal(np.asarray(counts).T, 0)
+            mesh = ax.pcolormesh(self.xedges, self.yedges, masked, cmap=cmap,
+                                 norm=LogNorm(vmin=1, vmax=max(masked.max(), 2)),
+                                 rasterized=True)
+            handles.append(Patch(color=mesh.cmap(0.8), label=label))
+        ax.legend(handles=handles, loc='upper right')
+        ax.set_title(self.title)
+        ax.set_xlabel(self.xlabel)
+        ax.set_ylabel(self.ylabel)
+
+class BarPanel:
+    """Bar heights for one panel of a QC figure.
+
+    Key arguments:
+    --------------
+    labels: list
+        bar labels
+    heights: list
+        bar heights
+    title: str
+        panel title
+    xlabel: str
+        x axis label
+    ylabel: str
+        y axis label
+    """
+    def __init__(self, labels: list, heights: list, title: str="", xlabel: str="",
+                 ylabel: str=""):
+        self.labels = list(labels)
+        self.heights = list(heights)
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+
+    def draw(self, ax):
+        ax.bar(x=self.labels, height=self.heights)
+        ax.set_title(self.title)
+        ax.set_xlabel(self.xlabel)
+        ax.set_ylabel(self.ylabel)
+        ax.tick_params(axis='x', rotation=90)
+
+class QCStats:
+    """Lightweight result of a QC check: binned counts and thresholds of its plots.
+
+    No matplotlib objects are held; the figure is only built when render() is
+    called (e.g. by qc_report.save_pdf).
+
+    Key arguments:
+    --------------
+    name: str
+        name of the QC check
+    panels: list
+        HistPanel, ScatterPanel or BarPanel objects, drawn side by side
+    figsize: tuple
+        size of the rendered figure
+    """
+    def __init__(self, name: str, panels: list, figsize: tuple=None):
+        self.name = name
+        self.panels = list(panels)
+        self.figsize = figsize or (8 * len(self.panels), 6)
+
+    @tracing.traced("plot", name="qc_plot.QCStats.render")
+    def render(self):
+        """Build the matplotlib figure.
+
+        Returns:
+        --------
+        Figure object
+        """
+        plt = get_pyplot()
+        fig, ax = plt.subplots(1, len(self.panels), figsize=self.figsize, tight_layout=True,
+                               squeeze=False)
+        for panel, panel_ax in zip(self.panels, ax[0]):
+            panel.draw(panel_ax)
+        return fig
+
+class StreamingHistogram:
+    """Histogram with fixed, equally spaced bins that is filled chunk by chunk.
+
+    Memory use and the size of the rendered plot only depend on the number of
+    bins, not on the number of values.
+
+    Key arguments:
+    --------------
+    low: float
+        lower edge of the first bin
+    high: float
+        upper edge of the last bin
+    bins: int
+        number of bins
+    clip: bool
+        count values outside [low, high] in the first/last bin instead of dropping them
+    """
+    def __init__(self, low: float, high: float, bins: int=50, clip: bool=False):
+        self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.clip = clip
+
+    def update(self, values):
+        """Add a chunk of values (missing values are ignored)."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        low, high = self.edges[0], self.edges[-1]
+        if self.clip:
+            values = np.clip(values, low, high)
+        else:
+            values = values[(values >= low) & (values <= high)]
+        nbins = len(self.counts)
+        idx = ((values - low) * (nbins / (high - low))).astype(np.int64)
+        np.minimum(idx, nbins - 1, out=idx)
+        self.counts += np.bincount(idx, minlength=nbins)
+
+    def panel(self, **kwargs):
+        """Return the accumulated counts as a HistPanel."""
+        return HistPanel(self.counts, self.edges, **kwargs)
+
+class StreamingHistogram2D:
+    """2D histogram with fixed, equally spaced bins that is filled chunk by chunk.
+
+    Key arguments:
+    --------------
+    xlim: tuple
+        (low, high) range along the x axis
+    ylim: tuple
+        (low, high) range along the y axis
+    bins: int
+        number of bins along each axis
+    """
+    def __init__(self, xlim: tuple=(0, 1), ylim: tuple=(0, 1), bins: int=200):
+        self.xedges = np.linspace(xlim[0], xlim[1], bins + 1)
+        self.yedges = np.linspace(ylim[0], ylim[1], bins + 1)
+        self.counts = np.zeros((bins, bins), dtype=np.int64)
+
+    def update(self, x, y):
+        """Add a chunk of points; points outside the ranges are clipped to the border bins."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        nx, ny = self.counts.shape
+        ix = ((x[keep] - self.xedges[0]) * (nx / (self.xedges[-1] - self.xedges[0]))).astype(np.int64)
+        iy = ((y[keep] - self.yedges[0]) * (ny / (self.yedges[-1] - self.yedges[0]))).astype(np.int64)
+        np.clip(ix, 0, nx - 1, out=ix)
+        np.clip(iy, 0, ny - 1, out=iy)
+        self.counts += np.bincount(ix * ny + iy, minlength=nx * ny).reshape(nx, ny)
+
+def read_plink_chunks(plinkfile: str, columns: list, chunksize: int=1000000):
+    """Read selected columns of a whitespace-aligned plink report in chunks.
+
+    Key arguments:
+    --------------
+    plinkfile: str
+        plink report file (e.g. .imiss, .lmiss, .frq, .hwe, .genome)
+    columns: list
+        columns to read
+    chunksize: int
+        number of rows per chunk
+
+    Returns:
+    --------
+    iterator of pd.DataFrame chunks
+    """
+    for chunk in pd.read_csv(plinkfile, sep=r'\s+', usecols=columns, chunksize=chunksize):
+        tracing.add_rows(len(chunk))
+        yield chunk
+
+def _hist_panel(values, bins=10, **kwargs):
+    """Bin values into a HistPanel, ignoring missing values."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    return HistPanel(counts, edges, **kwargs)
+
+def _finish(stats: QCStats, deferred: bool):
+    """Return the stats object in deferred mode, otherwise the rendered figure."""
+    if deferred:
+        return stats
+    return stats.render()
+
+@tracing.traced("plot")
+def missingness_hist(missfile: str="plink", deferred: bool=False, bins: int=50,
+                     chunksize: int=1000000):
     """Plot histograms of SNP missingness for samples and SNPs.
 
-    Input files should be generated by report.missingness() function.
+    Input files should be generated by report.missingness() function. The files
+    are binned chunk by chunk, so memory use and plot size do not depend on the
+    number of samples or SNPs.
 
     Key arguments:
     --------------
     missfile: str
         prefix for the plink file containing missingess information
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of histogram bins
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
     imiss_file = missfile+".imiss"
     lmiss_file = missfile+".lmiss"
-    imiss = pd.read_csv(imiss_file, delimiter=" ", skipinitialspace=True)
-    lmiss = pd.read_csv(lmiss_file, delimiter=" ", skipinitialspace=True)
-
-    fig, ax = plt.subplots(1,2, figsize=(16,6), sharex=True)
-    imiss.hist(column='F_MISS', ax=ax[0])
-    ax[0].axvline(0.2, c='red', linestyle='--')
-    ax[0].set_xlabel("Proportion of missing SNPs")
-    ax[0].set_ylabel("Number of individuals")
-    ax[0].set_title("Proportion of missing SNPs per individual \n (> 0.2 are removed)")
-    lmiss['F_MISS'].hist(ax=ax[1])
-    ax[1].axvline(0.2, c='red', linestyle='--')
-    ax[1].set_xlabel("Proportion of individuals with missing SNPs")
-    ax[1].set_ylabel("Number of SNPs")
-    ax[1].set_title("Proportion of missing individuals per SNP \n (> 0.2 are removed)")
-    return fig
-
-def check_sex_hist(sexcheckfile: str="plink.sexcheck"):
+    imiss_hist = StreamingHistogram(0, 1, bins)
+    for chunk in read_plink_chunks(imiss_file, ['F_MISS'], chunksize):
+        imiss_hist.update(chunk['F_MISS'])
+    lmiss_hist = StreamingHistogram(0, 1, bins)
+    for chunk in read_plink_chunks(lmiss_file, ['F_MISS'], chunksize):
+        lmiss_hist.update(chunk['F_MISS'])
+
+    stats = QCStats("missingness", [
+        imiss_hist.panel(thresholds=[0.2],
+                         xlabel="Proportion of missing SNPs",
+                         ylabel="Number of individuals",
+                         title="Proportion of missing SNPs per individual \n (> 0.2 are removed)"),
+        lmiss_hist.panel(thresholds=[0.2],
+                         xlabel="Proportion of individuals with missing SNPs",
+                         ylabel="Number of SNPs",
+                         title="Proportion of missing individuals per SNP \n (> 0.2 are removed)")])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def check_sex_hist(sexcheckfile: str="plink.sexcheck", deferred: bool=False, bins: int=50,
+                   chunksize: int=1000000):
     """Plot histograms of inbreeding coefficents for reported females/males.
 
     Input files should be generated by qc_report.check_sex().
@@ -46,29 +332,37 @@ def check_sex_hist(sexcheckfile: str="plink.sexcheck"):
     --------------
     sexcheckfile: str
         prefix for the plink file containing sex check information
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of histogram bins (F values outside [-1, 1] go to the border bins)
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
-    sexcheck = pd.read_csv(sexcheckfile, delimiter=" ", skipinitialspace=True)
-    females = sexcheck.loc[sexcheck['PEDSEX'] == 2]
-    males = sexcheck.loc[sexcheck['PEDSEX'] == 1]
-
-    fig, ax = plt.subplots(1, 2, figsize=(16,6))
-    females.hist(column='F', ax=ax[0])
-    ax[0].axvline(0.2, c='r', ls='--')
-    ax[0].set_ylabel("Number of Individuals")
-    ax[0].set_xlabel("F Value (X Chr Homozygosity Rates)")
-    ax[0].set_title("Females (> 0.2 are removed)")
-    males.hist(column='F', ax=ax[1])
-    ax[1].axvline(0.8, c='r', ls='--')
-    ax[1].set_ylabel("Number of Individuals")
-    ax[1].set_xlabel("F Value (X Chr Homozygosity Rates)")
-    ax[1].set_title("Males (< 0.8 are removed)")
-    return fig
-
-def maf_hist(maffile: str="MAF_check.frq"):
+    females = StreamingHistogram(-1, 1, bins, clip=True)
+    males = StreamingHistogram(-1, 1, bins, clip=True)
+    for chunk in read_plink_chunks(sexcheckfile, ['PEDSEX', 'F'], chunksize):
+        females.update(chunk.loc[chunk['PEDSEX'] == 2, 'F'])
+        males.update(chunk.loc[chunk['PEDSEX'] == 1, 'F'])
+
+    stats = QCStats("sex_check", [
+        females.panel(thresholds=[0.2],
+                      ylabel="Number of Individuals",
+                      xlabel="F Value (X Chr Homozygosity Rates)",
+                      title="Females (> 0.2 are removed)"),
+        males.panel(thresholds=[0.8],
+                    ylabel="Number of Individuals",
+                    xlabel="F Value (X Chr Homozygosity Rates)",
+                    title="Males (< 0.8 are removed)")])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def maf_hist(maffile: str="MAF_check.frq", deferred: bool=False, bins: int=50,
+             chunksize: int=1000000):
     """Plot histograms of minor allele frequency distributions for SNPs.
 
     Input files should be generated by qc_report.check_sex_report().
@@ -77,20 +371,27 @@ def maf_hist(maffile: str="MAF_check.frq"):
     --------------
     maffile: str
         prefix for the plink file containing MAF information
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of histogram bins
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
-    maf = pd.read_csv(maffile, delimiter=" ", skipinitialspace=True)
-    fig = plt.figure(figsize=(8,6))
-    plt.hist(maf['MAF'])
-    plt.title("MAF Distribution")
-    plt.xlabel("MAF")
-    plt.ylabel("Number of SNPs")
-    return fig
-
-def maf_dropped_hist(maffile: str="MAF_check.frq", threshold: float=0.05):
+    maf = StreamingHistogram(0, 0.5, bins)
+    for chunk in read_plink_chunks(maffile, ['MAF'], chunksize):
+        maf.update(chunk['MAF'])
+    stats = QCStats("maf", [
+        maf.panel(title="MAF Distribution", xlabel="MAF", ylabel="Number of SNPs")])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def maf_dropped_hist(maffile: str="MAF_check.frq", threshold: float=0.05, deferred: bool=False,
+                     bins: int=50, chunksize: int=1000000):
     """Plot histograms of minor allele frequency (MAF) distributions for SNPs
     for specific frequency thresholds.
 
@@ -102,32 +403,35 @@ def maf_dropped_hist(maffile: str="MAF_check.frq", threshold: float=0.05):
         prefix for the plink file containing MAF information
     threshold: float
         MAF threshold
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of histogram bins
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
-
-    maf = pd.read_csv(maffile, delimiter=" ", skipinitialspace=True)
-    rare = maf.loc[maf['MAF'] < threshold]
-
-    fig, ax = plt.subplots(1, 2, figsize=(16,6))
-    maf.hist(column='MAF', ax=ax[0])
-    ax[0].axvline(threshold, c='r', linestyle='--')
-    ax[0].set_title("MAF Distribution of All SNPs\n (< {} are removed)".format(threshold))
-    ax[0].set_xlabel("MAF")
-    ax[0].set_ylabel("Number of SNPs")
-    rare.hist(column='MAF', ax=ax[1])
-    ax[1].axvline(threshold, c='r', linestyle='--')
-    ax[1].set_title("MAF Distribution of SNPs < {}".format(threshold))
-    ax[1].set_xlabel("MAF")
-    ax[1].set_ylabel("Number of SNPs")
-
-    # print("dropped SNPs: ", rare.shape[0])
-    # print("remaining SNPs: ", maf['SNP'].count() - rare['SNP'].count())
-    return fig
-
-def hwe_hist(hwefile: str="plink.hwe", threshold: float=1e-6):
+    maf = StreamingHistogram(0, 0.5, bins)
+    rare = StreamingHistogram(0, threshold, bins)
+    for chunk in read_plink_chunks(maffile, ['MAF'], chunksize):
+        maf.update(chunk['MAF'])
+        rare.update(chunk.loc[chunk['MAF'] < threshold, 'MAF'])
+
+    stats = QCStats("maf_dropped", [
+        maf.panel(thresholds=[threshold],
+                  title="MAF Distribution of All SNPs\n (< {} are removed)".format(threshold),
+                  xlabel="MAF", ylabel="Number of SNPs"),
+        rare.panel(thresholds=[threshold],
+                   title="MAF Distribution of SNPs < {}".format(threshold),
+                   xlabel="MAF", ylabel="Number of SNPs")])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def hwe_hist(hwefile: str="plink.hwe", threshold: float=1e-6, deferred: bool=False,
+             bins: int=50, chunksize: int=1000000):
     """Plot histograms of hardy-weinberg equilibrium (HWE) test p-value distributions
     for SNPs.
 
@@ -139,30 +443,34 @@ def hwe_hist(hwefile: str="plink.hwe", threshold: float=1e-6):
         prefix for the plink file containing HWE information
     threshold: float
         p-value threshold
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of histogram bins
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
-
-    hardy = pd.read_csv(hwefile, delimiter=" ", skipinitialspace=True)
-    zoomhwe = hardy[hardy['P'] < threshold]
-
-    fig, ax = plt.subplots(1, 2, figsize=(16,6))
-    plt.title("HWE Test")
-    hardy.hist(column='P', ax=ax[0])
-    ax[0].axvline(threshold, c='red', ls='--')
-    ax[0].set_xlabel("HWE Exact Test P-Value")
-    ax[0].set_ylabel("Number of SNPs")
-    ax[0].set_title("HWE P-Value Distribution of All SNPs\n (< {} are removed)".format(threshold))
-    zoomhwe.hist(column='P', ax=ax[1])
-    ax[1].set_xlabel("HWE Exact Test P-Value")
-    ax[1].set_ylabel("Number of SNPs")
-    ax[1].set_title("HWE P-Value Distribution of SNPs < {}".format(threshold))
-    ax[1].axvline(threshold, c='red', ls='--')
-    return fig
-
-def het_hist(het_check_df: pd.DataFrame):
+    hardy = StreamingHistogram(0, 1, bins)
+    zoomhwe = StreamingHistogram(0, threshold, bins)
+    for chunk in read_plink_chunks(hwefile, ['P'], chunksize):
+        hardy.update(chunk['P'])
+        zoomhwe.update(chunk.loc[chunk['P'] < threshold, 'P'])
+
+    stats = QCStats("hwe", [
+        hardy.panel(thresholds=[threshold],
+                    xlabel="HWE Exact Test P-Value", ylabel="Number of SNPs",
+                    title="HWE P-Value Distribution of All SNPs\n (< {} are removed)".format(threshold)),
+        zoomhwe.panel(thresholds=[threshold],
+                      xlabel="HWE Exact Test P-Value", ylabel="Number of SNPs",
+                      title="HWE P-Value Distribution of SNPs < {}".format(threshold))])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def het_hist(het_check_df: pd.DataFrame, deferred: bool=False):
     """Plot histogram of heterozygosity rate distributions for all samples.
 
     The input file should be generated by the qc_report.heterozygosity_samples().
@@ -171,264 +479,479 @@ def het_hist(het_check_df: pd.DataFrame):
     --------------
     het_check_df: pd.DataFrame
         pandas dataframe containing heterozygosity information
+    deferred: bool
+        return a QCStats object instead of rendering the figure
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
-
-    fig = plt.figure(figsize=(8,6))
-    plt.hist(het_check_df['het_rate'])
-    plt.axvline(het_check_df['low_limit'][0], c='red', ls='--')
-    plt.axvline(het_check_df['up_limit'][0], c='red', ls='--')
-    plt.xlabel("Heterozygosity Rate")
-    plt.ylabel("Number of Samples")
-    plt.title("Heterozygosity Distribution of All Samples\n (< {:.3f} or > {:.3f} are removed)".format(het_check_df['low_limit'][0], het_check_df['up_limit'][0]))
-    return fig
-
-def relatedness_scatter(relatfile: str):
-    """Plot histogram of heterozygosity rate distributions for all samples.
+    low_limit = het_check_df['low_limit'][0]
+    up_limit = het_check_df['up_limit'][0]
+    stats = QCStats("heterozygosity", [
+        _hist_panel(het_check_df['het_rate'], thresholds=[low_limit, up_limit],
+                    xlabel="Heterozygosity Rate", ylabel="Number of Samples",
+                    title="Heterozygosity Distribution of All Samples\n (< {:.3f} or > {:.3f} are removed)".format(low_limit, up_limit))])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def relatedness_scatter(relatfile: str, deferred: bool=False, bins: int=200,
+                        chunksize: int=1000000):
+    """Plot Z0 vs Z1 values of related (PO) and unrelated (UN) sample pairs.
 
     The input file should be generated by the qc_report.relatedness_check().
+    Pairs are binned on a bins x bins grid chunk by chunk and drawn as a
+    rasterized density image, so the plot does not grow with the number of pairs.
 
     Key arguments:
     --------------
     relatfile: str
         file containing relatedness information
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of bins along each axis
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred), or None if there are no pairs
     """
-    from matplotlib.ticker import FormatStrFormatter
+    density = {'UN': StreamingHistogram2D(bins=bins), 'PO': StreamingHistogram2D(bins=bins)}
+    for chunk in read_plink_chunks(relatfile, ['RT', 'Z0', 'Z1'], chunksize):
+        for label, hist in density.items():
+            pairs = chunk.loc[chunk['RT'] == label]
+            hist.update(pairs['Z0'], pairs['Z1'])
+
+    series = {label: hist.counts for label, hist in density.items() if hist.counts.any()}
+    if not series:
+        return None
+    edges = density['UN'].xedges
+    stats = QCStats("relatedness", [
+        ScatterPanel(series, edges, edges, xlabel="Z0", ylabel="Z1",
+                     title="Z0 vs Z1 Values for Related (PO) and Unrelated (UN) Individuals")])
+    return _finish(stats, deferred)
 
-    relat = pd.read_csv(relatfile, delimiter=" ", skipinitialspace=True)
-    po_z_list = relat.loc[relat['RT'] == "PO"][['Z0', 'Z1']]
-    un_z_list = relat.loc[relat['RT'] == "UN"][['Z0', 'Z1']]
+@tracing.traced("plot")
+def pca_scatter(pcafile: str="pca", deferred: bool=False, bins: int=200):
+    """Plot PC1 vs PC2 of the samples, with the PCA outliers as a separate series.
 
-    fig = plt.figure(figsize=(8,6))
-    if po_z_list.empty and un_z_list.empty:
-        return None
-    elif po_z_list.empty:
-        plt.scatter(x=un_z_list['Z0'], y=un_z_list['Z1'], s=100)
-    elif un_z_list.empty:
-        plt.scatter(x=po_z_list['Z0'], y=po_z_list['Z1'], s=100)
-    else:
-        plt.scatter(x=un_z_list['Z0'], y=un_z_list['Z1'], s=100)
-        plt.scatter(x=po_z_list['Z0'], y=po_z_list['Z1'], s=100)
-    plt.legend(['PO', 'UN'])
-    plt.title("Z0 vs Z1 Values for Related (PO) and Unrelated (UN) Individuals")
-    return fig
+    The input files should be generated by pca.pca() (<pcafile>.eigenvec and
+    <pcafile>.pca_outliers).
 
-def _make_autopct(values: int):
-    """Convert values to percentages.
+    Key arguments:
+    --------------
+    pcafile: str
+        prefix of the PCA output files
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of bins along each axis
+
+    Returns:
+    --------
+    Figure object (QCStats object if deferred)
+    """
+    pcs = pd.read_csv(pcafile + ".eigenvec", delimiter=" ", usecols=['IID', 'PC1', 'PC2'])
+    outliers = pcs['IID'].isin(pd.read_csv(pcafile + ".pca_outliers", delimiter=" ", usecols=['IID'])['IID'])
+    xlim = (pcs['PC1'].min(), pcs['PC1'].max() + 1e-12)
+    ylim = (pcs['PC2'].min(), pcs['PC2'].max() + 1e-12)
+    density = {'Samples': StreamingHistogram2D(xlim, ylim, bins), 'Outliers': StreamingHistogram2D(xlim, ylim, bins)}
+    density['Samples'].update(pcs.loc[~outliers, 'PC1'], pcs.loc[~outliers, 'PC2'])
+    density['Outliers'].update(pcs.loc[outliers, 'PC1'], pcs.loc[outliers, 'PC2'])
+
+    series = {label: hist.counts for label, hist in density.items() if hist.counts.any()}
+    stats = QCStats("pca", [
+        ScatterPanel(series, density['Samples'].xedges, density['Samples'].yedges, xlabel="PC1", ylabel="PC2",
+                     title="Population Structure (PC1 vs PC2, {} outliers)".format(outliers.sum()))])
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def kinship_hist(kinfile: str, threshold: float=0.0884, deferred: bool=False, bins: int=50):
+    """Plot histogram of the kinship of the candidate pairs of the relatedness pre-screen.
+
+    The input file should be generated by relatedness.relatedness_prescreen()
+    (<outfile>.kin0).
 
     Key arguments:
     --------------
-    values: int
-        values to convert
+    kinfile: str
+        file containing the kinship of the candidate pairs
+    threshold: float
+        kinship above which pairs are related
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    bins: int
+        number of bins
 
     Returns:
     --------
-    Function object
+    Figure object (QCStats object if deferred)
     """
-    def my_autopct(pct):
-        total = sum(values)
-        val = int(round(pct*total/100.0))
-        return '{p:.2f}%  ({v:d})'.format(p=pct,v=val)
-    return my_autopct
+    kin = pd.read_csv(kinfile, delimiter=" ", usecols=['KINSHIP'])
+    stats = QCStats("kinship", [
+        _hist_panel(kin['KINSHIP'], bins=bins, thresholds=[threshold], xlabel="Kinship (KING-robust)",
+                    ylabel="Number of Pairs",
+                    title="Kinship of LSH Candidate Pairs\n ({} pairs >= {:.3f})".format(
+                        (kin['KINSHIP'] >= threshold).sum(), threshold))])
+    return _finish(stats, deferred)
 
+class ManhattanPanel:
+    """Thinned points of a Manhattan plot for one panel of a figure.
 
-def write_fail_file(ids_failed: dict, outfile: str="failed_ids"):
-    """Write either failed sample IDs or SNPs to two files.
+    Key arguments:
+    --------------
+    x: np.ndarray
+        genome-wide positions of the points
+    y: np.ndarray
+        -log10 p-values of the points
+    chrom_index: np.ndarray
+        index of the chromosome of each point (used for alternating colours)
+    ticks: list
+        x positions of the chromosome labels
+    labels: list
+        chromosome labels
+    significance: float
+        y position of the genome-wide significance line (-log10 p)
+    title: str
+        panel title
+    """
+    def __init__(self, x, y, chrom_index, ticks: list, labels: list, significance: float=None,
+                 title: str=""):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.chrom_index = np.asarray(chrom_index)
+        self.ticks = list(ticks)
+        self.labels = list(labels)
+        self.significance = significance
+        self.title = title
+
+    def draw(self, ax):
+        colours = np.where(self.chrom_index % 2 == 0, '#1f4e79', '#7fa7cf')
+        ax.scatter(self.x, self.y, c=colours, s=3, linewidths=0, rasterized=True)
+        if self.significance is not None:
+            ax.axhline(self.significance, c='red', ls='--')
+        ax.set_xticks(self.ticks)
+        ax.set_xticklabels(self.labels, fontsize=8)
+        ax.set_xlim(0, max(self.x.max() if len(self.x) else 1, 1))
+        ax.set_ylim(0, None)
+        ax.set_title(self.title)
+        ax.set_xlabel("Chromosome")
+        ax.set_ylabel("-log10(P)")
+
+class QQPanel:
+    """Thinned points of a QQ plot of p-values for one panel of a figure.
 
-    One is a human-readable csv file, the other is a csv file intended to be
-    read into a Pandas DataFrame.
+    Key arguments:
+    --------------
+    expected: np.ndarray
+        expected -log10 p-values under the null
+    observed: np.ndarray
+        observed -log10 p-values
+    lambda_gc: float
+        genomic inflation factor, shown in the panel
+    title: str
+        panel title
+    """
+    def __init__(self, expected, observed, lambda_gc: float=None, title: str=""):
+        self.expected = np.asarray(expected)
+        self.observed = np.asarray(observed)
+        self.lambda_gc = lambda_gc
+        self.title = title
+
+    def draw(self, ax):
+        ax.scatter(self.expected, self.observed, s=3, linewidths=0, rasterized=True)
+        top = max(self.expected.max() if len(self.expected) else 1, 1)
+        ax.plot([0, top], [0, top], c='red', ls='--')
+        if self.lambda_gc is not None:
+            ax.text(0.05, 0.95, f'lambda GC = {self.lambda_gc:.3f}', transform=ax.transAxes,
+                    va='top')
+        ax.set_title(self.title)
+        ax.set_xlabel("Expected -log10(P)")
+        ax.set_ylabel("Observed -log10(P)")
+
+def _chrom_order(chrom: str):
+    """Sort key of plink chromosome codes (1-22, X, Y, XY, MT, then others)."""
+    codes = {'X': 23, 'Y': 24, 'XY': 25, 'MT': 26, 'M': 26}
+    chrom = str(chrom)
+    if chrom.isdigit():
+        return (int(chrom), chrom)
+    return (codes.get(chrom.upper(), 99), chrom)
+
+class StreamingAssocSummary:
+    """Thinned Manhattan/QQ points and genomic inflation of association results, filled chunk by chunk.
+
+    Every variant with a p-value below band is kept exactly. The remaining
+    (null) variants are reduced to the distinct cells of a bp_bin x y_step grid
+    for the Manhattan plot, and to a fine histogram of -log10 p for the QQ plot
+    and lambda GC, so the number of plotted points does not grow with the
+    number of variants.
 
     Key arguments:
     --------------
-    ids_failed: dict
-        dictionary containing sample and SNPS that failed QC
-    outfile: str
-        name of file to write failed samples/SNPs IDs to
+    band: float
+        p-value below which points are kept exactly
+    bp_bin: int
+        width in base pairs of the Manhattan grid cells of null points
+    y_step: float
+        height in -log10 p of the Manhattan grid cells of null points
+    qq_step: float
+        resolution in -log10 p of the QQ plot of null points and of lambda GC
+    """
+    def __init__(self, band: float=1e-4, bp_bin: int=1000000, y_step: float=0.1,
+                 qq_step: float=0.001):
+        self.band_y = -np.log10(band)
+        self.bp_bin = bp_bin
+        self.y_step = y_step
+        self.hist = StreamingHistogram(0, self.band_y, bins=int(np.ceil(self.band_y / qq_step)))
+        self.chroms = {}
+        self.max_bp = np.zeros(0, dtype=np.int64)
+        self.cells = np.zeros((0, 3), dtype=np.int64)
+        self.hits = {'chrom': [], 'bp': [], 'y': []}
+
+    def update(self, chrom, bp, p):
+        """Add a chunk of results (missing p-values are ignored)."""
+        p = np.asarray(p, dtype=float)
+        keep = ~np.isnan(p)
+        bp = np.asarray(bp, dtype=np.int64)[keep]
+        y = -np.log10(np.clip(p[keep], 1e-300, 1))
+        codes, inverse = np.unique(np.asarray(chrom).astype(str)[keep], return_inverse=True)
+        index = np.array([self.chroms.setdefault(str(code), len(self.chroms)) for code in codes],
+                         dtype=np.int64)[inverse]
+        self.max_bp = np.concatenate([self.max_bp, np.zeros(len(self.chroms) - len(self.max_bp),
+                                                             dtype=np.int64)])
+        np.maximum.at(self.max_bp, index, bp)
+        hit = y >= self.band_y
+        self.hits['chrom'].append(index[hit])
+        self.hits['bp'].append(bp[hit])
+        self.hits['y'].append(y[hit])
+        null = ~hit
+        self.hist.update(y[null])
+        # one (chromosome, bp bin, y bin) row per cell, so no bin count can overflow a packed key
+        cells = np.column_stack([index[null], bp[null] // self.bp_bin,
+                                 (y[null] / self.y_step).astype(np.int64)])
+        self.cells = np.unique(np.concatenate([self.cells, cells]), axis=0)
+
+    def _hits(self):
+        return {key: np.concatenate(values) if values else np.zeros(0)
+                for key, values in self.hits.items()}
+
+    @property
+    def n(self):
+        """Number of p-values added."""
+        return int(self.hist.counts.sum()) + sum(len(y) for y in self.hits['y'])
+
+    def lambda_gc(self):
+        """Genomic inflation factor: median 1 df chi-squared statistic over its expected value."""
+        from scipy import stats
+        n = self.n
+        if n == 0:
+            return np.nan
+        half = n / 2
+        cumulative = np.cumsum(self.hist.counts[::-1])[::-1]  # values >= each bin
+        n_hits = n - int(self.hist.counts.sum())
+        if n_hits >= half:
+            median_y = np.sort(self._hits()['y'])[::-1][int(half)]
+        else:
+            # interpolate within the bin where the number of values above reaches n / 2
+            above = cumulative + n_hits
+            i = np.flatnonzero(above >= half)[-1]
+            within = (above[i] - half) / self.hist.counts[i]
+            edges = self.hist.edges
+            median_y = edges[i] + within * (edges[i + 1] - edges[i])
+        return stats.chi2.isf(10 ** -median_y, 1) / stats.chi2.ppf(0.5, 1)
+
+    def manhattan_panel(self, significance: float=5e-8, title: str=""):
+        """Return the thinned points as a ManhattanPanel."""
+        order = sorted(self.chroms, key=_chrom_order)
+        rank = np.zeros(len(self.chroms), dtype=np.int64)
+        rank[[self.chroms[c] for c in order]] = np.arange(len(order))
+        lengths = self.max_bp[[self.chroms[c] for c in order]].astype(float)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])[:-1]
+        offset_of = np.zeros(len(self.chroms))
+        offset_of[[self.chroms[c] for c in order]] = offsets
+        hits = self._hits()
+        hit_index = hits['chrom'].astype(np.int64)
+        cell_index = self.cells[:, 0]
+        cell_bp = self.cells[:, 1] * self.bp_bin + self.bp_bin / 2
+        cell_y = (self.cells[:, 2] + 0.5) * self.y_step
+        x = np.concatenate([offset_of[cell_index] + cell_bp, offset_of[hit_index] + hits['bp']])
+        y = np.concatenate([cell_y, hits['y']])
+        chrom_index = rank[np.concatenate([cell_index, hit_index])]
+        return ManhattanPanel(x, y, chrom_index, offsets + lengths / 2, order,
+                              significance=-np.log10(significance), title=title)
+
+    def qq_panel(self, title: str=""):
+        """Return the thinned points (exact hits and one point per histogram bin) as a QQPanel."""
+        n = self.n
+        observed_hits = np.sort(self._hits()['y'])[::-1]
+        ranks = np.arange(1, len(observed_hits) + 1)
+        counts = self.hist.counts[::-1]
+        centres = ((self.hist.edges[:-1] + self.hist.edges[1:]) / 2)[::-1]
+        # mid rank of the values of each bin, continuing after the hits
+        bin_ranks = len(observed_hits) + np.cumsum(counts) - (counts - 1) / 2
+        nonzero = counts > 0
+        expected = -np.log10((np.concatenate([ranks, bin_ranks[nonzero]]) - 0.5) / max(n, 1))
+        observed = np.concatenate([observed_hits, centres[nonzero]])
+        return QQPanel(expected, observed, lambda_gc=self.lambda_gc(), title=title)
+
+def read_assoc_chunks(assocfile: str, columns: list, chunksize: int=1000000):
+    """Read selected columns of association results in chunks.
+
+    Key arguments:
+    --------------
+    assocfile: str
+        plink association report (e.g. .assoc, .assoc.logistic), a .parquet or
+        .csv table written by native_assoc, or a results store directory
+        written by association.perform_sharded_assoc
+    columns: list
+        columns to read
+    chunksize: int
+        number of rows per chunk
 
     Returns:
     --------
+    iterator of pd.DataFrame chunks
+    """
+    if os.path.isdir(assocfile):
+        from .assoc_store import read_index
+        for path in read_index(assocfile)['PATH']:
+            yield from read_assoc_chunks(os.path.join(assocfile, path), columns, chunksize)
+    elif assocfile.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(assocfile).iter_batches(batch_size=chunksize, columns=columns):
+            tracing.add_rows(batch.num_rows)
+            yield batch.to_pandas()
+    elif assocfile.endswith(".csv"):
+        for chunk in pd.read_csv(assocfile, usecols=columns, chunksize=chunksize):
+            tracing.add_rows(len(chunk))
+            yield chunk
+    else:
+        yield from read_plink_chunks(assocfile, columns, chunksize)
+
+@tracing.traced("plot")
+def summarize_assoc(assocfile: str, band: float=1e-4, bp_bin: int=1000000, y_step: float=0.1,
+                    chunksize: int=1000000):
+    """Read association results once into a StreamingAssocSummary.
 
+    Key arguments:
+    --------------
+    assocfile: str
+        association results (see read_assoc_chunks)
+    band: float
+        p-value below which points are plotted exactly
+    bp_bin: int
+        width in base pairs of the grid cells null points are thinned to
+    y_step: float
+        height in -log10 p of the grid cells null points are thinned to
+    chunksize: int
+        number of rows read at a time
+
+    Returns:
+    --------
+    StreamingAssocSummary object
     """
+    summary = StreamingAssocSummary(band=band, bp_bin=bp_bin, y_step=y_step)
+    for chunk in read_assoc_chunks(assocfile, ['CHR', 'BP', 'P'], chunksize):
+        summary.update(chunk['CHR'], chunk['BP'], pd.to_numeric(chunk['P'], errors='coerce'))
+    return summary
 
-    hr = filename + "_hr.csv"
-    pr = filename + "_pr.csv"
-    with open(hr, "w") as f:
-        for k,v in ids_failed.items():
-            f.write(str(k) + ": " + str(v) + "\n")
-    pd.DataFrame.from_dict(data=ids_failed, orient='index').to_csv(pr, header=True)
+@tracing.traced("plot")
+def manhattan_plot(assocfile: str, significance: float=5e-8, band: float=1e-4,
+                   deferred: bool=False, chunksize: int=1000000):
+    """Plot a Manhattan plot of association results.
 
-def _sample_failed_report(imissfile: str="plink.imiss", lmissfile: str="plink.lmiss",
-                         sexcheckfile: str="plink.sexcheck",
-                         hetfailedfile: str="het_fail_ind.txt",
-                         ibdfile: str="pihat_min0.2_in_founders.genome",
-                         write: bool=True):
-    """Write report of all samples that failed the sample QC checks.
+    Variants with a p-value below band are drawn exactly; the others are
+    thinned to one point per grid cell, and points are rasterized.
 
     Key arguments:
     --------------
-    imissfile: str
-        file containing sample missingness information
-    lmissfile: str
-        file containing SNP missingness information
-    sexcheckfile: str
-        file containing sex discrepancy information
-    hetfailedfile: str
-        file containing heterozygosity information
-    ibdfile: str
-        file containing cryptic relatedness information (IBD check)
-    write: bool
-        option to write out ID of samples that failed QC
+    assocfile: str
+        association results (see read_assoc_chunks)
+    significance: float
+        genome-wide significance threshold drawn as a line
+    band: float
+        p-value below which points are plotted exactly
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
+    summary = summarize_assoc(assocfile, band=band, chunksize=chunksize)
+    stats = QCStats("manhattan", [summary.manhattan_panel(significance, title="Manhattan Plot")],
+                    figsize=(16, 6))
+    return _finish(stats, deferred)
 
-    ids = {}
-    ids_list = []
-
-    # SNP missingness
-    imiss = pd.read_csv(imissfile,  delimiter=" ", skipinitialspace=True)
-    lmiss = pd.read_csv(lmissfile,  delimiter=" ", skipinitialspace=True)
-    ind_missing_filtered = calculate_missingness(imiss, 'F_MISS', 0.2)
-    missing_ids = get_sample_ids(imiss, 'IID', ind_missing_filtered)
-
-    ids['missing'] = missing_ids.tolist()
-    ids_list.append(missing_ids.tolist())
-
-    # mismatched sex
-    sex = pd.read_csv("plink.sexcheck", delimiter=" ", skipinitialspace=True)
-    sex_mismatches = sex.loc[sex['STATUS'] == "PROBLEM"]
-    sex_mismatches_counts = sex['STATUS'].value_counts()
-    sex_mismatches_ids = sex_mismatches['IID'].tolist()
-
-    ids['sex_mismatches'] = sex_mismatches_ids
-    ids_list.append(sex_mismatches_ids)
-
-    # outlying heterozygosity
-    het_failed = pd.read_csv("het_fail_ind.txt", delimiter=" ")
-    het_failed_ids = het_failed['IID'].tolist()
-
-    ids['het_failed'] = het_failed_ids
-    ids_list.append(het_failed_ids)
-
-    # high IBD - pi_hat threshold
-    ibd = pd.read_csv("pihat_min0.2_in_founders.genome", delimiter=" ", skipinitialspace=True)
-    ibd_ids = ibd['IID1'].tolist()
-
-    ids['relatedness_failed'] = ibd_ids
-    ids_list.append(ibd_ids)
-
-    # graph everything
-    tests = ['SNP Missingness', 'Sex Mismatches', 'Outlying Heterozygosity', 'Cryptic Relatedness']
-    fail_counts = [len(missing_ids), len(sex_mismatches_ids), len(het_failed_ids), len(ibd_ids)]
-    total_fails = set(x for l in ids_list for x in l)
-    print("total samples failed: {}/{}".format(len(total_fails), imiss.shape[0]))
-
-    fig = plt.figure(figsize=(8,6))
-    plt.tight_layout()
-    plt.bar(x=tests, height=fail_counts)
-    plt.title("Samples failing QC checks (total: {}/{})".format(len(total_fails), imiss.shape[0]))
-    plt.xlabel("QC Test")
-    plt.ylabel("Number of samples")
-    plt.tick_params(axis='x', rotation=90)
-
-    if write:
-        write_fail_file(ids, "failed_sample_ids")
-    return fig
-
-def _snps_failed_report(write: bool=False, miss_threshold: float=0.2,
-                      maf_threshold: float=0.00001, hwe_threshold: float=1e-6,
-                      lmissfile: str="plink.lmiss", maffile: str="MAF_check.frq",
-                      hwefile: str="plink.hwe"):
-    """Write report of all SNPs that failed QC checks.
+@tracing.traced("plot")
+def qq_plot(assocfile: str, band: float=1e-4, deferred: bool=False, chunksize: int=1000000):
+    """Plot a QQ plot of association p-values, annotated with the genomic inflation factor.
 
     Key arguments:
     --------------
-    write: bool
-        option to write failed SNPs to file
-    miss_threshold: float
-        missingness rate threshold for filtering out SNPs
-    maf_threshold: float
-        MAF threshold for filtering out SNPs
-    hwe_threshold: float
-        HWE threshold for filtering out SNPs
-    lmissfile: str
-        file containing missingness information for SNPs
-    maffile: str
-        file containing MAF information for SNPs
-    hwefile: str
-        file containing HWE information for SNPs
+    assocfile: str
+        association results (see read_assoc_chunks)
+    band: float
+        p-value below which points are plotted exactly
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
-    Figure object
+    Figure object (QCStats object if deferred)
     """
-    snps = {}
-    ids_list = []
-    lmiss = pd.read_csv(lmiss_file, delimiter=" ", skipinitialspace=True)
-
-    missing_snps = lmiss.loc[lmiss['F_MISS'] > miss_threshold]
-    snps['missing_snps'] = missing_snps['SNP'].tolist()
-    ids_list.append(missing_snps['SNP'].tolist())
-    # print("total missing snps failed: ", len(missing_snps['SNP'].tolist()))
-
-    # MAF
-    maf = pd.read_csv(maf_file, delimiter=" ", skipinitialspace=True)
-    rare = maf.loc[maf['MAF'] < maf_threshold]
-    snps['maf'] = rare['SNP'].tolist()
-    ids_list.append(rare['SNP'].tolist())
-    # print("total maf snps failed: ", len(rare['SNP'].tolist()))
-
-    # HWE departures
-    hardy = pd.read_csv(hwe_file, delimiter=" ", skipinitialspace=True)
-    hwe_failed = hardy.loc[hardy['P'] < hwe_threshold]
-    snps['hwe'] = hwe_failed['SNP'].tolist()
-    ids_list.append(hwe_failed['SNP'].tolist())
-    # print("total hwe snps failed: ", len(hwe_failed['SNP'].tolist()))
-
-    # graph everything
-    tests = ['SNP Missingness', 'Minor Allele Frequency', 'Outlying HWE']
-    fail_counts = [len(missing_snps['SNP'].tolist()), len(rare['SNP'].tolist()), len(hwe_failed['SNP'].tolist())]
-    total_fails = set(x for l in ids_list for x in l)
-    # print("total fails: ", len(total_fails))
-
-    fig = plt.figure(figsize=(8,6))
-    plt.tight_layout()
-    plt.bar(x=tests, height=fail_counts)
-    plt.title("SNPs failing QC checks (total: {}/{})".format(len(total_fails), lmiss.shape[0]))
-    plt.xlabel("QC Test")
-    plt.ylabel("Number of SNPs")
-    plt.tick_params(axis='x', rotation=90)
-
-    if write:
-        write_fail_file(snps, "failed_snps_ids")
-
-    return fig
-
-def save_pdf(bfile: str, plots: list):
-    """Write a list of matplotlib Figure objects to a pdf file.
+    summary = summarize_assoc(assocfile, band=band, chunksize=chunksize)
+    stats = QCStats("qq", [summary.qq_panel(title="QQ Plot")], figsize=(6, 6))
+    return _finish(stats, deferred)
+
+@tracing.traced("plot")
+def manhattan_qq_plot(assocfile: str, significance: float=5e-8, band: float=1e-4,
+                      deferred: bool=False, chunksize: int=1000000):
+    """Plot the Manhattan and QQ plots of association results from a single pass over the file.
 
     Key arguments:
     --------------
-    bfile: str
-        prefix for input bfile to perform QC on
-    plots: list
-        list containing plots generated by the qc_plot module
+    assocfile: str
+        association results (see read_assoc_chunks)
+    significance: float
+        genome-wide significance threshold drawn as a line
+    band: float
+        p-value below which points are plotted exactly
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    chunksize: int
+        number of rows read at a time
 
     Returns:
     --------
+    Figure object (QCStats object if deferred)
     """
+    summary = summarize_assoc(assocfile, band=band, chunksize=chunksize)
+    stats = QCStats("manhattan_qq", [summary.manhattan_panel(significance, title="Manhattan Plot"),
+                                     summary.qq_panel(title="QQ Plot")], figsize=(22, 6))
+    return _finish(stats, deferred)
+
+def _make_autopct(values: int):
+    """Convert values to percentages.
+
+    Key arguments:
+    --------------
+    values: int
+        values to convert
 
-    title = infile + "_qc_report.pdf"
+    Returns:
+    --------
+    Function object
+    """
+    def my_autopct(pct):
+        total = sum(values)
+        val = int(round(pct*total/100.0))
+        return '{p:.2f}%  ({v:d})'.format(p=pct,v=val)
+    return my_autopct
 
-    with PdfPages(title) as pdf:
-        for plot in plots:
-            pdf.savefig(plot)
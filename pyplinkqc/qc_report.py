@@ -2,11 +2,21 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-rcParams.update({'figure.autolayout': True})
-from matplotlib.backends.backend_pdf import PdfPages
 from .run_plink import run_plink
+from .qc_plot import get_pyplot, get_pdf_pages, QCStats, BarPanel
+from .qc_ledger import FailureLedger
+from .id_index import IDIndex
+from .plink_log import PlinkLog, removed_counts
+from . import tracing
+
+# .log files of the plink runs of the QC filters (default output prefixes of
+# qc_snps and qc_samples), in pipeline order
+SNP_FILTER_LOGS = {'Missing SNPs': "snp_missingness_filtered.log", 'MAF': "maf_filtered.log",
+                   'Outlying HWE': "hwe_filtered.log"}
+SAMPLE_FILTER_LOGS = {'SNP Missingness': "sample_missingness_filtered.log",
+                      'Sex Mismatches': "sex_discrepancy_filtered.log",
+                      'Outlying Heterozygosity': "heterozygosity_filtered.log",
+                      'Cryptic Relatedness': "relatedness_filtered.log"}
 
 # analysis functions
 def calculate_missingness(df: pd.DataFrame, column: str, threshold: float):
@@ -46,9 +56,11 @@ def get_sample_ids(df: pd.DataFrame, column: str, filtered: pd.DataFrame):
     ids: pd.DataFrame
         filtered pandas dataframe
     """
-    ids = df[~df[column].isin(filtered[column].tolist())][column]
+    # isin hashes the filtered IDs once, and allows repeated IDs
+    ids = df.loc[~df[column].isin(filtered[column].to_numpy()), column]
     return ids
 
+@tracing.traced("parse")
 def heterozygosity_samples(infile: str, outfile: str):
     """Filter samples based on heterozygosity rates.
 
@@ -66,6 +78,7 @@ def heterozygosity_samples(infile: str, outfile: str):
     """
     #infile should be the het_check.het file from the heterozygosity_report function
     het_check = pd.read_csv(infile, delimiter=" ", skipinitialspace=True)
+    tracing.add_rows(len(het_check))
     het_check['het_rate'] = (het_check['N(NM)'] - het_check['O(HOM)']) / het_check['N(NM)']
     het_check['low_limit'] = het_check['het_rate'].mean() - (3 * het_check['het_rate'].std())
     het_check['up_limit'] = het_check['het_rate'].mean() + (3 * het_check['het_rate'].std())
@@ -91,19 +104,29 @@ def missingness(bfile: str, outfile: str):
     # os.system(command)
     run_plink(bfile, '--missing', f'--out {outfile}', make_bed=False)
 
-def run_check_sex(bfile: str):
+def run_check_sex(bfile: str, outfile: str="plink", native: bool=False):
     """Run sex check command.
 
     Key arguments:
     --------------
     bfile: str
         prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        prefix for the .sexcheck file
+    native: bool
+        compute the check in-process from the X chromosome rows of the .bed
+        file (see sex_check.check_sex) instead of running plink
 
     Returns:
     --------
     """
-    run_plink(bfile, '--check-sex')
+    if native:
+        from .sex_check import check_sex as native_check_sex
+        native_check_sex(bfile, outfile)
+    else:
+        run_plink(bfile, '--check-sex', f'--out {outfile}', make_bed=False)
 
+@tracing.traced("parse")
 def check_sex(sexcheckfile: str="plink.sexcheck"):
     """Generate sex check report.
 
@@ -118,6 +141,7 @@ def check_sex(sexcheckfile: str="plink.sexcheck"):
         contains individuals with sex discrepancies
     """
     sexcheck = pd.read_csv(sexcheckfile, delimiter=" ", skipinitialspace=True)
+    tracing.add_rows(len(sexcheck))
     problems = sexcheck.loc[sexcheck['STATUS'] == "PROBLEM"]
     problems[['FID', 'IID']].to_csv("sex_discrepancy.txt", index=None, sep=' ')
     return problems
@@ -212,6 +236,7 @@ def relatedness_check(bfile: str, indep_snp_file: str, outfile: str, threshold:
     # os.system(command)
     run_plink(bfile, f'--extract {indep_snp_file}', f'--genome', f'--min {threshold}', f'--out {outfile}')
 
+@tracing.traced("parse")
 def relatives_low_call_rate(imissfile: str, relatfile: str, outfile: str):
     """Identify related samples with low genotyping call rates.
 
@@ -230,63 +255,187 @@ def relatives_low_call_rate(imissfile: str, relatfile: str, outfile: str):
     imissfile = imissfile + ".imiss"
     imiss = pd.read_csv(imissfile, delimiter=" ", skipinitialspace=True)
     relat = pd.read_csv(relatfile, delimiter=" ", skipinitialspace=True)
-    fid_first_list = relat['IID1'].tolist()
-    fid_second_list = relat['IID2'].tolist()
-    relat_miss1 = relat.set_index('IID1').join(imiss.set_index('IID')[['F_MISS']])
-    relat_miss2 = relat_miss1.rename_axis('IID1').reset_index().set_index('IID2').join(imiss.set_index('IID')[['F_MISS']], rsuffix="_2").rename_axis('IID2').reset_index()
-    ids = np.where(relat_miss2['F_MISS']>relat_miss2['F_MISS_2'], relat_miss2['IID1'], relat_miss2['IID2'])
-    # first_selected = imiss[imiss['IID'].isin(fid_first_list)].reset_index(drop=True)
-    # second_selected = imiss[imiss['IID'].isin(fid_second_list)].reset_index(drop=True)
-    # selected = np.where(first_selected['F_MISS'] > second_selected['F_MISS'],first_selected[['FID', 'IID']],
-    #                 second_selected[['FID', 'IID']])
-    selected = imiss.loc[imiss['IID'].isin(ids)][['FID', 'IID']]
-    np.savetxt(outfile, selected, delimiter=' ',  fmt='%d %s')
+    tracing.add_rows(len(imiss) + len(relat))
+    index = IDIndex(imiss['FID'], imiss['IID'])
+    # match on FID and IID when the relatedness file has them, as an IID may repeat across families
+    has_fids = {'FID1', 'FID2'} <= set(relat.columns)
+    first = index.sample_positions(relat['IID1'], relat['FID1'] if has_fids else None)
+    second = index.sample_positions(relat['IID2'], relat['FID2'] if has_fids else None)
+    f_miss = np.append(imiss['F_MISS'].to_numpy(), -np.inf)
+    # remove the member of each pair with the higher missingness
+    # (position -1, i.e. a sample missing from imissfile, indexes the -inf sentinel)
+    ids = np.where(f_miss[first] > f_miss[second], first, second)
+    selected = imiss.iloc[np.unique(ids[ids >= 0])][['FID', 'IID']]
+    selected.to_csv(outfile, sep=' ', index=False, header=False)
     return selected
 
-def write_fail_file(ids_failed: dict, outfile: str="failed_ids"):
+@tracing.traced("report")
+def write_fail_file(ids_failed, outfile: str="failed_ids"):
     """Write either failed sample IDs or SNPs to two files.
 
-    One is a human-readable csv file, the other is a csv file intended to be read into a Pandas DataFrame.
+    One is a human-readable file (<outfile>_hr.csv) with the number of failures
+    per test, the other is a long-format csv table (<outfile>_pr.csv) with one
+    row per failed ID and test (ID and TEST columns), intended to be read into a
+    Pandas DataFrame.
 
     Key arguments:
     --------------
-    ids_failed: dict
-        dictionary containing IDs of samples that failed QC
+    ids_failed: FailureLedger or dict
+        ledger of samples/SNPs that failed QC, or dictionary mapping test names
+        to lists of failed IDs
     outfile: str
         name of output file
 
     Returns:
     --------
     """
+    if isinstance(ids_failed, dict):
+        ledger = FailureLedger(np.concatenate([np.asarray(v, dtype=object) for v in ids_failed.values()] or [[]]))
+        for test, failed in ids_failed.items():
+            ledger.add_ids(test, failed)
+        ids_failed = ledger
     hr = outfile + "_hr.csv"
-    pr = outfile + "_pr.csv"
     with open(hr, "w") as f:
-        for k,v in ids_failed.items():
+        for k,v in ids_failed.counts().items():
             f.write(str(k) + ": " + str(v) + "\n")
-    pd.DataFrame.from_dict(data=ids_failed, orient='index').to_csv(pr, header=True)
+        f.write("Total: {}/{}\n".format(ids_failed.total_failed(), len(ids_failed)))
+    ids_failed.write(outfile + "_pr")
+
+@tracing.traced("pdf")
+def _render_page(plot, page_file: str, dpi: int):
+    """Render one report page to its own file (run in a worker process).
+
+    Key arguments:
+    --------------
+    plot: object
+        Figure or QCStats object
+    page_file: str
+        file to write the page to (.png or .pdf)
+    dpi: int
+        resolution of the page
+
+    Returns:
+    --------
+    page_file: str
+        file the page was written to
+    """
+    plt = get_pyplot()
+    fig = plot.render() if isinstance(plot, QCStats) else plot
+    fig.savefig(page_file, dpi=dpi)
+    plt.close(fig)
+    return page_file
+
+def _have_pypdf():
+    """Check whether pypdf (needed to merge vector pages) is installed."""
+    import importlib.util
+    return importlib.util.find_spec("pypdf") is not None
 
-def save_pdf(outfile: str, figs: list):
+def _merge_pages(title: str, page_files: list, dpi: int):
+    """Merge rendered pages, in order, into a single pdf file.
+
+    PNG pages are embedded as full-page images with the PdfPages writer. PDF
+    pages are concatenated with pypdf.
+
+    Key arguments:
+    --------------
+    title: str
+        name of the merged pdf file
+    page_files: list
+        rendered page files in report order
+    dpi: int
+        resolution the pages were rendered at
+    """
+    if all(page.endswith(".pdf") for page in page_files):
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for page in page_files:
+            writer.append(page)
+        with open(title, "wb") as f:
+            writer.write(f)
+        return
+
+    from matplotlib.image import imread
+    PdfPages = get_pdf_pages()
+    plt = get_pyplot()
+    with PdfPages(title) as pdf:
+        for page in page_files:
+            img = imread(page)
+            fig = plt.figure(figsize=(img.shape[1] / dpi, img.shape[0] / dpi), dpi=dpi)
+            fig.figimage(img)
+            pdf.savefig(fig, dpi=dpi)
+            plt.close(fig)
+
+@tracing.traced("pdf")
+def save_pdf(outfile: str, figs: list, processes: int=None, page_format: str="pdf",
+             dpi: int=150):
     """Write a list of matplotlib Figure objects to a pdf file in the current working directory.
 
+    QCStats objects (returned by the QC checks in deferred mode) are rendered
+    one at a time and their figures are closed as soon as they are written.
+    None entries (checks that produced no plot) are skipped.
+
+    With processes set, every page is rendered by a pool of worker processes into
+    its own single-page file, and the pages are merged into the report in the
+    order of figs. Vector (pdf) pages are merged with pypdf (pip install
+    pyplinkqc[pdf]); without it the report is rendered serially, so that it
+    is not rasterized.
 
     Key arguments:
     --------------
     outfile: str
         name to write PDF file to
     figs: list
-        list of Figure objects to be written to PDF file
+        list of Figure or QCStats objects to be written to PDF file
+    processes: int
+        number of worker processes used to render pages (default: render serially)
+    page_format: str
+        format of the pages rendered by the workers: "pdf" (vector pages,
+        merged with pypdf) or "png" (raster pages, merged with PdfPages)
+    dpi: int
+        resolution of the pages rendered by the workers
 
     Returns:
     --------
     """
 
     title = outfile + "_report.pdf"
-
+    figs = [plot for plot in figs if plot is not None]
+
+    page_formats = ["pdf", "png"]
+    if page_format not in page_formats:
+        raise ValueError(f'{page_format} not a valid choice, please choose from {page_formats}')
+    if processes and page_format == "pdf" and not _have_pypdf():
+        print("pypdf is not installed, rendering the report pages serially")
+        processes = None
+
+    if processes:
+        from concurrent.futures import ProcessPoolExecutor
+        import tempfile
+        import shutil
+        page_dir = tempfile.mkdtemp(prefix=os.path.basename(outfile) + "_pages_",
+                                    dir=os.path.dirname(os.path.abspath(title)))
+        try:
+            page_files = [os.path.join(page_dir, f'page_{i:05d}.{page_format}') for i in range(len(figs))]
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                page_files = list(pool.map(_render_page, figs, page_files, [dpi] * len(figs)))
+            _merge_pages(title, page_files, dpi)
+        finally:
+            shutil.rmtree(page_dir, ignore_errors=True)
+        return
+
+    PdfPages = get_pdf_pages()
+    plt = get_pyplot()
     with PdfPages(title) as pdf:
         for plot in figs:
-            pdf.savefig(plot)
-
-def snps_failed(write: bool=False, miss_threshold: float=0.2, maf_threshold: float=0.01, hwe_threshold: float=1e-6, lmiss_file: str="plink.lmiss", maf_file: str="MAF_check.frq", hwe_file: str="plink.hwe"):
+            if isinstance(plot, QCStats):
+                fig = plot.render()
+                pdf.savefig(fig)
+                plt.close(fig)
+            else:
+                pdf.savefig(plot)
+
+@tracing.traced("parse")
+def snps_failed(write: bool=False, miss_threshold: float=0.2, maf_threshold: float=0.01, hwe_threshold: float=1e-6, lmiss_file: str="plink.lmiss", maf_file: str="MAF_check.frq", hwe_file: str="plink.hwe", deferred: bool=False):
     """Write report for SNPs that failed QC.
 
     Key arguments:
@@ -308,61 +457,54 @@ def snps_failed(write: bool=False, miss_threshold: float=0.2, maf_threshold: flo
     hwe_file: str
         file containing SNPs with outlying HWE
         (generated by check_hwe function)
+    deferred: bool
+        return a QCStats object instead of rendering the figure
 
     Returns:
     --------
+    Figure object (QCStats object if deferred)
     """
-    snps = {}
-    ids_list = []
+    ledger = FailureLedger([])
 
     if lmiss_file != "":
         # SNP missingness
-        lmiss = pd.read_csv(lmiss_file, delimiter=" ", skipinitialspace=True)
-        missing_snps = lmiss.loc[lmiss['F_MISS'] > miss_threshold]
-        snps['Missing SNPs'] = missing_snps['SNP'].tolist()
-        ids_list.append(missing_snps['SNP'].tolist())
-        print("total missing snps failed: ", len(missing_snps['SNP'].tolist()))
+        lmiss = pd.read_csv(lmiss_file, delimiter=" ", skipinitialspace=True, usecols=['SNP', 'F_MISS'])
+        tracing.add_rows(len(lmiss))
+        ledger = FailureLedger(lmiss['SNP'])
+        ledger.add_mask('Missing SNPs', (lmiss['F_MISS'] > miss_threshold).to_numpy())
 
     if maf_file != "":
         # Outlying MAF
-        maf = pd.read_csv(maf_file, delimiter=" ", skipinitialspace=True)
-        rare = maf.loc[maf['MAF'] < maf_threshold]
-        snps['MAF'] = rare['SNP'].tolist()
-        ids_list.append(rare['SNP'].tolist())
-        print("total maf snps failed: ", len(rare['SNP'].tolist()))
+        maf = pd.read_csv(maf_file, delimiter=" ", skipinitialspace=True, usecols=['SNP', 'MAF'])
+        tracing.add_rows(len(maf))
+        ledger.add_ids('MAF', maf.loc[maf['MAF'] < maf_threshold, 'SNP'])
 
     if hwe_file != "":
         # Outlying HWE
-        hardy = pd.read_csv(hwe_file, delimiter=" ", skipinitialspace=True)
-        hwe_failed = hardy.loc[hardy['P'] < hwe_threshold]
-        snps['Outlying HWE'] = hwe_failed['SNP'].tolist()
-        ids_list.append(hwe_failed['SNP'].tolist())
-        print("total hwe snps failed: ", len(hwe_failed['SNP'].tolist()))
-
-    #tests = ['SNP Missingness', 'Minor Allele Frequency', 'Outlying HWE']
-    fail_counts = [len(vals) for key,vals in snps.items()]
-    #total_fails = set(x for l in ids_list for x in l)
-    total_fails = sum(fail_counts)
-    print("total snps failed: {}/{}".format(total_fails, lmiss.shape[0]))
-    # fail_counts = [len(missing_snps['SNP'].tolist()), len(rare['SNP'].tolist()), len(hwe_failed['SNP'].tolist())]
-    # total_fails = set(x for l in ids_list for x in l)
-    # print("total fails: ", len(total_fails))
-
-    fig = plt.figure(figsize=(8,6))
-    plt.tight_layout()
-    plt.bar(x=list(snps.keys()), height=fail_counts)
-    plt.title("SNPs failing QC checks (total: {}/{})".format(total_fails, lmiss.shape[0]))
-    plt.xlabel("QC Test")
-    plt.ylabel("Number of SNPs")
-    plt.tick_params(axis='x', rotation=90)
+        hardy = pd.read_csv(hwe_file, delimiter=" ", skipinitialspace=True, usecols=['SNP', 'P'])
+        tracing.add_rows(len(hardy))
+        ledger.add_ids('Outlying HWE', hardy.loc[hardy['P'] < hwe_threshold, 'SNP'])
+
+    fail_counts = ledger.counts()
+    for test, count in fail_counts.items():
+        print("total {} snps failed: {}".format(test, count))
+    total_fails = ledger.total_failed()
+    print("total snps failed: {}/{}".format(total_fails, len(ledger)))
+
+    stats = QCStats("snps_failed", [
+        BarPanel(list(fail_counts.keys()), list(fail_counts.values()), xlabel="QC Test", ylabel="Number of SNPs",
+                 title="SNPs failing QC checks (total: {}/{})".format(total_fails, len(ledger)))])
 
     if write:
-        write_fail_file(snps, "failed_snps_ids")
+        write_fail_file(ledger, "failed_snps_ids")
 
-    return fig
+    if deferred:
+        return stats
+    return stats.render()
 
 
-def samples_failed(write: bool=True, miss_threshold: float=0.2, imiss_file: str="plink.imiss", lmiss_file: str="plink.lmiss", sexcheck_file: str="plink.sexcheck", het_failed_file: str="heterozygosity_failed.txt", ibd_file: str="pihat_min0.2.genome"):
+@tracing.traced("parse")
+def samples_failed(write: bool=True, miss_threshold: float=0.2, imiss_file: str="plink.imiss", lmiss_file: str="plink.lmiss", sexcheck_file: str="plink.sexcheck", het_failed_file: str="heterozygosity_failed.txt", ibd_file: str="pihat_min0.2.genome", deferred: bool=False, pca_outliers_file: str=""):
     """Write report for samples that failed QC.
 
     Key arguments:
@@ -385,66 +527,131 @@ def samples_failed(write: bool=True, miss_threshold: float=0.2, imiss_file: str=
     ibdfile: str
         file containing ibc coefficients for samples
         (generated by check_cryptic_relatedness function)
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+    pca_outliers_file: str
+        file containing samples that are population structure outliers
+        (<outfile>.pca_outliers generated by pca.pca function; not checked if empty)
 
     Returns:
     --------
+    Figure object (QCStats object if deferred)
     """
-    ids = {}
-    ids_list = []
+    ledger = FailureLedger([])
 
     if imiss_file != "":
         # SNP missingness
-        imiss = pd.read_csv(imiss_file,  delimiter=" ", skipinitialspace=True)
-        lmiss = pd.read_csv(lmiss_file,  delimiter=" ", skipinitialspace=True)
-        ind_missing_filtered = calculate_missingness(imiss, 'F_MISS', miss_threshold)
-        missing_ids = get_sample_ids(imiss, 'IID', ind_missing_filtered)
-
-        ids['SNP Missingness'] = missing_ids.tolist()
-        ids_list.append(missing_ids.tolist())
+        imiss = pd.read_csv(imiss_file,  delimiter=" ", skipinitialspace=True, usecols=['IID', 'F_MISS'])
+        tracing.add_rows(len(imiss))
+        ledger = FailureLedger(imiss['IID'])
+        ledger.add_mask('SNP Missingness', (imiss['F_MISS'] >= miss_threshold).to_numpy())
 
     if sexcheck_file != "":
         # mismatched sex
-        sex = pd.read_csv(sexcheck_file, delimiter=" ", skipinitialspace=True)
-        sex_mismatches = sex.loc[sex['STATUS'] == "PROBLEM"]
-        sex_mismatches_counts = sex['STATUS'].value_counts()
-        print("total sex mismatches: ", sex_mismatches.shape[0])
-        sex_mismatches_ids = sex_mismatches['IID'].tolist()
-
-        ids['Sex Mismatches'] = sex_mismatches_ids
-        ids_list.append(sex_mismatches_ids)
+        sex = pd.read_csv(sexcheck_file, delimiter=" ", skipinitialspace=True, usecols=['IID', 'STATUS'])
+        tracing.add_rows(len(sex))
+        ledger.add_ids('Sex Mismatches', sex.loc[sex['STATUS'] == "PROBLEM", 'IID'])
 
     if het_failed_file != "":
         # outlying heterozygosity
-        het_failed = pd.read_csv(het_failed_file, delimiter=" ")
-        het_failed_ids = het_failed['IID'].tolist()
-        print("total het failed mismatches: ", len(het_failed_ids))
-
-        ids['Outlying Heterozygosity'] = het_failed_ids
-        ids_list.append(het_failed_ids)
+        het_failed = pd.read_csv(het_failed_file, delimiter=" ", usecols=['IID'])
+        tracing.add_rows(len(het_failed))
+        ledger.add_ids('Outlying Heterozygosity', het_failed['IID'])
 
     if ibd_file != "":
         # high IBD - pi_hat threshold
-        ibd = pd.read_csv(ibd_file, delimiter=" ", skipinitialspace=True)
-        print("total ibd failures: ", ibd.shape[0])
-        ibd_ids = ibd['IID1'].tolist()
-        ids['Cryptic Relatedness'] = ibd_ids
-        ids_list.append(ibd_ids)
-
-    fail_counts = [len(vals) for key,vals in ids.items()]
-    #total_fails = set(x for l in ids_list for x in l)
-    total_fails = sum(fail_counts)
-    print("total samples failed: {}/{}".format(total_fails, imiss.shape[0]))
-
-
-    fig = plt.figure(figsize=(8,6))
-    plt.tight_layout()
-    plt.bar(x=list(ids.keys()), height=fail_counts)
-    plt.title("Samples failing QC checks (total: {}/{})".format(total_fails, imiss.shape[0]))
-    plt.xlabel("QC Test")
-    plt.ylabel("Number of samples")
-    plt.tick_params(axis='x', rotation=90)
+        ibd = pd.read_csv(ibd_file, delimiter=" ", skipinitialspace=True, usecols=['IID1'])
+        tracing.add_rows(len(ibd))
+        ledger.add_ids('Cryptic Relatedness', ibd['IID1'])
+
+    if pca_outliers_file != "":
+        # population structure outliers
+        pca_outliers = pd.read_csv(pca_outliers_file, delimiter=" ", usecols=['IID'])
+        tracing.add_rows(len(pca_outliers))
+        ledger.add_ids('PCA Outliers', pca_outliers['IID'])
+
+    fail_counts = ledger.counts()
+    for test, count in fail_counts.items():
+        print("total {} failures: {}".format(test, count))
+    total_fails = ledger.total_failed()
+    print("total samples failed: {}/{}".format(total_fails, len(ledger)))
+
+    stats = QCStats("samples_failed", [
+        BarPanel(list(fail_counts.keys()), list(fail_counts.values()), xlabel="QC Test", ylabel="Number of samples",
+                 title="Samples failing QC checks (total: {}/{})".format(total_fails, len(ledger)))])
 
     if write:
-        write_fail_file(ids, "failed_sample_ids")
+        write_fail_file(ledger, "failed_sample_ids")
+
+    if deferred:
+        return stats
+    return stats.render()
+
+
+def _failed_from_logs(name: str, logs: dict, axis: str, label: str, deferred: bool):
+    """Build the QC failure summary of a sequence of filter stages from their plink logs."""
+    found = {}
+    for test, log in logs.items():
+        if isinstance(log, PlinkLog) or os.path.isfile(log):
+            found[test] = log
+        else:
+            print("{} log not found, skipping {}".format(log, test))
+    fail_counts, total = removed_counts(found, axis)
+    for test, count in fail_counts.items():
+        print("total {} {} failed: {}".format(test, label.lower(), count))
+    total_fails = sum(fail_counts.values())
+    print("total {} failed: {}/{}".format(label.lower(), total_fails, total))
+
+    stats = QCStats(name, [
+        BarPanel(list(fail_counts.keys()), list(fail_counts.values()), xlabel="QC Test", ylabel=f'Number of {label}',
+                 title="{} failing QC checks (total: {}/{})".format(label, total_fails, total))])
+    if deferred:
+        return stats
+    return stats.render()
+
+@tracing.traced("parse")
+def snps_failed_from_logs(logs: dict=None, deferred: bool=False):
+    """Report SNPs that failed QC from the plink logs of the filter stages.
+
+    Counts are read from the .log files plink wrote for the filtering runs,
+    instead of re-reading the .lmiss, .frq and .hwe reports. The filters run
+    one after the other, so a SNP is counted under the first stage that removed
+    it, and the total is exact. Failed IDs are not in the logs; use snps_failed
+    to write them.
+
+    Key arguments:
+    --------------
+    logs: dict
+        maps QC test names to the .log files (or PlinkLog objects) of the
+        filter stages, in pipeline order (default: SNP_FILTER_LOGS)
+    deferred: bool
+        return a QCStats object instead of rendering the figure
 
-    return fig
+    Returns:
+    --------
+    Figure object (QCStats object if deferred)
+    """
+    return _failed_from_logs("snps_failed", logs or SNP_FILTER_LOGS, "variants", "SNPs", deferred)
+
+@tracing.traced("parse")
+def samples_failed_from_logs(logs: dict=None, deferred: bool=False):
+    """Report samples that failed QC from the plink logs of the filter stages.
+
+    Counts are read from the .log files plink wrote for the filtering runs,
+    instead of re-reading the .imiss, .sexcheck and .genome reports. A sample
+    is counted under the first stage that removed it. Failed IDs are not in the
+    logs; use samples_failed to write them.
+
+    Key arguments:
+    --------------
+    logs: dict
+        maps QC test names to the .log files (or PlinkLog objects) of the
+        filter stages, in pipeline order (default: SAMPLE_FILTER_LOGS)
+    deferred: bool
+        return a QCStats object instead of rendering the figure
+
+    Returns:
+    --------
+    Figure object (QCStats object if deferred)
+    """
+    return _failed_from_logs("samples_failed", logs or SAMPLE_FILTER_LOGS, "samples", "Samples", deferred)
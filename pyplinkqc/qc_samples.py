@@ -1,5 +1,3 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 from . import qc_plot
 from . import qc_report
 from . import qc_filter
@@ -16,7 +14,7 @@ from . import qc_filter
 
 def check_snp_missingness(bfile: str, miss_out: str="plink",
                           bfile_out: str="sample_missingness_filtered",
-                          snp_missingness_threshold: float=0.2):
+                          snp_missingness_threshold: float=0.2, deferred: bool=False):
     """Filters SNPs with high missingness rates.
 
     Key arguments:
@@ -29,19 +27,23 @@ def check_snp_missingness(bfile: str, miss_out: str="plink",
         prefix for the output plink binary files
     snp_missingness_threshold: float
         threshold to use for SNPs missingness rate
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
 
     Returns:
     --------
-        Figure object
+        Figure object (QCStats object if deferred)
     """
     qc_report.missingness(bfile, miss_out)
-    missing_figs = qc_plot.missingness_hist(miss_out)
+    missing_figs = qc_plot.missingness_hist(miss_out, deferred=deferred)
     qc_filter.samples_genotypes(bfile, snp_missingness_threshold, bfile_out)
     return missing_figs
 
 def check_sex_discrepancy(bfile: str="sample_missingness_filtered",
                          sexcheck_out: str="plink.sexcheck",
-                         bfile_out: str="sex_discrepancy_filtered"):
+                         bfile_out: str="sex_discrepancy_filtered", deferred: bool=False,
+                         native: bool=False):
     """Filters out samples with sex discrepancies.
 
     Key arguments:
@@ -52,14 +54,20 @@ def check_sex_discrepancy(bfile: str="sample_missingness_filtered",
         file to write sexcheck report to
     bfile_out: str
         prefix for the output plink binary files
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
+    native: bool
+        check sex in-process from the X chromosome variants only
+        (see sex_check.check_sex) instead of running plink --check-sex
 
     Returns:
     --------
-        Figure object
+        Figure object (QCStats object if deferred)
     """
-    qc_report.run_check_sex(bfile)
+    qc_report.run_check_sex(bfile, sexcheck_out.rsplit(".sexcheck", 1)[0], native=native)
     problems_df = qc_report.check_sex(sexcheck_out)
-    check_sex_figs = qc_plot.check_sex_hist(sexcheck_out)
+    check_sex_figs = qc_plot.check_sex_hist(sexcheck_out, deferred=deferred)
     sex_discrepancy = "sex_discrepancy.txt"
     qc_filter.remove_sex(bfile, sex_discrepancy, bfile_out)
     return check_sex_figs
@@ -69,7 +77,7 @@ def check_heterozygosity_rate(bfile: str="sex_discrepancy_filtered",
                             het_out: str="het_check",
                             window: int=50, shift: int=5, correlation_threshold: float=0.2,
                             correlation_method: str="pairwise",
-                            bfile_out: str="heterozygosity_filtered"):
+                            bfile_out: str="heterozygosity_filtered", deferred: bool=False):
     """Filters samples with high heterozygosity rates.
 
     Key arguments:
@@ -90,10 +98,13 @@ def check_heterozygosity_rate(bfile: str="sex_discrepancy_filtered",
         method to use for calculating the correlation (default: pairwise)
     bfile_out: str
         prefix for the output plink binary files
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
 
     Returns:
     --------
-        Figure object
+        Figure object (QCStats object if deferred)
     """
     qc_filter.ld_pruning(bfile, snpfile, ld_out, window, shift, correlation_threshold,
                       correlation_method)
@@ -101,15 +112,58 @@ def check_heterozygosity_rate(bfile: str="sex_discrepancy_filtered",
     het_failed = "heterozygosity_failed.txt"
     het_out = het_out + ".het"
     het_check_df = qc_report.heterozygosity_samples(het_out, het_failed)
-    het_check_fig = qc_plot.het_hist(het_check_df)
+    het_check_fig = qc_plot.het_hist(het_check_df, deferred=deferred)
     hetero_filtered = qc_filter.heterozygosity_snps(bfile, het_failed, bfile_out)
     return het_check_fig
 
+def check_population_structure(bfile: str="heterozygosity_filtered",
+                               snpfile: str="independent_snps", pca_out: str="pca",
+                               n_components: int=20, outlier_sd: float=6.0,
+                               threads: int=None, deferred: bool=False):
+    """Flag population structure outliers with a PCA on the independent SNPs.
+
+    Expects the independent SNPs written by check_heterozygosity_rate
+    (<snpfile>.prune.in). The outliers (<pca_out>.pca_outliers) are reported by
+    gen_qc_samples_report (pcaoutliersfile), not filtered out.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    snpfile: str
+        prefix of the independent SNPs file (generated by qc_filter.ld_pruning)
+    pca_out: str
+        prefix for the PCA output files
+    n_components: int
+        number of principal components
+    outlier_sd: float
+        samples more than outlier_sd standard deviations from the mean of one
+        of the first 10 PCs are outliers
+    threads: int
+        number of threads (default: see pca.pca)
+    deferred: bool
+        return a QCStats object instead of the figure
+
+    Returns:
+    --------
+        Figure object (QCStats object if deferred)
+    """
+    from .pca import pca
+    pca(bfile, pca_out, snpfile + ".prune.in", n_components=n_components, outlier_sd=outlier_sd,
+        threads=threads)
+    return qc_plot.pca_scatter(pca_out, deferred=deferred)
+
 def check_cryptic_relatedness(bfile: str="heterozygosity_filtered",
                               snpfile: str="independent_snps", threshold: float=0.2,
-                              bfile_out: str="relatedness_filtered"):
+                              bfile_out: str="relatedness_filtered", deferred: bool=False,
+                              lsh: bool=False, lsh_rows: int=3):
     """Filter samples with cryptic relatedness.
 
+    With lsh, only the candidate pairs of the relatedness pre-screen
+    (relatedness.relatedness_prescreen) are checked instead of every pair with
+    plink --genome, and pairs with a KING kinship above threshold / 2 are
+    written (with PI_HAT = 2 * kinship) to the same pihat_min<threshold>.genome file.
+
     Key arguments:
     --------------
     bfile: str
@@ -121,16 +175,33 @@ def check_cryptic_relatedness(bfile: str="heterozygosity_filtered",
         pi_hat threshold
     bfile_out: str
         prefix for the output plink binary files
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
+    lsh: bool
+        check only the candidate pairs of the LSH pre-screen
+    lsh_rows: int
+        hashes per LSH band (3 finds most first-degree relatives, 2 also
+        second-degree relatives, with more candidates)
 
     Returns:
     --------
-        Figure object
+        Figure object (QCStats object if deferred)
     """
     snpfile_in = snpfile + ".prune.in"
     relatedness_out = f'pihat_min{threshold}'
-    qc_report.relatedness_check(bfile, snpfile_in, relatedness_out, threshold)
     relatedness_out_name = relatedness_out + ".genome"
-    relat_figs = qc_plot.relatedness_scatter(relatedness_out_name)
+    if lsh:
+        from .relatedness import relatedness_prescreen
+        related = relatedness_prescreen(bfile, relatedness_out, snpfile_in, min_kinship=threshold / 2,
+                                        rows=lsh_rows)
+        related.to_csv(relatedness_out_name, sep=" ", index=False)
+        relat_figs = None
+        if len(related):
+            relat_figs = qc_plot.kinship_hist(relatedness_out + ".kin0", threshold / 2, deferred=deferred)
+    else:
+        qc_report.relatedness_check(bfile, snpfile_in, relatedness_out, threshold)
+        relat_figs = qc_plot.relatedness_scatter(relatedness_out_name, deferred=deferred)
     if relat_figs:
         missingness_out = "related_missingness"
         low_call_out = "related_low_call_rate.txt"
@@ -149,7 +220,9 @@ def gen_qc_samples_report(bfile: str, figures_list: list, write: bool=True,
                           lmissfile: str="plink.lmiss",
                           sexcheckfile: str="plink.sexcheck",
                           ibd_threshold: float=0.2,
-                          ibdfile: str="pihat_min0.2.genome"):
+                          ibdfile: str="pihat_min0.2.genome",
+                          processes: int=None, from_logs: bool=False,
+                          pcaoutliersfile: str="", deferred: bool=False):
     """Generated QC report for samples.
 
     Key arguments:
@@ -177,14 +250,31 @@ def gen_qc_samples_report(bfile: str, figures_list: list, write: bool=True,
     ibdfile: str
         file containing ibc coefficients for samples
         (generated by check_cryptic_relatedness function)
+    processes: int
+        number of worker processes used to render the report pages
+        (default: render serially)
+    from_logs: bool
+        count failed samples from the plink logs of the filter stages instead
+        of re-reading the reports (see qc_report.samples_failed_from_logs)
+    pcaoutliersfile: str
+        file containing population structure outliers
+        (generated by check_population_structure function; not reported if empty)
+    deferred: bool
+        summarise the failed samples as a QCStats object, rendered with the
+        other pages of the report
 
     Returns:
     --------
 
     """
     het_failed_file = "heterozygosity_failed.txt"
-    sample_failed_fig = qc_report.samples_failed(write, snp_missingness_threshold,
-                                                    imissfile, lmissfile, sexcheckfile,
-                                                    het_failed_file, ibdfile)
+    if from_logs:
+        sample_failed_fig = qc_report.samples_failed_from_logs(deferred=deferred)
+    else:
+        sample_failed_fig = qc_report.samples_failed(write, snp_missingness_threshold,
+                                                     imissfile, lmissfile, sexcheckfile,
+                                                     het_failed_file, ibdfile,
+                                                     deferred=deferred,
+                                                     pca_outliers_file=pcaoutliersfile)
     report_file = bfile + "_samples_qc"
-    qc_report.save_pdf(report_file, figures_list)
+    qc_report.save_pdf(report_file, list(figures_list) + [sample_failed_fig], processes=processes)
@@ -1,5 +1,3 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 from . import qc_plot
 from . import qc_report
 from . import qc_filter
@@ -14,7 +12,7 @@ from . import qc_filter
 
 def check_snp_missingness(bfile: str, miss_out: str="plink",
                           snp_missingness_threshold: float=0.2,
-                          bfile_out: str="snp_missingness_filtered"):
+                          bfile_out: str="snp_missingness_filtered", deferred: bool=False):
     """Filters SNPs with high missingness rates.
 
     Key arguments:
@@ -27,21 +25,24 @@ def check_snp_missingness(bfile: str, miss_out: str="plink",
         threshold to use for SNPs missingness rate
     bfile_out: str
         prefix for the output plink binary files
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
 
     Returns:
     --------
     missing_figs: object
-        matplotlib figure object showing SNP missingness rates
+        matplotlib figure object (QCStats object if deferred) showing SNP missingness rates
     """
     qc_report.missingness(bfile=bfile, outfile=miss_out)
-    missing_figs = qc_plot.missingness_hist(missfile=miss_out)
+    missing_figs = qc_plot.missingness_hist(missfile=miss_out, deferred=deferred)
     qc_filter.snp_genotypes(bfile=bfile, threshold=snp_missingness_threshold,
                                outfile=bfile_out)
     return missing_figs
 
 def check_maf(bfile: str="snp_missingness_filtered", get_autosomal: bool=False,
              maf_check: str="MAF_check.frq", maf_threshold: float=0.01,
-             bfile_out: str="maf_filtered"):
+             bfile_out: str="maf_filtered", deferred: bool=False):
     """Filters SNPs with high missing allele frequencies.
 
     Key arguments:
@@ -56,14 +57,17 @@ def check_maf(bfile: str="snp_missingness_filtered", get_autosomal: bool=False,
         maf threshold to use for filtering SNPs
     bfile_out: str
         prefix for the output plink binary files
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
 
     Returns:
     --------
     maf_check_figs: object
-        matplotlib figure object showing SNP MAF rates
+        matplotlib figure object (QCStats object if deferred) showing SNP MAF rates
     maf_drop_figs: object
-        matplotlib figure object showing SNP MAF rates after dropping SNPs that
-        exceeded the maf_threshold
+        matplotlib figure object (QCStats object if deferred) showing SNP MAF
+        rates after dropping SNPs that exceeded the maf_threshold
     """
     if get_autosomal:
         auto_out = "snp_1_22.txt"
@@ -73,15 +77,15 @@ def check_maf(bfile: str="snp_missingness_filtered", get_autosomal: bool=False,
                                     outfile=bfile_tmp)
         bfile = bfile_tmp
     qc_report.maf_check(bfile=bfile, outfile="MAF_check")
-    maf_check_figs = qc_plot.maf_hist(maffile=maf_check)
+    maf_check_figs = qc_plot.maf_hist(maffile=maf_check, deferred=deferred)
     maf_filtered = qc_filter.maf(bfile=bfile, threshold=maf_threshold,
                                      outfile=bfile_out)
-    maf_drop_figs = qc_plot.maf_dropped_hist()
+    maf_drop_figs = qc_plot.maf_dropped_hist(deferred=deferred)
     return maf_check_figs, maf_drop_figs
 
 def check_hwe(bfile: str="maf_filtered", hwe_check: str="plink.hwe",
               hwe_threshold: float=1e-6, control: bool=True,
-              bfile_out: str="hwe_filtered"):
+              bfile_out: str="hwe_filtered", deferred: bool=False):
     """Filters SNPs with outlying hardy-weinberg equilibrium results.
 
     Key arguments:
@@ -96,14 +100,17 @@ def check_hwe(bfile: str="maf_filtered", hwe_check: str="plink.hwe",
         indicates whether to only apply HWE test to controls
     bfile_out: str
         prefix for the output plink binary files
+    deferred: bool
+        return QCStats objects (binned counts and thresholds) instead of
+        figures; they are rendered when the report is written
 
     Returns:
     --------
     hwe_figs: object
-        matplotlib figure object showing SNP HWE results
+        matplotlib figure object (QCStats object if deferred) showing SNP HWE results
     """
     qc_report.hardy_weinberg(bfile=bfile)
-    hwe_figs = qc_plot.hwe_hist(hwefile=hwe_check, threshold=hwe_threshold)
+    hwe_figs = qc_plot.hwe_hist(hwefile=hwe_check, threshold=hwe_threshold, deferred=deferred)
     qc_filter.hardy_weinberg_test(bfile=bfile, threshold=hwe_threshold,
                                  control=control, outfile=bfile_out)
     return hwe_figs
@@ -113,7 +120,9 @@ def gen_qc_snps_report(bfile: str, figures_list: list, write: bool=False,
                            maf_threshold: float=0.01, hwe_threshold: float=1e-6,
                            lmiss_file: str="plink.lmiss",
                            maf_file: str="MAF_check.frq",
-                           hwe_file: str="plink.hwe"):
+                           hwe_file: str="plink.hwe",
+                           processes: int=None, from_logs: bool=False,
+                           deferred: bool=False):
     """Generate SNPs QC report.
 
     Key arguments:
@@ -140,14 +149,27 @@ def gen_qc_snps_report(bfile: str, figures_list: list, write: bool=False,
     hwe_file: str
         file containing SNPs with outlying HWE
         (generated by check_hwe function)
+    processes: int
+        number of worker processes used to render the report pages
+        (default: render serially)
+    from_logs: bool
+        count failed SNPs from the plink logs of the filter stages instead of
+        re-reading the reports (see qc_report.snps_failed_from_logs)
+    deferred: bool
+        summarise the failed SNPs as a QCStats object, rendered with the
+        other pages of the report
 
     Returns:
     --------
     """
-    snps_failed_fig = qc_report.snps_failed(miss_threshold=snp_missingness_threshold,
-                                                   maf_threshold=maf_threshold,
-                                                   hwe_threshold=hwe_threshold,
-                                                   lmiss_file=lmiss_file,
-                                                   maf_file=maf_file, hwe_file=hwe_file)
+    if from_logs:
+        snps_failed_fig = qc_report.snps_failed_from_logs(deferred=deferred)
+    else:
+        snps_failed_fig = qc_report.snps_failed(miss_threshold=snp_missingness_threshold,
+                                                maf_threshold=maf_threshold,
+                                                hwe_threshold=hwe_threshold,
+                                                lmiss_file=lmiss_file,
+                                                maf_file=maf_file, hwe_file=hwe_file,
+                                                deferred=deferred)
     report_file = bfile + "_snps_qc"
-    qc_report.save_pdf(report_file, figures_list)
+    qc_report.save_pdf(report_file, list(figures_list) + [snps_failed_fig], processes=processes)
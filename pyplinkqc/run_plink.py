@@ -1,5 +1,9 @@
-import configpaser
+import os
+import time
+import configparser
 import subprocess
+from . import tracing
+from .plink_log import parse_plink_log, out_prefix
 
 
 def parse_plink_conf(config_file: str):
@@ -36,7 +40,9 @@ def run_plink(bfile: str, *flags: str, make_bed: bool=True, plink_conf: str="../
 
     Returns:
     --------
-
+    log: PlinkLog
+        metrics parsed from the .log file plink wrote for the --out prefix
+        (None if plink did not write one)
     """
     plink_path = parse_plink_conf(plink_conf)
 
@@ -46,4 +52,15 @@ def run_plink(bfile: str, *flags: str, make_bed: bool=True, plink_conf: str="../
         command = f'{plink_path} --bfile {bfile} --silent'
     for flag in flags:
         command += f' {flag}'
-    subprocess.run(command, text=True, check=True, shell=True)
+    stage = next((flag.split()[0] for flag in flags if not flag.startswith('--out')), '--make-bed')
+    logfile = out_prefix(flags) + ".log"
+    start = time.time()
+    with tracing.span(f'plink {stage}', "plink", bfile=bfile, command=command) as span:
+        subprocess.run(command, text=True, check=True, shell=True)
+        # a log older than the run was left by an earlier command
+        if not os.path.isfile(logfile) or os.path.getmtime(logfile) < start - 1:
+            return None
+        log = parse_plink_log(logfile)
+        span.update(variants_removed=log.variants_removed, samples_removed=log.samples_removed,
+                    threads=log.threads, workspace_mb=log.workspace_mb)
+    return log
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from .plink_io import open_bed, read_fam, write_fam, decode_genotypes, iter_blocks, plink_chrom
+
+# In-process replacement of plink --check-sex/--impute-sex. Only the chromosome
+# column of the .bim file is parsed, to find the rows of the X chromosome
+# (code 23, without the pseudo-autosomal XY regions); these rows are
+# contiguous in a sorted .bed file, so only a few percent of the genotypes are
+# read and decoded. As plink 1.9 does, the X chromosome inbreeding coefficient
+# of every sample is F = (O(hom) - E(hom)) / (N - E(hom)) over its called
+# polymorphic X variants, with allele frequencies counting males as haploid.
+
+
+def x_chromosome_runs(bfile: str):
+    """Get the (start, stop) variant rows of the runs of X chromosome variants in the .bim file."""
+    chroms = pd.read_csv(bfile + ".bim", sep=r'\s+', header=None, usecols=[0], dtype=str)[0]
+    codes = {chrom: plink_chrom(chrom) for chrom in chroms.unique()}
+    x = (chroms.map(codes) == '23').to_numpy()
+    edges = np.flatnonzero(np.diff(np.r_[0, x.astype(np.int8), 0]))
+    return [(int(start), int(stop)) for start, stop in zip(edges[::2], edges[1::2])]
+
+
+def x_inbreeding(bfile: str, sexes: np.ndarray=None, block_size: int=None):
+    """Compute the X chromosome inbreeding coefficient of every sample.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    sexes: np.ndarray
+        reported sex of every sample (1 = male, 2 = female, 0 = unknown;
+        default: from the .fam file), males count as haploid in the allele frequencies
+    block_size: int
+        number of variants per block (default: about 16 MB of decoded genotypes)
+
+    Returns:
+    --------
+    F: np.ndarray
+        inbreeding coefficient (NaN for samples without called polymorphic X variants)
+    n_variants: np.ndarray
+        number of called polymorphic X variants of every sample
+    """
+    runs = x_chromosome_runs(bfile)
+    if not runs:
+        raise ValueError(f'{bfile}.bim has no X chromosome variants, please check the chromosome codes')
+    if sexes is None:
+        sexes = read_fam(bfile + ".fam")['sex'].to_numpy()
+    n_samples = len(sexes)
+    bed = open_bed(bfile, n_samples)
+    # alleles per called genotype: 1 for males, 2 otherwise
+    ploidy = np.where(sexes == 1, 1.0, 2.0)
+    block_size = block_size or max(1, (1 << 24) // n_samples)
+    observed = np.zeros(n_samples)
+    expected = np.zeros(n_samples)
+    n_variants = np.zeros(n_samples, dtype=np.int64)
+    for run_start, run_stop in runs:
+        for start, stop in iter_blocks(run_stop, block_size, run_start):
+            genotypes = decode_genotypes(bed[start:stop], n_samples)
+            called = genotypes >= 0
+            alleles = called.astype(float) @ ploidy
+            a1 = np.where(called, genotypes, 0).astype(float) @ (ploidy / 2)
+            freqs = np.divide(a1, alleles, out=np.zeros(len(genotypes)), where=alleles > 0)
+            poly = (freqs > 0) & (freqs < 1)
+            called, genotypes = called[poly], genotypes[poly]
+            observed += ((genotypes == 0) | (genotypes == 2)).sum(axis=0)
+            expected += (1 - 2 * freqs[poly] * (1 - freqs[poly])) @ called
+            n_variants += called.sum(axis=0)
+    F = np.divide(observed - expected, n_variants - expected, out=np.full(n_samples, np.nan),
+                  where=(n_variants - expected) > 0)
+    return F, n_variants
+
+
+def check_sex(bfile: str, outfile: str="plink", female_max: float=0.2, male_min: float=0.8,
+              impute_fam: str=None, block_size: int=None):
+    """Check the reported sex of the samples against their X chromosome homozygosity.
+
+    Writes <outfile>.sexcheck with the columns of plink --check-sex (FID, IID,
+    PEDSEX, SNPSEX, STATUS and F). SNPSEX is 2 (female) if F < female_max, 1
+    (male) if F > male_min and 0 otherwise; STATUS is PROBLEM if it differs
+    from PEDSEX or is 0.
+
+    Key arguments:
+    --------------
+    bfile: str
+        prefix for plink binary files (.bed, .bim, .fam)
+    outfile: str
+        prefix for the .sexcheck file
+    female_max: float
+        highest F of imputed females
+    male_min: float
+        lowest F of imputed males
+    impute_fam: str
+        path to write the .fam file with the imputed sexes to, as plink --impute-sex
+        (the .bed and .bim files are unchanged)
+    block_size: int
+        number of variants per block (default: about 16 MB of decoded genotypes)
+
+    Returns:
+    --------
+    sexcheck: pd.DataFrame
+        the .sexcheck table
+    """
+    if not female_max <= male_min:
+        raise ValueError(f'female_max {female_max} must not be above male_min {male_min}')
+    fam = read_fam(bfile + ".fam")
+    F, n_variants = x_inbreeding(bfile, fam['sex'].to_numpy(), block_size)
+    snpsex = np.select([F < female_max, F > male_min], [2, 1], 0)
+    pedsex = fam['sex'].to_numpy()
+    sexcheck = pd.DataFrame({'FID': fam['fid'], 'IID': fam['iid'], 'PEDSEX': pedsex, 'SNPSEX': snpsex,
+                             'STATUS': np.where((pedsex == snpsex) & (snpsex != 0), "OK", "PROBLEM"),
+                             'F': F})
+    sexcheck.to_csv(outfile + ".sexcheck", sep=" ", index=False, na_rep="nan", float_format="%.4g")
+    print(f'{(sexcheck["STATUS"] == "PROBLEM").sum()}/{len(sexcheck)} samples with sex problems')
+    if impute_fam is not None:
+        write_fam(fam.assign(sex=snpsex), impute_fam)
+    return sexcheck
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+import contextlib
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Lightweight per-stage tracing. Spans record wall and CPU time (of this
+# process and of waited-for child processes such as plink), the peak RSS of
+# child processes, bytes read and written and row counts. Tracing is off
+# unless enable() is called or PYPLINKQC_TRACE=1 is set; disabled spans cost a
+# flag check. Only the standard library is imported, so tracing does not
+# slow down the import of the modules it instruments.
+
+_state = {'enabled': os.environ.get('PYPLINKQC_TRACE', '') not in ('', '0'),
+          'origin': time.perf_counter()}
+_spans = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable():
+    """Start recording spans."""
+    _state['enabled'] = True
+
+
+def disable():
+    """Stop recording spans (recorded spans are kept)."""
+    _state['enabled'] = False
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+def reset():
+    """Drop all recorded spans."""
+    with _lock:
+        _spans.clear()
+    _state['origin'] = time.perf_counter()
+
+
+def _io_counters():
+    """Bytes read and written by this process (rchar/wchar of /proc/self/io, Linux only)."""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _snapshot():
+    read, written = _io_counters()
+    if resource is None:
+        # without getrusage only the CPU time of this process is known
+        return {'wall': time.perf_counter(), 'cpu': time.process_time(), 'child_cpu': 0.0,
+                'child_maxrss': 0, 'read': read, 'written': written, 'child_read': 0,
+                'child_written': 0}
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {'wall': time.perf_counter(), 'cpu': own.ru_utime + own.ru_stime,
+            'child_cpu': children.ru_utime + children.ru_stime,
+            'child_maxrss': children.ru_maxrss, 'read': read, 'written': written,
+            # block I/O of child processes, in 512 byte units
+            'child_read': children.ru_inblock * 512, 'child_written': children.ru_oublock * 512}
+
+
+class Span:
+    """A timed section of a run (see span)."""
+    def __init__(self, name: str, category: str, args: dict):
+        self.name = name
+        self.category = category
+        self.args = dict(args)
+        self.rows = 0
+
+    def add_rows(self, rows: int):
+        """Add to the number of rows processed in the span."""
+        self.rows += int(rows)
+
+    def update(self, **args):
+        """Add values to the span (e.g. results known at its end)."""
+        self.args.update(args)
+
+
+class _NullSpan:
+    def add_rows(self, rows: int):
+        pass
+
+    def update(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+@contextlib.contextmanager
+def span(name: str, category: str="", **args):
+    """Record a span around a block of code.
+
+    Key arguments:
+    --------------
+    name: str
+        span name (spans are summarized and budgeted by name)
+    category: str
+        span category (e.g. "plink", "parse", "plot", "pdf")
+    **args:
+        extra values stored with the span (e.g. the plink command)
+
+    Returns:
+    --------
+    context manager yielding the Span object
+    """
+    if not _state['enabled']:
+        yield _NULL_SPAN
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    current = Span(name, category, args)
+    stack.append(current)
+    start = _snapshot()
+    try:
+        yield current
+    finally:
+        end = _snapshot()
+        stack.pop()
+        record = {'name': name, 'category': category, 'start': start['wall'] - _state['origin'],
+                  'wall': end['wall'] - start['wall'], 'cpu': end['cpu'] - start['cpu'],
+                  'child_cpu': end['child_cpu'] - start['child_cpu'],
+                  # ru_maxrss of children is a high-water mark over all waited-for children
+                  'child_peak_rss_mb': end['child_maxrss'] / 1024 if end['child_maxrss'] > start['child_maxrss'] else 0.0,
+                  'bytes_read': end['read'] - start['read'] + end['child_read'] - start['child_read'],
+                  'bytes_written': end['written'] - start['written'] + end['child_written'] - start['child_written'],
+                  'rows': current.rows, 'depth': len(stack), 'pid': os.getpid(),
+                  'tid': threading.get_ident(), 'args': current.args}
+        with _lock:
+            _spans.append(record)
+
+
+def traced(category: str="", name: str=None):
+    """Decorator recording a span around every call of a function.
+
+    Key arguments:
+    --------------
+    category: str
+        span category
+    name: str
+        span name (default: <module>.<function>)
+    """
+    def decorator(func):
+        span_name = name or f'{func.__module__.split(".")[-1]}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state['enabled']:
+                return func(*args, **kwargs)
+            with span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_rows(rows: int):
+    """Add to the row count of the innermost open span of this thread (if any)."""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].add_rows(rows)
+
+
+def spans():
+    """Get the recorded spans (list of dicts, in order of completion)."""
+    with _lock:
+        return list(_spans)
+
+
+def export_json(path: str):
+    """Write the recorded spans to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(spans(), f, indent=1, default=str)
+
+
+def export_chrome_trace(path: str):
+    """Write the recorded spans as a Chrome trace (open in chrome://tracing or Perfetto).
+
+    Key arguments:
+    --------------
+    path: str
+        output JSON file
+    """
+    events = []
+    for record in spans():
+        args = {key: record[key] for key in ['cpu', 'child_cpu', 'child_peak_rss_mb', 'bytes_read',
+                                              'bytes_written', 'rows']}
+        args.update({key: str(value) for key, value in record['args'].items()})
+        events.append({'name': record['name'], 'cat': record['category'], 'ph': 'X',
+                       'ts': record['start'] * 1e6, 'dur': record['wall'] * 1e6,
+                       'pid': record['pid'], 'tid': record['tid'], 'args': args})
+    with open(path, "w") as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def summary():
+    """Summarize the recorded spans by name.
+
+    Returns:
+    --------
+    summary: list
+        one dict per span name (sorted by total wall time) with calls, wall,
+        cpu, child_cpu, child_peak_rss_mb, bytes_read, bytes_written and rows
+    """
+    totals = {}
+    for record in spans():
+        total = totals.setdefault(record['name'], {'name': record['name'], 'category': record['category'],
+                                                   'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'child_cpu': 0.0,
+                                                   'child_peak_rss_mb': 0.0, 'bytes_read': 0,
+                                                   'bytes_written': 0, 'rows': 0})
+        total['calls'] += 1
+        for key in ['wall', 'cpu', 'child_cpu', 'bytes_read', 'bytes_written', 'rows']:
+            total[key] += record[key]
+        total['child_peak_rss_mb'] = max(total['child_peak_rss_mb'], record['child_peak_rss_mb'])
+    return sorted(totals.values(), key=lambda total: -total['wall'])
+
+
+def print_summary(file=None):
+    """Print the summary table of the recorded spans."""
+    file = file or sys.stdout
+    print(f'{"span":<40} {"calls":>5} {"wall s":>9} {"cpu s":>8} {"child s":>8} {"child MB":>9} '
+          f'{"read MB":>9} {"write MB":>9} {"rows":>11}', file=file)
+    for total in summary():
+        print(f'{total["name"][:40]:<40} {total["calls"]:>5} {total["wall"]:>9.2f} {total["cpu"]:>8.2f} '
+              f'{total["child_cpu"]:>8.2f} {total["child_peak_rss_mb"]:>9.0f} '
+              f'{total["bytes_read"] / 1e6:>9.1f} {total["bytes_written"] / 1e6:>9.1f} {total["rows"]:>11}',
+              file=file)
+
+
+def check_budgets(budgets: dict, strict: bool=False):
+    """Compare the total wall time of spans with per-stage budgets.
+
+    Key arguments:
+    --------------
+    budgets: dict
+        maps span names to budgets in seconds
+    strict: bool
+        raise a RuntimeError if a budget is exceeded
+
+    Returns:
+    --------
+    exceeded: list
+        (name, seconds, budget) of every span name over its budget
+    """
+    walls = {total['name']: total['wall'] for total in summary()}
+    exceeded = [(name, walls[name], budget) for name, budget in budgets.items()
+                if walls.get(name, 0) > budget]
+    if exceeded and strict:
+        details = ", ".join(f'{name}: {seconds:.2f} s > {budget:.2f} s' for name, seconds, budget in exceeded)
+        raise RuntimeError(f'stage budgets exceeded ({details})')
+    return exceeded
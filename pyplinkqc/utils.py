@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 
@@ -62,11 +63,178 @@ def generate_phenofile_fromfam(ids_file: str, fam_file: str, pheno_outfile: str=
         list of IDs used to create phenotype file
 
     """
+    from .id_index import IDIndex
+
     ids = read_txt_file(ids_file)
     eids = [id.strip() for id in ids]
-    fam = pd.read_csv(fam_file, delimiter = " ", usecols = [0, 1], names = ['fid', 'iid'])
-    # fam['pheno'] = fam['iid'].apply(lambda x: '1' if x in eids else '0')
-    famcopy = fam.copy()
-    famcopy['pheno'] = np.where((famcopy['iid'].isin(eids)), 2, 1)
+    index = IDIndex.from_fam(fam_file)
+    famcopy = pd.DataFrame({'fid': index.fids, 'iid': index.iids})
+    famcopy['pheno'] = case_control_phenotypes(index.sample_mask(eids))
     famcopy.to_csv(pheno_outfile, sep=" ", index=False, header=False)
     return eids
+
+
+def case_control_phenotypes(case_mask: np.ndarray):
+    """Encode a boolean case mask as plink case/control phenotypes.
+
+    Key arguments:
+    --------------
+    case_mask: np.ndarray
+        True for cases, aligned to the samples of a .fam file
+
+    Returns:
+    --------
+    phenos: np.ndarray
+        2 for cases and 1 for controls
+    """
+    return np.where(case_mask, 2, 1).astype(np.int8)
+
+
+def write_table(df: pd.DataFrame, outfile: str, row_group_size: int=None):
+    """Write a table in a compact columnar format.
+
+    The table is written as parquet when pyarrow is installed, and as a csv
+    file otherwise.
+
+    Key arguments:
+    --------------
+    df: pd.DataFrame
+        table to write
+    outfile: str
+        output file prefix (the extension is added)
+    row_group_size: int
+        optional number of rows per parquet row group (smaller groups let
+        filtered reads skip more of a sorted table)
+
+    Returns:
+    --------
+    path: str
+        path of the written file
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        path = outfile + ".csv"
+        df.to_csv(path, index=False)
+        return path
+    path = outfile + ".parquet"
+    df.to_parquet(path, index=False, row_group_size=row_group_size)
+    return path
+
+
+class TableWriter:
+    """Write a table chunk by chunk, in the format chosen by write_table.
+
+    Chunks are appended as parquet row groups when pyarrow is installed, and
+    as csv rows otherwise, so tables larger than memory can be written.
+
+    Key arguments:
+    --------------
+    outfile: str
+        output file prefix (the extension is added, see path)
+    """
+    def __init__(self, outfile: str):
+        try:
+            import pyarrow
+        except ImportError:
+            self.path = outfile + ".csv"
+            self._parquet = False
+        else:
+            self.path = outfile + ".parquet"
+            self._parquet = True
+        self._writer = None
+        self._header = True
+
+    def write(self, df: pd.DataFrame):
+        if self._parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, index=False, header=self._header, mode="w" if self._header else "a")
+            self._header = False
+
+    def close(self):
+        if self._parquet and self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_table(path: str, columns: list=None):
+    """Read a table written by write_table.
+
+    Key arguments:
+    --------------
+    path: str
+        path to a .parquet or .csv file
+    columns: list
+        optional subset of columns to read
+
+    Returns:
+    --------
+    df: pd.DataFrame
+        table read from the file
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def generate_multi_phenofile(fam_file: str, ids_files=None, pheno_table=None,
+                             pheno_outfile: str="phenotypes.txt", missing: str="-9"):
+    """Generates a multi-column plink phenotype file aligned to a .fam file.
+
+    Each case-ID file becomes one binary phenotype (2=case, 1=control) and each
+    column of the phenotype table is copied as is; samples missing from the
+    table are set to the missing value. The output has a "FID IID <names...>"
+    header and can be used with plink --pheno ... --all-pheno.
+
+    Key arguments:
+    --------------
+    fam_file: str
+        .fam file defining the samples and their order
+    ids_files: dict or list
+        case-ID files (see IDIndex.sample_mask_from_file), as a dictionary
+        mapping phenotype names to files, or a list of files named after
+        their basename
+    pheno_table: str or pd.DataFrame
+        table with FID and IID columns followed by one column per phenotype
+        (whitespace-delimited with a header line if given as a file)
+    pheno_outfile: str
+        file to write the phenotypes to
+    missing: str
+        value written for samples without a phenotype value
+
+    Returns:
+    --------
+    names: list
+        phenotype names, in column order
+    """
+    from .id_index import IDIndex
+
+    index = IDIndex.from_fam(fam_file)
+    phenos = pd.DataFrame({'FID': index.fids, 'IID': index.iids})
+    if ids_files is not None:
+        if not isinstance(ids_files, dict):
+            ids_files = {os.path.splitext(os.path.basename(f))[0]: f for f in ids_files}
+        for name, ids_file in ids_files.items():
+            phenos[name] = case_control_phenotypes(index.sample_mask_from_file(ids_file))
+    if pheno_table is not None:
+        if not isinstance(pheno_table, pd.DataFrame):
+            pheno_table = pd.read_csv(pheno_table, sep=r'\s+', dtype={0: str, 1: str})
+        positions = index.sample_positions(pheno_table.iloc[:, 1], pheno_table.iloc[:, 0])
+        found = positions >= 0
+        for name in pheno_table.columns[2:]:
+            column = pd.Series(missing, index=phenos.index, dtype=object)
+            column.iloc[positions[found]] = pheno_table[name].to_numpy()[found]
+            phenos[name] = column.fillna(missing)
+    phenos.to_csv(pheno_outfile, sep=" ", index=False)
+    return list(phenos.columns[2:])
@@ -0,0 +1,261 @@
+import os
+import gzip
+import zlib
+import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .plink_io import BedWriter, encode_genotypes, write_bim, write_fam, plink_chrom
+from .merge import concat_variants
+
+# Parallel conversion of bgzipped VCF files to plink binary files.
+# A BGZF file is a series of independent gzip blocks (at most 64 KB each), so
+# the file is split at block boundaries into chunks that worker processes
+# decompress and parse on their own. A record crossing a chunk boundary belongs
+# to the chunk it starts in. Genotypes are decoded from the raw bytes with
+# vectorized lookups at the tab positions of each record, and every chunk is
+# written as its own .bed/.bim shard.
+
+_BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+
+
+def _block_size(f, vcf_file: str):
+    """Read a BGZF block header at the current position; get its total size and header length."""
+    head = f.read(12)
+    if len(head) < 12:
+        return None, None
+    if head[:4] != _BGZF_MAGIC:
+        raise ValueError(f'{vcf_file} is not BGZF compressed, please compress it with bgzip')
+    xlen, = struct.unpack('<H', head[10:12])
+    extra = f.read(xlen)
+    i = 0
+    while i + 4 <= xlen:
+        slen, = struct.unpack('<H', extra[i + 2:i + 4])
+        if extra[i:i + 2] == b'BC':
+            bsize, = struct.unpack('<H', extra[i + 4:i + 6])
+            return bsize + 1, 12 + xlen
+        i += 4 + slen
+    raise ValueError(f'{vcf_file} is not BGZF compressed, please compress it with bgzip')
+
+
+def bgzf_blocks(vcf_file: str):
+    """Get the offsets of the BGZF blocks of a file.
+
+    The offsets are read from the bgzip index (<vcf_file>.gzi, written by
+    bgzip -i) when it exists, otherwise the block headers are scanned.
+
+    Key arguments:
+    --------------
+    vcf_file: str
+        path to the bgzipped file
+
+    Returns:
+    --------
+    offsets: np.ndarray
+        compressed offset of every block (the first is 0)
+    """
+    if os.path.isfile(vcf_file + ".gzi"):
+        with open(vcf_file + ".gzi", "rb") as f:
+            n, = struct.unpack('<Q', f.read(8))
+            pairs = np.frombuffer(f.read(16 * n), dtype='<u8').reshape(n, 2)
+        return np.r_[0, pairs[:, 0]].astype(np.int64)
+    offsets = []
+    size = os.path.getsize(vcf_file)
+    with open(vcf_file, "rb") as f:
+        offset = 0
+        while offset < size:
+            f.seek(offset)
+            block, _ = _block_size(f, vcf_file)
+            if block is None:
+                break
+            offsets.append(offset)
+            offset += block
+    return np.array(offsets, dtype=np.int64)
+
+
+def _read_block(f, offset: int, vcf_file: str):
+    """Decompress the BGZF block at offset; get its data and compressed size."""
+    f.seek(offset)
+    block, header = _block_size(f, vcf_file)
+    if block is None:
+        return b'', 0
+    payload = f.read(block - header)
+    return zlib.decompress(payload[:-8], -15), block
+
+
+def read_vcf_samples(vcf_file: str):
+    """Get the sample IDs of the #CHROM header line of a (gzipped) VCF file."""
+    with gzip.open(vcf_file, "rt") as f:
+        for line in f:
+            if line.startswith("#CHROM"):
+                return line.rstrip("\n").split("\t")[9:]
+            if not line.startswith("#"):
+                break
+    raise ValueError(f'{vcf_file} has no #CHROM header line')
+
+
+def _parse_records(buf: bytes, n_samples: int, vcf_file: str):
+    """Decode complete VCF records (each ending with a newline).
+
+    Returns the .bim rows and the A1 (ALT) allele counts of the biallelic
+    records, and the number of records skipped.
+    """
+    buf = bytes(buf)
+    while buf.startswith(b'#'):
+        buf = buf[buf.find(b'\n') + 1:]
+    if not buf:
+        return [], np.zeros((0, n_samples), dtype=np.int8), 0
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    # tabs and newlines in one pass: every record has 8 + n_samples tabs and a newline
+    delimiters = np.flatnonzero(arr <= 10)
+    n_records = len(delimiters) // (9 + n_samples)
+    if len(delimiters) % (9 + n_samples) or not (arr[delimiters[8 + n_samples::9 + n_samples]] == 10).all():
+        raise ValueError(f'{vcf_file} has records without {9 + n_samples} columns')
+    delimiters = delimiters.reshape(n_records, 9 + n_samples)
+    tabs = delimiters[:, :-1]
+    ends = delimiters[:, -1]
+    starts = np.r_[0, ends[:-1] + 1]
+
+    rows, keep = [], np.zeros(len(ends), dtype=bool)
+    for i, (start, tab) in enumerate(zip(starts, tabs[:, 3])):
+        chrom, pos, snp, ref = buf[start:tab].decode().split("\t")
+        alt = buf[tab + 1:tabs[i, 4]].decode()
+        if "," in alt or not buf.startswith(b'GT', tabs[i, 7] + 1):
+            continue
+        chrom = plink_chrom(chrom)
+        rows.append((chrom, snp if snp != "." else f'{chrom}:{pos}:{ref}:{alt}', 0.0, int(pos), alt, ref))
+        keep[i] = True
+
+    # GT is the first subfield of every sample field: allele, separator, allele
+    fields = tabs[keep, 8:] + 1
+    first = arr[fields]
+    sep = arr[fields + 1]
+    second = arr[np.minimum(fields + 2, len(arr) - 1)]
+    diploid = (sep == ord('/')) | (sep == ord('|'))
+    alt_first = first == ord('1')
+    # haploid calls (e.g. male X) are coded as homozygous
+    genotypes = np.where(diploid, alt_first.astype(np.int8) + (second == ord('1')), 2 * alt_first).astype(np.int8)
+    genotypes[(first == ord('.')) | (diploid & (second == ord('.')))] = -1
+    return rows, genotypes, len(ends) - keep.sum()
+
+
+def _ingest_chunk(vcf_file: str, start: int, stop: int, previous: int, shard: str, n_samples: int,
+                  batch_bytes: int):
+    """Convert the records starting in the blocks [start, stop) to a .bed/.bim shard."""
+    size = os.path.getsize(vcf_file)
+    rows, skipped = [], 0
+    with open(vcf_file, "rb") as f, BedWriter(shard + ".bed") as bed:
+        # a partial first line belongs to the previous chunk: it is skipped up to
+        # the first newline, starting at the last byte of the previous block
+        pending = bytearray(b'' if previous is None else _read_block(f, previous, vcf_file)[0][-1:])
+        skip_partial = previous is not None
+        # decompressed positions: read so far, of pending[0], and of the end of the chunk
+        total, base, end = len(pending), 0, None
+        offset = start
+        while offset < size:
+            data, block = _read_block(f, offset, vcf_file)
+            if block == 0:
+                break
+            offset += block
+            pending += data
+            total += len(data)
+            if offset >= stop and end is None:
+                end = total
+            if skip_partial:
+                newline = pending.find(b'\n', max(0, len(pending) - len(data) - 1))
+                if newline < 0:
+                    continue
+                base += newline + 1
+                del pending[:newline + 1]
+                skip_partial = False
+            if end is not None:
+                # read on until the line holding the last byte of the chunk is complete
+                if end <= base or pending.find(b'\n', end - 1 - base) >= 0:
+                    break
+            elif len(pending) >= batch_bytes:
+                cut = pending.rfind(b'\n') + 1
+                batch_rows, genotypes, n_skipped = _parse_records(pending[:cut], n_samples, vcf_file)
+                bed.write(encode_genotypes(genotypes))
+                rows += batch_rows
+                skipped += n_skipped
+                base += cut
+                del pending[:cut]
+        if skip_partial or (end is not None and end <= base):
+            # no line starts in the chunk
+            pending = bytearray()
+        elif end is not None:
+            cut = pending.find(b'\n', end - 1 - base) + 1
+            pending = pending[:cut] if cut > 0 else pending
+        if pending and not pending.endswith(b'\n'):
+            pending += b'\n'
+        batch_rows, genotypes, n_skipped = _parse_records(pending, n_samples, vcf_file)
+        bed.write(encode_genotypes(genotypes))
+        rows += batch_rows
+        skipped += n_skipped
+    write_bim(pd.DataFrame(rows, columns=['chrom', 'snp', 'cm', 'pos', 'a1', 'a2']), shard + ".bim")
+    return shard, len(rows), skipped
+
+
+def vcf_to_bfile(vcf_file: str, outfile: str, processes: int=1, chunk_size: int=1 << 26,
+                 concat: bool=True, batch_bytes: int=1 << 25):
+    """Convert a bgzipped VCF file to plink binary files in parallel.
+
+    The file is split at BGZF block boundaries into chunks of about chunk_size
+    compressed bytes, which worker processes decompress, parse and write as
+    .bed/.bim shards <outfile>.part<i> (with a copy of the .fam). Biallelic
+    records are kept, with A1 the ALT and A2 the REF allele (plink's --vcf
+    convention); multiallelic records and records without a leading GT field
+    are skipped. Variants without an ID are named CHR:POS:REF:ALT. With concat,
+    the shards are concatenated into <outfile> and removed.
+
+    Key arguments:
+    --------------
+    vcf_file: str
+        path to the bgzipped (bgzip) VCF file
+    outfile: str
+        prefix for the output plink binary files
+    processes: int
+        number of worker processes
+    chunk_size: int
+        compressed bytes per chunk
+    concat: bool
+        concatenate the shards into one bfile
+    batch_bytes: int
+        decompressed bytes parsed at a time by a worker
+
+    Returns:
+    --------
+    prefixes: list
+        prefix of the output bfile ([outfile]) or of every shard
+    """
+    samples = read_vcf_samples(vcf_file)
+    fam = pd.DataFrame({'fid': samples, 'iid': samples, 'pat': '0', 'mat': '0', 'sex': 0, 'pheno': '-9'})
+    write_fam(fam, outfile + ".fam")
+    offsets = bgzf_blocks(vcf_file)
+    # chunks start at the first block at or after each multiple of chunk_size
+    bounds = np.unique(np.searchsorted(offsets, np.arange(0, offsets[-1] + 1, chunk_size)))
+    starts = offsets[bounds]
+    stops = np.r_[starts[1:], os.path.getsize(vcf_file)]
+    previous = [None] + list(offsets[bounds[1:] - 1])
+    shards = [f'{outfile}.part{i}' for i in range(len(starts))]
+    tasks = [(vcf_file, int(start), int(stop), None if prev is None else int(prev), shard, len(samples),
+              batch_bytes) for start, stop, prev, shard in zip(starts, stops, previous, shards)]
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_ingest_chunk, *zip(*tasks)))
+    else:
+        results = [_ingest_chunk(*task) for task in tasks]
+    n_variants = sum(result[1] for result in results)
+    skipped = sum(result[2] for result in results)
+    print(f'{n_variants} variants and {len(samples)} samples converted, {skipped} records skipped')
+
+    if not concat:
+        for shard in shards:
+            shutil.copyfile(outfile + ".fam", shard + ".fam")
+        return shards
+    concat_variants(shards, outfile)
+    for shard in shards:
+        os.remove(shard + ".bed")
+        os.remove(shard + ".bim")
+    return [outfile]
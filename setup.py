@@ -34,8 +34,12 @@ setup(
         'numpy>=1.18.1',
         'matplotlib>=3.1.3',
         'pandas>=1.0.3',
+        'scipy>=1.4.1',
         'pytest>=5.3.5',
         'mypy>=0.761'
     ],
+    extras_require={
+        'pdf': ['pypdf>=3.0'],
+    },
     python_requires='>=3.7'
 )
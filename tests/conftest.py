@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyplinkqc.plink_io import BedWriter, encode_genotypes, write_bim, write_fam
+
+
+def write_bfile(prefix, genotypes, chroms=None, sexes=None, phenos=None, snps=None, positions=None,
+                alleles=("A", "G")):
+    """Write plink binary files from an A1 count matrix of shape (n_variants, n_samples)."""
+    genotypes = np.asarray(genotypes, dtype=np.int8)
+    n_variants, n_samples = genotypes.shape
+    fam = pd.DataFrame({'fid': [f'F{i}' for i in range(n_samples)],
+                        'iid': [f'I{i}' for i in range(n_samples)],
+                        'pat': '0', 'mat': '0',
+                        'sex': 1 if sexes is None else sexes,
+                        'pheno': '-9' if phenos is None else phenos})
+    bim = pd.DataFrame({'chrom': '1' if chroms is None else chroms,
+                        'snp': [f'rs{i}' for i in range(n_variants)] if snps is None else snps,
+                        'cm': 0.0,
+                        'pos': np.arange(1, n_variants + 1) if positions is None else positions,
+                        'a1': alleles[0], 'a2': alleles[1]})
+    write_fam(fam, prefix + ".fam")
+    write_bim(bim, prefix + ".bim")
+    with BedWriter(prefix + ".bed") as bed:
+        bed.write(encode_genotypes(genotypes))
+    return prefix
+
+
+def random_genotypes(rng, n_variants, n_samples, missing_rate=0.01, min_freq=0.05):
+    """Draw binomial genotypes with uniform allele frequencies and some missing calls."""
+    freqs = rng.uniform(min_freq, 1 - min_freq, n_variants)
+    genotypes = rng.binomial(2, freqs[:, None], (n_variants, n_samples)).astype(np.int8)
+    genotypes[rng.random(genotypes.shape) < missing_rate] = -1
+    return genotypes
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(12345)
+
+
+@pytest.fixture
+def bfile(tmp_path, rng):
+    """A small random cohort (300 variants on chromosomes 1-3, 60 samples)."""
+    genotypes = random_genotypes(rng, 300, 60)
+    chroms = np.repeat(['1', '2', '3'], 100)
+    phenos = np.where(rng.random(60) < 0.5, 2, 1)
+    return write_bfile(str(tmp_path / "cohort"), genotypes, chroms=chroms, phenos=phenos)
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyplinkqc import assoc_store
+
+
+@pytest.fixture
+def results(rng):
+    tables = {}
+    for chrom, n in [('1', 95), ('2', 40), ('X', 1)]:
+        # repeated positions, so chunk boundaries fall inside runs of equal BP
+        bp = np.sort(rng.integers(1, 60, n)) * 1000
+        tables[chrom] = pd.DataFrame({'CHR': chrom, 'SNP': [f'{chrom}_{i}' for i in range(n)], 'BP': bp,
+                                      'P': rng.uniform(1e-9, 1, n)})
+    return tables
+
+
+def _write_store(path, results, **kwargs):
+    with assoc_store.ResultsStore(path, **kwargs) as store:
+        for chrom, table in results.items():
+            store.add_partition(chrom, table.sample(frac=1, random_state=1))
+
+
+def test_query_region_matches_full_scan(tmp_path, results, rng):
+    store = str(tmp_path / "store")
+    _write_store(store, results, top_n=5, row_group_size=8)
+
+    index = assoc_store.read_index(store)
+    assert list(index['N']) == [95, 40, 1]
+    for chrom, table in results.items():
+        for _ in range(30):
+            start, end = np.sort(rng.integers(0, 62000, 2))
+            expected = table[(table['BP'] >= start) & (table['BP'] <= end)]
+            region = assoc_store.query_region(store, chrom, start, end, columns=['SNP', 'P'])
+            assert sorted(region['SNP']) == sorted(expected['SNP'])
+        assert len(assoc_store.query_region(store, chrom)) == len(table)
+    assert assoc_store.query_region(store, "22").empty
+
+
+def test_top_hits(tmp_path, results):
+    store = str(tmp_path / "store")
+    _write_store(store, results, top_n=5, row_group_size=8)
+    everything = pd.concat(results.values()).sort_values('P')
+
+    assert list(assoc_store.top_hits(store, n=3)['SNP']) == list(everything['SNP'][:3])
+    threshold = everything['P'].iloc[19:21].mean()
+    hits = assoc_store.top_hits(store, p_threshold=threshold)
+    assert list(hits['SNP']) == list(everything['SNP'][:20])
+
+
+def test_failed_write_leaves_no_index(tmp_path, results):
+    store = str(tmp_path / "store")
+    with pytest.raises(KeyError):
+        with assoc_store.ResultsStore(store) as writer:
+            writer.add_partition('1', results['1'])
+            writer.add_partition('2', results['2'].drop(columns='P'))
+    assert not os.path.exists(os.path.join(store, "_index.csv"))
+    assert not os.path.exists(os.path.join(store, "_index.parquet"))
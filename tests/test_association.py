@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from pyplinkqc import association
+from pyplinkqc.plink_io import read_fam
+
+
+def test_attach_pheno_symlinks_bed_by_default(bfile, tmp_path):
+    phenofile = tmp_path / "cases.txt"
+    phenofile.write_text("I0\nI3\nI5\n")
+    outfile = str(tmp_path / "pheno")
+
+    cases = association.attach_pheno(bfile, str(phenofile), outfile)
+
+    assert cases == 3
+    assert os.path.islink(outfile + ".bed") and os.path.islink(outfile + ".bim")
+    assert os.path.realpath(outfile + ".bed") == os.path.realpath(bfile + ".bed")
+    phenos = read_fam(outfile + ".fam")['pheno']
+    assert list(phenos[phenos == "2"].index) == [0, 3, 5]
+    assert (phenos == "1").sum() == len(phenos) - 3
+
+
+@pytest.mark.parametrize("link", ["reflink", "copy"])
+def test_link_bfile_independent_copies(bfile, tmp_path, link):
+    outfile = str(tmp_path / "copy")
+
+    association.link_bfile(bfile, outfile, link=link)
+
+    assert not os.path.islink(outfile + ".bed")
+    assert os.stat(outfile + ".bed").st_ino != os.stat(bfile + ".bed").st_ino
+    with open(outfile + ".bed", "r+b") as f:
+        f.seek(3)
+        f.write(b"\x00")
+    assert open(bfile + ".bed", "rb").read() != open(outfile + ".bed", "rb").read()
+
+
+def test_merge_shard_outputs(tmp_path):
+    outfile = str(tmp_path / "multi")
+    for i, pheno in enumerate(["height", "bmi"]):
+        (tmp_path / f'multi.shard{i}.{pheno}.assoc.linear').write_text(f'{pheno}\n')
+        (tmp_path / f'multi.shard{i}.log').write_text(f'log {i}\n')
+        (tmp_path / f'multi.shard{i}.nosex').write_text("F1 I1\n")
+
+    association._merge_shard_outputs(outfile, [f'{outfile}.shard0', f'{outfile}.shard1'])
+
+    assert sorted(os.listdir(tmp_path)) == ["multi.bmi.assoc.linear", "multi.height.assoc.linear",
+                                            "multi.log", "multi.nosex"]
+    assert open(outfile + ".log").read() == "# multi.shard0.log\nlog 0\n# multi.shard1.log\nlog 1\n"
@@ -0,0 +1,94 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from pyplinkqc import bgen
+from pyplinkqc.plink_io import decode_genotypes, open_bed, read_bim, read_fam
+
+
+def _string(value, size=2):
+    return struct.pack('<H' if size == 2 else '<I', len(value)) + value.encode()
+
+
+def write_bgen(path, variants, probabilities, sample_ids):
+    """Write a zlib compressed BGEN v1.2 (layout 2) file of unphased 8-bit probabilities.
+
+    probabilities has shape (n_variants, n_samples, 2): P(2 copies of the first
+    allele) and P(1 copy); NaN rows are missing samples.
+    """
+    n_variants, n_samples, _ = probabilities.shape
+    flags = 1 | (2 << 2) | (1 << 31)
+    header = struct.pack('<3I', 20, n_variants, n_samples) + b'bgen' + struct.pack('<I', flags)
+    ids = b''.join(_string(sample) for sample in sample_ids)
+    samples = struct.pack('<2I', 8 + len(ids), n_samples) + ids
+    with open(path, "wb") as f:
+        f.write(struct.pack('<I', len(header) + len(samples)) + header + samples)
+        for (chrom, snp, pos, a1, a2), probs in zip(variants, probabilities):
+            missing = np.isnan(probs).any(axis=1)
+            values = np.round(np.where(missing[:, None], 0, probs) * 255).astype(np.uint8)
+            block = (struct.pack('<IHBB', n_samples, 2, 2, 2)
+                     + (np.where(missing, 128, 0) | 2).astype(np.uint8).tobytes()
+                     + struct.pack('<BB', 0, 8) + values.tobytes())
+            data = zlib.compress(block)
+            f.write(_string(snp) + _string(snp) + _string(chrom) + struct.pack('<IH', pos, 2)
+                    + _string(a1, 4) + _string(a2, 4) + struct.pack('<2I', len(data) + 4, len(block)) + data)
+
+
+@pytest.fixture
+def imputed(tmp_path, rng):
+    n_samples = 50
+    calls = rng.binomial(2, rng.uniform(0.2, 0.8, (6, 1)), (6, n_samples))
+    # certain genotypes (INFO 1)
+    probs = np.stack([(calls == 2), (calls == 1)], axis=-1).astype(float)
+    # uninformative imputation: every sample gets the population genotype frequencies
+    theta = 0.3
+    probs[4] = [theta ** 2, 2 * theta * (1 - theta)]
+    probs[5, :, 0] = rng.uniform(0.85, 1, n_samples)
+    probs[5, :, 1] = 1 - probs[5, :, 0]
+    probs[0, :3] = np.nan
+    variants = [('chr1', f'rs{i}', 1000 * (i + 1), 'A', 'G') for i in range(5)] + [('X', 'rs5', 9000, 'C', 'T')]
+    path = str(tmp_path / "imputed.bgen")
+    write_bgen(path, variants, probs, [f'S{i}' for i in range(n_samples)])
+    return path, calls, probs
+
+
+def test_iter_bgen_decodes_dosages_and_info(imputed):
+    path, calls, probs = imputed
+
+    blocks = list(bgen.iter_bgen(path, block_size=4, threads=2))
+
+    assert [len(block[0]) for block in blocks] == [4, 2]
+    dosages = np.vstack([block[1] for block in blocks])
+    genotypes = np.vstack([block[2] for block in blocks])
+    quantized = np.round(np.nan_to_num(probs) * 255) / 255
+    expected = 2 * quantized[..., 0] + quantized[..., 1]
+    expected[0, :3] = -1
+    np.testing.assert_allclose(dosages, expected, atol=1e-6)
+    expected_calls = calls.copy()
+    expected_calls[0, :3] = -1
+    np.testing.assert_array_equal(genotypes[:4], expected_calls[:4])
+    # the uninformative variant is hard-called as missing (no call above 0.9)
+    assert (genotypes[4] == -1).all()
+    info = np.r_[blocks[0][0]['info'], blocks[1][0]['info']]
+    np.testing.assert_allclose(info[:4], 1)
+    assert abs(info[4]) < 0.02
+    assert info[5] < 0.8
+    assert list(blocks[0][0]['chrom']) == ['1'] * 4 and list(blocks[1][0]['chrom']) == ['1', '23']
+
+
+def test_bgen_qc_filters_by_info_and_maf(imputed, tmp_path):
+    path, calls, probs = imputed
+    outfile = str(tmp_path / "qc")
+
+    n_kept, n_variants = bgen.bgen_qc(path, outfile, info_threshold=0.8, maf_threshold=0.01, block_size=2)
+
+    # the uninformative variant and the uncertain one fail the INFO filter
+    assert (n_kept, n_variants) == (4, 6)
+    assert list(read_bim(outfile + ".bim")['snp']) == ['rs0', 'rs1', 'rs2', 'rs3']
+    assert list(read_fam(outfile + ".fam")['iid'][:3]) == ['S0', 'S1', 'S2']
+    genotypes = decode_genotypes(open_bed(outfile)[:4], 50)
+    expected = calls[:4].copy()
+    expected[0, :3] = -1
+    np.testing.assert_array_equal(genotypes, expected)
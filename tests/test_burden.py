@@ -0,0 +1,123 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from pyplinkqc import burden
+from conftest import write_bfile
+
+
+def test_read_regions_bed_is_converted_to_one_based(tmp_path):
+    regionfile = tmp_path / "genes.bed"
+    regionfile.write_text("track name=genes\n#comment\nchr1\t99\t200\tGENE1\t0\t+\nchrX\t0\t10\tGENE2\n")
+
+    regions = burden.read_regions(str(regionfile))
+
+    assert regions.to_dict('list') == {'CHR': ['1', '23'], 'START': [100, 1], 'END': [200, 10],
+                                       'NAME': ['GENE1', 'GENE2']}
+
+
+def test_read_regions_gtf_keeps_one_feature(tmp_path):
+    regionfile = str(tmp_path / "genes.gtf.gz")
+    with gzip.open(regionfile, "wt") as f:
+        f.write('#!genome-build GRCh38\n'
+                '1\tensembl\tgene\t11869\t14409\t.\t+\t.\tgene_id "ENSG1"; gene_name "DDX11L1";\n'
+                '1\tensembl\texon\t11869\t12227\t.\t+\t.\tgene_id "ENSG1"; gene_name "DDX11L1";\n'
+                'chr2\tensembl\tgene\t100\t300\t.\t-\t.\tgene_id "ENSG2";\n')
+
+    genes = burden.read_regions(regionfile)
+    exons = burden.read_regions(regionfile, feature="exon")
+
+    assert genes.to_dict('list') == {'CHR': ['1', '2'], 'START': [11869, 100], 'END': [14409, 300],
+                                     'NAME': ['DDX11L1', 'ENSG2']}
+    assert list(exons['END']) == [12227]
+
+
+def test_region_index_join_with_nested_and_overlapping_regions(rng):
+    regions = pd.DataFrame({'CHR': ['1', '1', '1', '1', '2'], 'START': [40, 10, 20, 62, 1],
+                            'END': [60, 50, 30, 70, 100], 'NAME': ['C', 'A', 'B', 'D', 'E']})
+    index = burden.RegionIndex(regions)
+    positions = np.array([5, 10, 20, 25, 30, 45, 55, 60, 61])
+
+    region_ids, variant_ids = index.join('1', positions)
+
+    names = index.regions['NAME'].to_numpy()
+    pairs = sorted(zip(names[region_ids], positions[variant_ids]))
+    expected = sorted((row.NAME, pos) for row in regions[regions['CHR'] == '1'].itertuples()
+                      for pos in positions if row.START <= pos <= row.END)
+    assert pairs == expected
+    assert len(index.join('3', positions)[0]) == 0
+
+
+@pytest.fixture
+def rare_cohort(tmp_path, rng):
+    n_samples = 150
+    freqs = np.r_[rng.uniform(0.005, 0.04, 24), 0.3, 0.98, 0.99, 0.97]
+    genotypes = rng.binomial(2, freqs[:, None], (28, n_samples)).astype(np.int8)
+    genotypes[rng.random(genotypes.shape) < 0.02] = -1
+    chroms = ['1'] * 16 + ['2'] * 12
+    positions = np.r_[np.arange(16) * 100 + 100, np.arange(12) * 100 + 100]
+    pheno = genotypes[:6].clip(0).sum(axis=0) + rng.normal(0, 1, n_samples)
+    bfile = write_bfile(str(tmp_path / "rare"), genotypes, chroms=chroms, positions=positions,
+                        phenos=np.round(pheno, 6))
+    return bfile, genotypes, chroms, positions, np.round(pheno, 6)
+
+
+def _dense_burden(genotypes, members, maf_max):
+    """W G of the rare variants of a region, with madsen-browning weights."""
+    G = genotypes[members].astype(float)
+    missing = G < 0
+    G[missing] = 0
+    means = G.sum(axis=1) / (~missing).sum(axis=1)
+    G[missing] = np.broadcast_to(means[:, None], G.shape)[missing]
+    freq = means / 2
+    G[freq > 0.5] = 2 - G[freq > 0.5]
+    maf = np.minimum(freq, 1 - freq)
+    rare = (maf > 0) & (maf <= maf_max)
+    return (1 / np.sqrt(maf[rare] * (1 - maf[rare]))) @ G[rare], rare.sum()
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_burden_scores_match_dense_weights(tmp_path, rare_cohort, processes):
+    bfile, genotypes, chroms, positions, pheno = rare_cohort
+    regionfile = tmp_path / "genes.bed"
+    # nested and overlapping regions, a region on chromosome 2 holding the common
+    # variants (A1 the major allele), and one on a chromosome missing from the .bim
+    regionfile.write_text("1\t99\t700\tG1\n1\t299\t400\tG2\n1\t599\t1600\tG3\n2\t99\t1200\tG4\n"
+                          "2\t1250\t1300\tNONE\n5\t0\t1000\tG5\n")
+
+    tables = burden.burden_assoc(bfile, str(regionfile), str(tmp_path / "out"), type="linear",
+                                 maf_max=0.05, weights="madsen-browning", regions_per_chunk=2,
+                                 processes=processes)
+
+    result = tables['PHENO'].set_index('NAME')
+    assert sorted(result.index) == ['G1', 'G2', 'G3', 'G4', 'G5', 'NONE']
+    for name in ['G1', 'G2', 'G3', 'G4']:
+        row = result.loc[name]
+        members = np.flatnonzero((np.array(chroms) == str(row['CHR'])) & (positions >= row['START'])
+                                 & (positions <= row['END']))
+        score, nvar = _dense_burden(genotypes, members, 0.05)
+        assert row['NVAR'] == nvar
+        fit = stats.linregress(score, pheno)
+        np.testing.assert_allclose([row['BETA'], row['SE'], row['P']], [fit.slope, fit.stderr, fit.pvalue],
+                                   rtol=1e-6)
+    assert result.loc['G4', 'NVAR'] == 11
+    for name in ['G5', 'NONE']:
+        assert result.loc[name, 'NVAR'] == 0 and np.isnan(result.loc[name, 'P'])
+
+
+def test_burden_without_overlapping_regions(tmp_path, rare_cohort, capsys):
+    bfile = rare_cohort[0]
+    regionfile = tmp_path / "genes.bed"
+    regionfile.write_text("22\t0\t1000\tG1\nX\t0\t1000\tG2\n")
+
+    table = burden.burden_assoc(bfile, str(regionfile), str(tmp_path / "out"), type="linear")['PHENO']
+
+    assert list(table['NAME']) == ['G1', 'G2'] and (table['NVAR'] == 0).all() and table['P'].isna().all()
+    assert "no region of" in capsys.readouterr().out
+
+    regionfile.write_text("")
+    with pytest.raises(ValueError, match="has no regions"):
+        burden.burden_assoc(bfile, str(regionfile), str(tmp_path / "out"))
@@ -0,0 +1,106 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from pyplinkqc import distributed
+from pyplinkqc.plink_io import decode_genotypes, open_bed, read_fam
+
+
+def _copy_task(task_id, src, dest, **kwargs):
+    return dict(task_id=task_id, stage="shutil.copyfile", args=[src, dest], outputs=[dest], **kwargs)
+
+
+def test_dag_runs_in_local_queue(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("genotypes\n")
+    queue = str(tmp_path / "queue")
+    cwd = os.getcwd()
+    distributed.submit_dag(queue, [
+        _copy_task("first", str(source), "first.txt"),
+        _copy_task("second", "{results}/first.txt", "second.txt", depends_on=["first"]),
+    ])
+
+    records = distributed.run_worker(queue, worker_id="w1", poll_interval=0.01)
+
+    assert [record['id'] for record in records] == ["first", "second"]
+    assert distributed.task_status(queue) == {"first": "done", "second": "done"}
+    assert (tmp_path / "queue" / "results" / "second.txt").read_text() == "genotypes\n"
+    # the stages ran in their own working directories, not in ours
+    assert os.getcwd() == cwd
+    assert not os.path.exists("first.txt")
+    assert os.listdir(tmp_path / "queue" / "leases") == []
+
+
+def test_failed_dependency_fails_dependents(tmp_path):
+    queue = str(tmp_path / "queue")
+    distributed.submit_dag(queue, [
+        dict(task_id="broken", stage="os.remove", args=[str(tmp_path / "missing")], max_attempts=2),
+        _copy_task("child", "{results}/x", "y", depends_on=["broken"]),
+        _copy_task("grandchild", "{results}/y", "z", depends_on=["child"]),
+    ])
+
+    records = distributed.run_worker(queue, worker_id="w1", poll_interval=0.01, idle_timeout=None)
+
+    assert records == []
+    status = distributed.wait_for_tasks(queue, poll_interval=0.01, timeout=None)
+    assert status == {"broken": "failed", "child": "failed", "grandchild": "failed"}
+    failed = distributed._read_json(str(tmp_path / "queue" / "failed" / "broken.json"))
+    assert failed['attempts'] == 2
+    assert "FileNotFoundError" in failed['error']
+
+
+def test_expired_lease_is_taken_over_once(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("x\n")
+    queue = str(tmp_path / "queue")
+    distributed.submit_task(queue, "task", "shutil.copyfile", args=[str(source), "out.txt"],
+                            outputs=["out.txt"])
+
+    slow = distributed.claim_task(queue, "slow", lease_seconds=-1)
+    assert slow['lease']['attempt'] == 1
+    fast = distributed.claim_task(queue, "fast", lease_seconds=60)
+    assert fast['lease']['attempt'] == 2
+    # the fresh lease cannot be taken over again
+    assert distributed.claim_task(queue, "late", lease_seconds=60) is None
+    assert distributed.task_status(queue) == {"task": "running"}
+
+    # the slow worker lost its lease: it cannot renew it or complete the task
+    assert not distributed.owns_lease(queue, slow)
+    assert not distributed.renew_lease(queue, slow, 60)
+    assert distributed.run_task(queue, slow) is None
+    assert distributed.task_status(queue) == {"task": "running"}
+
+    record = distributed.run_task(queue, fast)
+    assert record['worker'] == "fast" and record['attempt'] == 2
+    assert distributed.task_status(queue) == {"task": "done"}
+
+
+def test_qc_filter_stage_with_relative_paths(bfile, tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    (project / "data").mkdir(parents=True)
+    for ext in [".bed", ".bim", ".fam"]:
+        shutil.copy(bfile + ext, project / "data" / f"cohort{ext}")
+    (project / "keep.txt").write_text("F1 I1\nF4 I4\nF5 I5\n")
+    monkeypatch.chdir(project)
+    queue = str(tmp_path / "queue")
+
+    # the bfile and keep-list are relative to the submitter's directory, the outfile to the task's
+    task = distributed.submit_task(queue, "split", "pyplinkqc.qc_filter.split_samples",
+                                   args=["data/cohort", ["keep.txt"], ["subset"]], outputs=["subset.*"])
+    monkeypatch.chdir(tmp_path)
+    records = distributed.run_worker(queue, worker_id="w1", poll_interval=0.01)
+
+    assert task['args'] == [str(project / "data" / "cohort"), [str(project / "keep.txt")], ["subset"]]
+    assert sorted(records[0]['outputs']) == ["subset.bed", "subset.bim", "subset.fam"]
+    subset = str(tmp_path / "queue" / "results" / "subset")
+    assert list(read_fam(subset + ".fam")['iid']) == ["I1", "I4", "I5"]
+    np.testing.assert_array_equal(decode_genotypes(open_bed(subset), 3),
+                                  decode_genotypes(open_bed(bfile), 60)[:, [1, 4, 5]])
+    assert not (project / "subset.bed").exists()
+
+
+def test_outputs_must_be_relative(tmp_path):
+    with pytest.raises(ValueError, match="must be relative"):
+        distributed.submit_task(str(tmp_path / "queue"), "task", "os.getcwd", outputs=[str(tmp_path / "x")])
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+
+from pyplinkqc import qc_report
+from pyplinkqc.id_index import IDIndex
+from pyplinkqc.plink_io import read_fam, write_fam
+
+
+def test_sample_mask_from_keep_and_id_list_files(bfile, tmp_path):
+    index = IDIndex.from_bfile(bfile)
+    keep = tmp_path / "keep.txt"
+    # FID and IID columns: I2 is listed with the wrong family and does not match
+    keep.write_text("F1 I1\nF2 X\nF7 I7\nF99 I99\n")
+    iids = tmp_path / "iids.txt"
+    iids.write_text("I3\nI5\nI99\n")
+    listed = tmp_path / "listed.txt"
+    listed.write_text("I4,I6,\nI8")
+
+    assert list(np.flatnonzero(index.sample_mask_from_file(str(keep)))) == [1, 7]
+    assert list(np.flatnonzero(index.sample_mask_from_file(str(iids)))) == [3, 5]
+    assert list(np.flatnonzero(index.sample_mask_from_file(str(listed)))) == [4, 6, 8]
+    assert list(index.sample_positions(['I5', 'I99', 'I0'])) == [5, -1, 0]
+
+
+def test_snp_mask_and_positions(bfile, tmp_path):
+    index = IDIndex.from_bfile(bfile)
+    snpfile = tmp_path / "snps.prune.in"
+    snpfile.write_text("rs10\nrs2\nrs1000\n")
+
+    assert index.n_snps == 300
+    assert list(np.flatnonzero(index.snp_mask_from_file(str(snpfile)))) == [2, 10]
+    assert list(index.snp_positions(['rs299', 'missing', 'rs0'])) == [299, -1, 0]
+
+
+def test_from_bfile_cache_follows_modification_time(bfile):
+    index = IDIndex.from_bfile(bfile)
+    assert IDIndex.from_bfile(bfile) is index
+
+    fam = read_fam(bfile + ".fam")
+    fam['iid'] = [f'N{i}' for i in range(len(fam))]
+    write_fam(fam, bfile + ".fam")
+    mtime = os.path.getmtime(bfile + ".fam") + 10
+    os.utime(bfile + ".fam", (mtime, mtime))
+
+    updated = IDIndex.from_bfile(bfile)
+    assert updated is not index
+    assert updated.sample_positions(['N3', 'I3']).tolist() == [3, -1]
+
+
+def test_iids_repeated_across_families(tmp_path):
+    index = IDIndex(['A', 'B', 'B', 'C'], ['1', '1', '2', '1'], snps=['rs1', '.', '.'])
+
+    assert list(index.sample_positions(['1', '2', '3'])) == [0, 2, -1]
+    assert list(index.sample_positions(['1', '1', '1'], ['C', 'B', 'D'])) == [3, 1, -1]
+    assert list(index.sample_mask(['1'])) == [True, True, False, True]
+    assert list(index.sample_mask(['1'], ['B'])) == [False, True, False, False]
+    assert list(index.snp_mask(['.'])) == [False, True, True]
+    assert list(index.snp_positions(['.', 'rs1'])) == [1, 0]
+
+    # relatives are matched on FID and IID, so the pairs are resolved per family
+    imiss = tmp_path / "miss.imiss"
+    imiss.write_text("FID IID MISS_PHENO N_MISS N_GENO F_MISS\n"
+                     "A 1 Y 1 100 0.01\nB 1 Y 5 100 0.05\nB 2 Y 2 100 0.02\nC 1 Y 9 100 0.09\n")
+    genome = tmp_path / "pairs.genome"
+    genome.write_text("FID1 IID1 FID2 IID2 PI_HAT\nB 1 B 2 0.5\nA 1 C 1 0.5\n")
+
+    selected = qc_report.relatives_low_call_rate(str(tmp_path / "miss"), str(genome), str(tmp_path / "out"))
+
+    assert list(zip(selected['FID'], selected['IID'])) == [('B', 1), ('C', 1)]
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from pyplinkqc import association, ld_cache
+from conftest import random_genotypes, write_bfile
+
+
+def test_r2_matches_correlation_and_is_cached(tmp_path, rng):
+    genotypes = random_genotypes(rng, 50, 40, missing_rate=0)
+    # correlated neighbours, so the r2 values are not all near 0
+    genotypes[1::2] = np.where(rng.random((25, 40)) < 0.8, genotypes[0::2], genotypes[1::2])
+    chroms = np.repeat(['1', '2'], [30, 20])
+    bfile = write_bfile(str(tmp_path / "ld"), genotypes, chroms=chroms)
+    cache_dir = str(tmp_path / "cache")
+    expected = np.corrcoef(genotypes.astype(float)) ** 2
+
+    cache = ld_cache.LDCache(bfile, cache_dir=cache_dir, tile_size=7)
+    for index in [0, 13, 29, 30, 49]:
+        start, stop = (0, 30) if index < 30 else (30, 50)
+        others = np.arange(start, stop)
+        np.testing.assert_allclose(cache.r2(index, others), expected[index, others], atol=2e-3)
+    assert cache.misses > 0
+
+    # another phenotype of the same genotypes reads the tiles back from the cache
+    phenofile = tmp_path / "cases.txt"
+    phenofile.write_text("I1\nI2\n")
+    association.attach_pheno(bfile, str(phenofile), str(tmp_path / "pheno"))
+    other = ld_cache.LDCache(str(tmp_path / "pheno"), cache_dir=cache_dir, tile_size=7)
+    assert other.fingerprint == cache.fingerprint
+    np.testing.assert_array_equal(other.r2(13, np.arange(30)), cache.r2(13, np.arange(30)))
+    assert other.hits > 0 and other.misses == 0
+
+
+def test_clump_assoc_groups_variants_in_ld(tmp_path, rng):
+    n_samples = 200
+    # two blocks of 5 near-copies of a variant, 100 kb apart, and 10 independent variants
+    base = random_genotypes(rng, 2, n_samples, missing_rate=0, min_freq=0.3)
+    blocks = [np.where(rng.random((5, n_samples)) < 0.95, base[b], rng.binomial(2, 0.5, (5, n_samples)))
+              for b in range(2)]
+    genotypes = np.vstack(blocks + [random_genotypes(rng, 10, n_samples, missing_rate=0)])
+    positions = np.r_[np.arange(5) * 1000 + 1, np.arange(5) * 1000 + 100001, np.arange(10) * 1000 + 200001]
+    bfile = write_bfile(str(tmp_path / "clump"), genotypes, positions=positions)
+    p = np.r_[[1e-8, 1e-6, 1e-5, 1e-3, 0.2], [0.5, 1e-3, 1e-7, 0.04, 0.3], np.full(10, 0.6)]
+    p[15] = 1e-5
+    results = pd.DataFrame({'CHR': '1', 'SNP': [f'rs{i}' for i in range(20)], 'BP': positions, 'P': p})
+
+    clumps = association.clump_assoc(bfile, results, str(tmp_path / "out"), p1=1e-4, p2=1e-2,
+                                     r2=0.5, kb=250, cache_dir=str(tmp_path / "cache"), tile_size=8)
+
+    assert list(clumps['SNP']) == ['rs0', 'rs7', 'rs15']
+    assert list(clumps['SP2']) == ['rs1,rs2,rs3', 'rs6', 'NONE']
+    assert list(clumps['TOTAL']) == [3, 1, 0]
+    assert list(clumps['S0001']) == [2, 0, 0]
+
+
+def test_tile_size_is_part_of_the_cache_key(tmp_path, rng):
+    genotypes = random_genotypes(rng, 40, 60, missing_rate=0)
+    genotypes[1::2] = np.where(rng.random((20, 60)) < 0.9, genotypes[0::2], genotypes[1::2])
+    bfile = write_bfile(str(tmp_path / "ld"), genotypes, positions=np.arange(40) * 1000 + 1)
+    expected = np.corrcoef(genotypes.astype(float)) ** 2
+    results = pd.DataFrame({'CHR': '1', 'SNP': [f'rs{i}' for i in range(40)], 'BP': np.arange(40) * 1000 + 1,
+                            'P': np.r_[np.full(10, 1e-6), np.full(30, 1e-3)]})
+    cache_dir = str(tmp_path / "cache")
+
+    clumps = []
+    for tile_size in [8, 5]:
+        cache = ld_cache.LDCache(bfile, cache_dir=cache_dir, tile_size=tile_size)
+        # the tiles of the other tile size are not reused
+        np.testing.assert_allclose(cache.r2(17, np.arange(40)), expected[17], atol=2e-3)
+        assert cache.hits == 0
+        clumps.append(association.clump_assoc(bfile, results, str(tmp_path / f"t{tile_size}"), p1=1e-4,
+                                              p2=1e-2, r2=0.5, cache_dir=cache_dir, tile_size=tile_size))
+    assert clumps[0].equals(clumps[1])
+    assert len(os.listdir(os.path.join(cache_dir, cache.fingerprint))) == 2
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from pyplinkqc import merge, qc_filter
+from pyplinkqc.plink_io import decode_genotypes, open_bed, read_bim, read_fam, write_fam
+from conftest import random_genotypes, write_bfile
+
+
+def _genotypes(bfile):
+    return decode_genotypes(open_bed(bfile), len(read_fam(bfile + ".fam")))
+
+
+@pytest.mark.parametrize("sizes", [[20, 40], [13, 30, 17]])
+def test_split_then_merge_samples_round_trips(bfile, tmp_path, sizes):
+    bounds = np.cumsum([0] + sizes)
+    keepfiles, outfiles = [], []
+    for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        keepfile = tmp_path / f"keep{i}.txt"
+        keepfile.write_text("".join(f'I{j}\n' for j in range(start, stop)))
+        keepfiles.append(str(keepfile))
+        outfiles.append(str(tmp_path / f"batch{i}"))
+
+    assert qc_filter.split_samples(bfile, keepfiles, outfiles, block_size=7) == sizes
+    n_samples = merge.merge_samples(outfiles, str(tmp_path / "merged"), block_size=11)
+
+    assert n_samples == 60
+    np.testing.assert_array_equal(_genotypes(str(tmp_path / "merged")), _genotypes(bfile))
+    assert read_fam(str(tmp_path / "merged.fam")).equals(read_fam(bfile + ".fam"))
+
+
+def test_merge_samples_recodes_swapped_alleles(tmp_path, rng):
+    genotypes = random_genotypes(rng, 25, 16)
+    first = write_bfile(str(tmp_path / "a"), genotypes[:, :8])
+    # the second batch codes A1/A2 the other way round
+    second = write_bfile(str(tmp_path / "b"), np.where(genotypes[:, 8:] < 0, -1, 2 - genotypes[:, 8:]),
+                         alleles=("G", "A"))
+    fam = read_fam(second + ".fam")
+    fam['iid'] = [f'J{i}' for i in range(8)]
+    write_fam(fam, second + ".fam")
+
+    merge.merge_samples([first, second], str(tmp_path / "merged"))
+
+    np.testing.assert_array_equal(_genotypes(str(tmp_path / "merged")), genotypes)
+    with pytest.raises(ValueError, match="occur in more than one input"):
+        merge.merge_samples([first, first], str(tmp_path / "twice"))
+
+
+def test_merge_variants_by_chromosome(tmp_path, rng):
+    genotypes = random_genotypes(rng, 30, 9)
+    parts = [write_bfile(str(tmp_path / f"chr{c}"), genotypes[10 * i:10 * (i + 1)], chroms=str(c),
+                         snps=[f'{c}_{j}' for j in range(10)]) for i, c in enumerate([1, 2, 3])]
+
+    assert merge.merge_variants(parts, str(tmp_path / "merged")) == 30
+
+    np.testing.assert_array_equal(_genotypes(str(tmp_path / "merged")), genotypes)
+    assert list(read_bim(str(tmp_path / "merged.bim"))['chrom']) == ['1'] * 10 + ['2'] * 10 + ['3'] * 10
+    with pytest.raises(ValueError, match="more than once"):
+        merge.merge_variants([parts[0], parts[0]], str(tmp_path / "twice"))
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from conftest import random_genotypes, write_bfile
+from pyplinkqc import native_assoc
+
+
+def _reference_allelic(genotypes, phenos):
+    """plink --assoc statistics from a 2x2 allele table per variant."""
+    rows = []
+    for g in genotypes:
+        called = g >= 0
+        case, control = called & (phenos == 2), called & (phenos == 1)
+        a, c = g[case].sum(), g[control].sum()
+        b, d = 2 * case.sum() - a, 2 * control.sum() - c
+        chisq, p, _, _ = stats.chi2_contingency([[a, b], [c, d]], correction=False)
+        rows.append((a / (a + b), c / (c + d), chisq, p, a * d / (b * c)))
+    return pd.DataFrame(rows, columns=['F_A', 'F_U', 'CHISQ', 'P', 'OR'])
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_allelic_assoc_matches_reference(tmp_path, rng, processes):
+    genotypes = random_genotypes(rng, 50, 80, min_freq=0.2)
+    pheno_a = np.where(rng.random(80) < 0.4, 2, 1)
+    pheno_b = np.where(rng.random(80) < 0.6, 2, 1)
+    pheno_b[:5] = -9
+    bfile = write_bfile(str(tmp_path / "cohort"), genotypes)
+    phenofile = tmp_path / "phenos.txt"
+    pd.DataFrame({'FID': [f'F{i}' for i in range(80)], 'IID': [f'I{i}' for i in range(80)],
+                  'a': pheno_a, 'b': pheno_b}).to_csv(phenofile, sep=" ", index=False)
+
+    paths = native_assoc.allelic_assoc(bfile, str(tmp_path / "out"), phenofile=str(phenofile),
+                                       adjust=True, block_size=7, processes=processes)
+
+    for name, phenos in [('a', pheno_a), ('b', pheno_b)]:
+        result = pd.read_csv(paths[name])
+        assert list(result['SNP']) == [f'rs{i}' for i in range(50)]
+        expected = _reference_allelic(genotypes, phenos)
+        for column in expected:
+            np.testing.assert_allclose(result[column], expected[column], rtol=1e-6)
+        adjusted = pd.read_csv(str(tmp_path / f"out.{name}.assoc.adjusted.csv"))
+        assert len(adjusted) == 50
+        np.testing.assert_allclose(adjusted['BONF'], np.minimum(adjusted['UNADJ'] * 50, 1))
+
+
+def _ols(y, X):
+    """Coefficient, standard error and p-value of the last column of X."""
+    beta, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    df = len(y) - X.shape[1]
+    sigma2 = np.sum((y - X @ beta) ** 2) / df
+    se = np.sqrt(sigma2 * np.linalg.inv(X.T @ X)[-1, -1])
+    return beta[-1], se, 2 * stats.t.sf(abs(beta[-1] / se), df)
+
+
+@pytest.fixture
+def cov_cohort(tmp_path, rng):
+    """Common and rare variants, a quantitative phenotype and a covariate file with a missing value."""
+    n_samples = 120
+    common = random_genotypes(rng, 10, n_samples, missing_rate=0, min_freq=0.2)
+    rare = rng.binomial(2, rng.uniform(0.01, 0.03, 20)[:, None], (20, n_samples)).astype(np.int8)
+    genotypes = np.concatenate([common, rare])
+    age = rng.normal(50, 10, n_samples)
+    age[7] = -9
+    pc1 = rng.normal(0, 1, n_samples)
+    pheno = 0.4 * common[0] + 0.05 * age + rare[:10].sum(axis=0) + rng.normal(0, 1, n_samples)
+    bfile = write_bfile(str(tmp_path / "cohort"), genotypes, phenos=np.round(pheno, 6))
+    covfile = tmp_path / "covs.txt"
+    pd.DataFrame({'FID': [f'F{i}' for i in range(n_samples)], 'IID': [f'I{i}' for i in range(n_samples)],
+                  'AGE': age, 'PC1': pc1}).to_csv(covfile, sep=" ", index=False)
+    kept = np.arange(n_samples) != 7
+    covs = np.column_stack([np.ones(n_samples), age, pc1])[kept]
+    return bfile, str(covfile), genotypes, np.round(pheno, 6)[kept], covs, kept
+
+
+def test_load_covariates_sets_missing(cov_cohort):
+    bfile, covfile, _, _, _, _ = cov_cohort
+
+    names, covs = native_assoc.load_covariates(bfile, covfile)
+
+    assert names == ['AGE', 'PC1']
+    assert np.isnan(covs[7, 0]) and not np.isnan(covs[7, 1])
+    assert np.isnan(covs).sum() == 1
+
+
+def test_regression_assoc_with_covariates(cov_cohort, tmp_path):
+    from pyplinkqc import association
+    bfile, covfile, genotypes, pheno, covs, kept = cov_cohort
+
+    tables = native_assoc.regression_assoc(bfile, str(tmp_path / "reg"), type="linear", cov=covfile)
+    association.perform_cov_assoc(bfile, str(tmp_path / "cov"), type="linear", cov=covfile, native=True)
+
+    result = tables['PHENO']
+    for v in [0, 1, 5]:
+        beta, se, p = _ols(pheno, np.column_stack([covs, genotypes[v][kept]]))
+        assert result['NMISS'][v] == kept.sum()
+        np.testing.assert_allclose([result['BETA'][v], result['SE'][v], result['P'][v]], [beta, se, p],
+                                   rtol=1e-6)
+    written = pd.read_csv(str(tmp_path / "cov.assoc.linear.csv"))
+    np.testing.assert_allclose(written['P'], result['P'], rtol=1e-9)
+
+
+def test_burden_assoc_with_covariates(cov_cohort, tmp_path):
+    from pyplinkqc import burden
+    bfile, covfile, genotypes, pheno, covs, kept = cov_cohort
+    regionfile = tmp_path / "genes.bed"
+    # variants 10-19 and 20-29 (positions 11-20 and 21-30) are rare
+    regionfile.write_text("1\t10\t20\tGENE1\n1\t20\t30\tGENE2\n1\t100\t200\tEMPTY\n")
+
+    tables = burden.burden_assoc(bfile, str(regionfile), str(tmp_path / "burden"), type="linear",
+                                 cov=covfile, maf_max=0.05)
+
+    result = tables['PHENO'].set_index('NAME')
+    assert np.isnan(result.loc['EMPTY', 'P'])
+    for name, variants in [('GENE1', slice(10, 20)), ('GENE2', slice(20, 30))]:
+        g = genotypes[variants].astype(float)
+        freq = g.mean(axis=1) / 2
+        g[freq > 0.5] = 2 - g[freq > 0.5]
+        maf = np.minimum(freq, 1 - freq)
+        rare = (maf > 0) & (maf <= 0.05)
+        assert result.loc[name, 'NVAR'] == rare.sum()
+        beta, se, p = _ols(pheno, np.column_stack([covs, g[rare].sum(axis=0)[kept]]))
+        np.testing.assert_allclose([result.loc[name, 'BETA'], result.loc[name, 'SE'], result.loc[name, 'P']],
+                                   [beta, se, p], rtol=1e-6)
+    assert result.loc['GENE1', 'P'] < 1e-6
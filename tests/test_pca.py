@@ -0,0 +1,68 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import random_genotypes, write_bfile
+from pyplinkqc import pca
+
+
+def _exact_pca(genotypes, n_components):
+    """Eigen-decomposition of the full standardized relationship matrix."""
+    G = genotypes.astype(float)
+    missing = G < 0
+    G[missing] = np.nan
+    freqs = np.nanmean(G, axis=1) / 2
+    X = (G - 2 * freqs[:, None]) / np.sqrt(2 * freqs * (1 - freqs))[:, None]
+    X[missing] = 0
+    values, vectors = np.linalg.eigh(X.T @ X)
+    order = np.argsort(values)[::-1][:n_components]
+    return values[order] / len(X), vectors[:, order]
+
+
+@pytest.fixture
+def structured(tmp_path, rng):
+    """Two populations with diverged allele frequencies, and one sample from a third."""
+    n_snps, sizes = 2000, [90, 60, 1]
+    base = rng.uniform(0.1, 0.9, n_snps)
+    groups = []
+    for size, drift in zip(sizes, [0.1, 0.1, 0.35]):
+        freqs = np.clip(base + rng.normal(0, drift, n_snps), 0.02, 0.98)
+        groups.append(rng.binomial(2, freqs[:, None], (n_snps, size)))
+    genotypes = np.concatenate(groups, axis=1).astype(np.int8)
+    genotypes[rng.random(genotypes.shape) < 0.005] = -1
+    return write_bfile(str(tmp_path / "structured"), genotypes), genotypes
+
+
+def test_pca_matches_exact_decomposition(structured, tmp_path):
+    bfile, genotypes = structured
+    outfile = str(tmp_path / "pca")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        eigenvec, eigenval = pca.pca(bfile, outfile, n_components=5, block_size=300, threads=2)
+
+    values, vectors = _exact_pca(genotypes, 5)
+    # the structured components converge first, the others (noise) within the tolerance
+    np.testing.assert_allclose(eigenval[:2], values[:2], rtol=1e-4)
+    np.testing.assert_allclose(eigenval, values, rtol=1e-2)
+    for i in range(2):
+        corr = np.corrcoef(eigenvec[f'PC{i + 1}'], vectors[:, i])[0, 1]
+        assert abs(corr) > 0.999
+    # the populations separate on PC1, and the single sample of the third is an outlier
+    pc1 = eigenvec['PC1'].to_numpy()
+    assert (np.sign(pc1[:90]) != np.sign(pc1[90:150].mean())).mean() > 0.95
+    outliers = pd.read_csv(outfile + ".pca_outliers", sep=" ")
+    assert list(outliers['IID']) == ["I150"]
+    assert np.loadtxt(outfile + ".eigenval").shape == (5,)
+
+
+def test_pca_warns_without_convergence(tmp_path, rng):
+    bfile = write_bfile(str(tmp_path / "random"), random_genotypes(rng, 500, 80))
+
+    with pytest.warns(RuntimeWarning, match="did not converge"):
+        pca.pca(bfile, str(tmp_path / "pca"), n_components=5, n_iter=2, tol=1e-12)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        pca.pca(bfile, str(tmp_path / "pca"), n_components=5, n_iter=100)
@@ -0,0 +1,80 @@
+import os
+import shutil
+from datetime import datetime
+
+import matplotlib
+matplotlib.use("Agg")
+
+from pyplinkqc import plink_log, qc_report
+
+LOGS = os.path.join(os.path.dirname(__file__), "data", "plink_logs")
+
+
+def _log(name):
+    return plink_log.parse_plink_log(os.path.join(LOGS, name + ".log"))
+
+
+def test_parse_geno_log():
+    log = _log("snp_missingness_filtered")
+
+    assert log.version == "v1.90b6.21"
+    assert log.options == ["--bfile cohort", "--geno 0.2", "--make-bed", "--out snp_missingness_filtered"]
+    assert log.start_time == datetime(2026, 10, 19, 10, 0, 1) and log.runtime == 3
+    assert (log.ram_mb, log.workspace_mb, log.threads) == (64216, 32108, 1)
+    assert (log.variants_in, log.samples_in, log.variants_out, log.samples_out) == (100000, 1000, 99848, 1000)
+    assert log.removed == {'geno': 152}
+    assert (log.variants_removed, log.samples_removed) == (152, 0)
+    assert log.warnings == [] and log.errors == []
+
+
+def test_parse_maf_hwe_mind_and_remove_logs():
+    # the --maf message is wrapped over two lines
+    assert _log("maf_filtered").removed == {'maf': 2112}
+
+    hwe = _log("hwe_filtered")
+    assert hwe.removed == {'hwe': 37} and hwe.variants_removed == 37
+    # wrapped warnings are joined into one message each
+    assert hwe.warnings == [
+        "1240 het. haploid genotypes present (see hwe_filtered.hh ); many commands treat these as missing.",
+        "--hwe observation counts vary by more than 10%, due to the X chromosome. You may want to use a "
+        "less stringent --hwe p-value threshold for X chromosome variants."]
+
+    mind = _log("sample_missingness_filtered")
+    assert mind.removed == {'mind': 3} and mind.samples_removed == 3 and mind.threads == 1
+    assert mind.options[-1] == "--threads 4"
+
+    remove = _log("relatedness_filtered")
+    assert remove.removed == {'remove': 5} and (remove.samples_in, remove.samples_out) == (997, 992)
+
+
+def test_out_prefix():
+    assert plink_log.out_prefix(["--bfile cohort", "--out maf_filtered", "--make-bed"]) == "maf_filtered"
+    assert plink_log.out_prefix(["--bfile cohort", "--freq"]) == "plink"
+
+
+def test_removed_counts_along_the_pipeline():
+    logs = {test: os.path.join(LOGS, name + ".log") for test, name in
+            [('Missing SNPs', "snp_missingness_filtered"), ('MAF', "maf_filtered"), ('Outlying HWE', "hwe_filtered")]}
+
+    counts, total = plink_log.removed_counts(logs, "variants")
+
+    assert counts == {'Missing SNPs': 152, 'MAF': 2112, 'Outlying HWE': 37} and total == 100000
+    assert plink_log.removed_counts(logs, "samples") == ({'Missing SNPs': 0, 'MAF': 0, 'Outlying HWE': 0}, 1000)
+
+
+def test_failed_from_logs_reports(tmp_path, monkeypatch, capsys):
+    for name in os.listdir(LOGS):
+        shutil.copy(os.path.join(LOGS, name), tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    snps = qc_report.snps_failed_from_logs(deferred=True)
+    samples = qc_report.samples_failed_from_logs(deferred=True)
+
+    panel = snps.panels[0]
+    assert panel.labels == ['Missing SNPs', 'MAF', 'Outlying HWE'] and panel.heights == [152, 2112, 37]
+    assert "2301/100000" in panel.title
+    # the sex check and heterozygosity stages did not run: their logs are skipped
+    panel = samples.panels[0]
+    assert panel.labels == ['SNP Missingness', 'Cryptic Relatedness'] and panel.heights == [3, 5]
+    assert "8/1000" in panel.title
+    assert "sex_discrepancy_filtered.log log not found" in capsys.readouterr().out
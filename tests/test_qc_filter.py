@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from pyplinkqc import qc_filter
+from pyplinkqc.plink_io import decode_genotypes, open_bed, read_fam
+
+
+def test_split_samples_matches_decoded_subsets(bfile, tmp_path):
+    genotypes = decode_genotypes(open_bed(bfile), 60)
+    fam = read_fam(bfile + ".fam")
+    keep_lists = {
+        # FID and IID columns, listed out of .fam order; I9 with the wrong family and F99 are skipped
+        'pairs': ("F7 I7\nF2 I2\nF0 I0\nF3 I9\nF99 I99\nF11 I11\nF58 I58\n", [0, 2, 7, 11, 58]),
+        # one IID per line, with an ID missing from the .fam
+        'iids': ("I59\nI30\nI31\nI32\nmissing\nI5\nI6\n", [5, 6, 30, 31, 32, 59]),
+        # comma-separated IIDs
+        'listed': (",".join(f'I{i}' for i in range(1, 60, 2)), list(range(1, 60, 2))),
+        'empty_match': ("I100\n", []),
+    }
+    keepfiles, outfiles = [], []
+    for name, (text, _) in keep_lists.items():
+        (tmp_path / f"{name}.txt").write_text(text)
+        keepfiles.append(str(tmp_path / f"{name}.txt"))
+        outfiles.append(str(tmp_path / name))
+
+    n_samples = qc_filter.split_samples(bfile, keepfiles, outfiles, block_size=17)
+
+    assert n_samples == [5, 6, 30, 0]
+    for outfile, (_, expected) in zip(outfiles, keep_lists.values()):
+        assert list(read_fam(outfile + ".fam")['iid']) == list(fam['iid'].iloc[expected])
+        np.testing.assert_array_equal(decode_genotypes(open_bed(outfile), len(expected)),
+                                      genotypes[:, expected])
+        assert open(outfile + ".bim").read() == open(bfile + ".bim").read()
+
+
+def test_split_samples_checks_arguments(bfile, tmp_path):
+    with pytest.raises(ValueError, match="2 keep-lists but 1 output prefixes"):
+        qc_filter.split_samples(bfile, ["a", "b"], [str(tmp_path / "a")])
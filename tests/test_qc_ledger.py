@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyplinkqc.qc_ledger import FailureLedger
+
+
+@pytest.fixture
+def ledger():
+    ledger = FailureLedger(["I0", "I1", "I2", "I3", "I4", "I1"])
+    ledger.add_mask("missing", [True, True, False, False, False])
+    ledger.add_ids("het", ["I1", "I2", "I2"])
+    ledger.add_ids("sex", ["I1", "I4"])
+    return ledger
+
+
+def test_add_mask_and_ids_record_overlapping_failures(ledger):
+    # I1 fails all three tests but is counted once in the total
+    assert len(ledger) == 5
+    assert ledger.tests == ["missing", "het", "sex"]
+    assert ledger.counts() == {"missing": 2, "het": 2, "sex": 2}
+    assert ledger.total_failed() == 4
+    assert list(ledger.failed_ids()) == ["I0", "I1", "I2", "I4"]
+    assert list(ledger.failed_ids(["missing", "het"], how="all")) == ["I1"]
+    assert list(ledger.failed_ids(["het"])) == ["I1", "I2"]
+    with pytest.raises(ValueError, match="not a valid choice"):
+        ledger.failed(how="some")
+
+
+def test_add_ids_appends_unknown_ids(ledger):
+    ledger.add_ids("het", ["I9", "I2", "I8", "I9"])
+
+    assert list(ledger.ids) == ["I0", "I1", "I2", "I3", "I4", "I9", "I8"]
+    assert ledger.counts()["het"] == 4
+    assert list(ledger.failed(["missing"])) == [True, True, False, False, False, False, False]
+    assert ledger.total_failed() == 6
+
+
+def test_to_long_and_write(ledger, tmp_path):
+    long = ledger.to_long()
+
+    assert sorted(zip(long['ID'], long['TEST'])) == [("I0", "missing"), ("I1", "het"), ("I1", "missing"),
+                                                     ("I1", "sex"), ("I2", "het"), ("I4", "sex")]
+    assert list(long['TEST'].cat.categories) == ["missing", "het", "sex"]
+    path = ledger.write(str(tmp_path / "failed"))
+    assert path == str(tmp_path / "failed.csv")
+    assert pd.read_csv(path).shape == (6, 2)
+    assert FailureLedger(["I0"]).to_long().empty
+
+
+def test_at_most_32_tests():
+    ledger = FailureLedger(np.arange(40))
+    for test in range(32):
+        ledger.add_mask(f"test{test}", np.arange(40) == test)
+    # the last test uses the highest bit of the uint32 flags
+    assert ledger.counts()["test31"] == 1 and list(ledger.failed_ids(["test31"])) == [31]
+    assert ledger.total_failed() == 32
+
+    # recording more failures of a known test is fine, a 33rd test is not
+    ledger.add_ids("test0", [35])
+    with pytest.raises(ValueError, match="at most 32 tests"):
+        ledger.add_mask("test32", np.ones(40, dtype=bool))
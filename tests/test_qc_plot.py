@@ -0,0 +1,45 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+
+from pyplinkqc import qc_plot, tracing
+
+
+def test_streaming_assoc_summary_large_bp_bins(rng):
+    summary = qc_plot.StreamingAssocSummary(band=1e-4, bp_bin=1, y_step=0.1)
+    # bp // bp_bin reaches 2**30, beyond the 24 bits of a packed cell key
+    bp = np.array([5, 2 ** 24 + 5, 2 ** 30, 2 ** 30])
+    summary.update(np.array(['1', '1', '2', '2']), bp, np.array([0.5, 0.5, 0.5, 1e-9]))
+
+    panel = summary.manhattan_panel()
+
+    assert summary.n == 4
+    assert len(summary.cells) == 3
+    chrom1_length = 2 ** 24 + 5
+    expected = np.sort(np.array([5.5, 2 ** 24 + 5.5, chrom1_length + 2 ** 30 + 0.5, chrom1_length + 2 ** 30]))
+    np.testing.assert_allclose(np.sort(panel.x), expected)
+
+
+def test_lambda_gc_of_null_pvalues(rng):
+    summary = qc_plot.StreamingAssocSummary()
+    for _ in range(4):
+        summary.update(np.full(50000, '1'), rng.integers(1, 10 ** 8, 50000), rng.uniform(0, 1, 50000))
+
+    assert abs(summary.lambda_gc() - 1) < 0.02
+
+
+def test_manhattan_and_qq_plots_are_traced(tmp_path, rng):
+    assocfile = tmp_path / "results.assoc"
+    pd.DataFrame({'CHR': np.repeat([1, 2], 500), 'SNP': [f'rs{i}' for i in range(1000)],
+                  'BP': np.tile(np.arange(500) * 1000, 2),
+                  'P': rng.uniform(0, 1, 1000)}).to_csv(assocfile, sep=" ", index=False)
+    tracing.reset()
+    tracing.enable()
+    try:
+        qc_plot.manhattan_plot(str(assocfile), deferred=True)
+        qc_plot.qq_plot(str(assocfile), deferred=True)
+    finally:
+        tracing.disable()
+    names = [record['name'] for record in tracing.spans()]
+    assert "qc_plot.manhattan_plot" in names and "qc_plot.qq_plot" in names
@@ -0,0 +1,44 @@
+import matplotlib
+matplotlib.use("Agg")
+import pandas as pd
+
+from pyplinkqc import qc_plot, qc_report
+
+
+def _stats():
+    return qc_plot.QCStats("hist", [qc_plot.HistPanel([1, 2, 3], [0, 1, 2, 3], title="counts")])
+
+
+def test_save_pdf_without_pypdf_renders_vector_pages_serially(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(qc_report, "_have_pypdf", lambda: False)
+    outfile = str(tmp_path / "qc")
+
+    qc_report.save_pdf(outfile, [_stats(), None, _stats()], processes=2)
+
+    assert "rendering the report pages serially" in capsys.readouterr().out
+    pdf = open(outfile + "_report.pdf", "rb").read()
+    assert pdf.count(b"/Type /Page\n") + pdf.count(b"/Type /Page ") == 2
+    # the pages are drawn as vectors, not embedded as images
+    assert b"/Subtype /Image" not in pdf
+
+
+def test_write_fail_file_writes_csv_tables(tmp_path):
+    outfile = str(tmp_path / "failed_sample_ids")
+
+    qc_report.write_fail_file({'missing': ["I1", "I2"], 'het_failed': ["I2"]}, outfile)
+
+    assert open(outfile + "_hr.csv").read() == "missing: 2\nhet_failed: 1\nTotal: 2/2\n"
+    failed = pd.read_csv(outfile + "_pr.csv")
+    assert sorted(zip(failed['ID'], failed['TEST'])) == [("I1", "missing"), ("I2", "het_failed"),
+                                                          ("I2", "missing")]
+    # qc_report holds the only copy of the report writers
+    assert not hasattr(qc_plot, "write_fail_file") and not hasattr(qc_plot, "save_pdf")
+
+
+def test_get_sample_ids_with_repeated_ids():
+    imiss = pd.DataFrame({'IID': ["I1", "I2", "I3", "I2", "I4"], 'F_MISS': [0.1, 0.5, 0.0, 0.5, 0.3]})
+    filtered = pd.DataFrame({'IID': ["I2", "I4", "I2"]})
+
+    ids = qc_report.get_sample_ids(imiss, 'IID', filtered)
+
+    assert list(ids) == ["I1", "I3"]
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import write_bfile
+from pyplinkqc import relatedness
+
+
+def _cohort_with_relatives(rng, n_samples, n_snps, n_pairs, n_duplicates=0):
+    """Unrelated samples with planted parent-offspring pairs and duplicated samples.
+
+    Minor allele frequencies follow a spectrum rich in low-frequency SNPs, as
+    in synthetic.generate_bfile of the benchmarks.
+    """
+    maf = 0.001 + 0.499 * rng.beta(0.6, 1.4, n_snps)
+    genotypes = rng.binomial(2, maf[:, None], (n_snps, n_samples)).astype(np.int8)
+    order = rng.permutation(n_samples)
+    parents, children = order[:n_pairs], order[n_pairs:2 * n_pairs]
+    transmitted = rng.binomial(1, genotypes[:, parents] / 2)
+    genotypes[:, children] = transmitted + rng.binomial(1, maf[:, None], (n_snps, n_pairs))
+    originals = order[2 * n_pairs:2 * n_pairs + n_duplicates]
+    copies = order[2 * n_pairs + n_duplicates:2 * (n_pairs + n_duplicates)]
+    genotypes[:, copies] = genotypes[:, originals]
+    genotypes[rng.random(genotypes.shape) < 0.002] = -1
+    # the duplicates keep identical missingness, so their genotype hashes are equal
+    genotypes[:, copies] = genotypes[:, originals]
+    pairs = {frozenset([f'I{p}', f'I{c}']) for p, c in zip(parents, children)}
+    duplicates = {frozenset([f'I{o}', f'I{c}']) for o, c in zip(originals, copies)}
+    return genotypes, pairs, duplicates
+
+
+@pytest.fixture(scope="module")
+def related_cohort(tmp_path_factory):
+    rng = np.random.default_rng(2024)
+    genotypes, pairs, duplicates = _cohort_with_relatives(rng, 800, 15000, 80, n_duplicates=3)
+    bfile = write_bfile(str(tmp_path_factory.mktemp("related") / "cohort"), genotypes)
+    return bfile, genotypes, pairs, duplicates
+
+
+def test_prescreen_recall_of_first_degree_relatives(related_cohort, tmp_path):
+    bfile, _, pairs, duplicates = related_cohort
+    outfile = str(tmp_path / "prescreen")
+
+    related = relatedness.relatedness_prescreen(bfile, outfile, min_kinship=0.177)
+
+    found = {frozenset([a, b]) for a, b in zip(related['IID1'], related['IID2'])}
+    # recall of the defaults on planted parent-offspring pairs (all 80 found at this seed)
+    assert len(found & pairs) >= 0.97 * len(pairs)
+    assert duplicates <= found
+    # no false first-degree pairs and a small fraction of all pairs checked
+    assert found <= pairs | duplicates
+    kin = pd.read_csv(outfile + ".kin0", sep=" ")
+    assert len(kin) < 0.01 * 800 * 799 / 2
+    dups = pd.read_csv(outfile + ".dups", sep=" ")
+    assert {frozenset(group['IID']) for _, group in dups.groupby('DUP_GROUP')} == duplicates
+
+
+def test_pair_kinship_matches_direct_count(related_cohort):
+    bfile, genotypes, pairs, _ = related_cohort
+    from pyplinkqc.plink_io import open_bed
+    sample_pairs = np.array([[0, 1], [2, 5]] + [sorted(int(i[1:]) for i in pair) for pair in list(pairs)[:3]])
+
+    kinship = relatedness.pair_kinship(open_bed(bfile, 800), np.arange(len(genotypes)), 800, sample_pairs,
+                                       block_size=1000)
+
+    for (i, j), row in zip(sample_pairs, kinship.itertuples()):
+        x, y = genotypes[:, i], genotypes[:, j]
+        both = (x >= 0) & (y >= 0)
+        hethet = (both & (x == 1) & (y == 1)).sum()
+        ibs0 = (both & (np.abs(x - y) == 2)).sum()
+        het = (both & (x == 1)).sum() + (both & (y == 1)).sum()
+        assert (row.NSNP, row.HETHET, row.IBS0) == (both.sum(), hethet, ibs0)
+        assert row.KINSHIP == pytest.approx((hethet - 2 * ibs0) / het)
+    # parent-offspring pairs have a kinship of about 0.25, unrelated pairs about 0
+    assert abs(kinship['KINSHIP'][:2]).max() < 0.05
+    assert (abs(kinship['KINSHIP'][2:] - 0.25) < 0.05).all()
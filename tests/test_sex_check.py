@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from pyplinkqc import sex_check
+from pyplinkqc.plink_io import read_fam
+from conftest import random_genotypes, write_bfile
+
+
+@pytest.fixture
+def sexed_bfile(tmp_path, rng):
+    n_samples = 40
+    males = np.arange(n_samples) % 2 == 0
+    freqs = rng.uniform(0.1, 0.9, 200)
+    x = rng.binomial(2, freqs[:, None], (200, n_samples))
+    # males are hemizygous on X: one allele, coded as homozygous
+    x[:, males] = 2 * rng.binomial(1, freqs[:, None], (200, males.sum()))
+    x[rng.random(x.shape) < 0.02] = -1
+    genotypes = np.vstack([random_genotypes(rng, 20, n_samples), x[:100],
+                           random_genotypes(rng, 10, n_samples), x[100:]])
+    chroms = ['1'] * 20 + ['X'] * 100 + ['XY'] * 10 + ['chrX'] * 100
+    sexes = np.where(males, 1, 2)
+    # sample 3 is reported male but is female, sample 4 has no reported sex
+    sexes[3], sexes[4] = 1, 0
+    prefix = write_bfile(str(tmp_path / "sexed"), genotypes, chroms=chroms, sexes=sexes)
+    return prefix, x, sexes
+
+
+def _reference_f(x, sexes):
+    ploidy = np.where(sexes == 1, 1.0, 2.0)
+    called = x >= 0
+    freqs = (np.where(called, x, 0) * ploidy / 2).sum(axis=1) / (called * ploidy).sum(axis=1)
+    poly = (freqs > 0) & (freqs < 1)
+    x, called, freqs = x[poly], called[poly], freqs[poly]
+    observed = ((x == 0) | (x == 2)).sum(axis=0)
+    expected = ((1 - 2 * freqs * (1 - freqs))[:, None] * called).sum(axis=0)
+    return (observed - expected) / (called.sum(axis=0) - expected)
+
+
+def test_x_runs_skip_autosomes_and_par(sexed_bfile):
+    prefix, x, sexes = sexed_bfile
+
+    assert sex_check.x_chromosome_runs(prefix) == [(20, 120), (130, 230)]
+
+
+def test_check_sex_flags_mismatches_and_imputes(sexed_bfile, tmp_path):
+    prefix, x, sexes = sexed_bfile
+    impute_fam = str(tmp_path / "imputed.fam")
+
+    sexcheck = sex_check.check_sex(prefix, str(tmp_path / "plink"), impute_fam=impute_fam, block_size=17)
+
+    np.testing.assert_allclose(sexcheck['F'], _reference_f(x, sexes))
+    expected = np.where(np.arange(40) % 2 == 0, 1, 2)
+    expected[3] = 2
+    assert list(sexcheck['SNPSEX']) == list(expected)
+    assert list(sexcheck.index[sexcheck['STATUS'] == "PROBLEM"]) == [3, 4]
+    assert list(read_fam(impute_fam)['sex']) == list(expected)
+    assert (tmp_path / "plink.sexcheck").exists()
+
+
+def test_check_sex_requires_x_variants(bfile):
+    with pytest.raises(ValueError, match="no X chromosome variants"):
+        sex_check.check_sex(bfile)
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from pyplinkqc.plink_io import decode_genotypes, open_bed, read_bim, read_fam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from synthetic import generate_bfile  # noqa: E402
+
+N_SAMPLES = 200
+
+
+def _generate(path, seed=7):
+    return generate_bfile(str(path), N_SAMPLES, 3000, seed=seed, missing_rate=0.02, related_pairs=5,
+                          x_fraction=0.05, y_fraction=0.01, sex_error_rate=0.1, block_size=700)
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    prefix = _generate(tmp_path_factory.mktemp("synthetic") / "cohort")
+    genotypes = decode_genotypes(open_bed(prefix), N_SAMPLES)
+    return prefix, genotypes, read_bim(prefix + ".bim"), read_fam(prefix + ".fam")
+
+
+def test_same_seed_gives_identical_files(synthetic, tmp_path):
+    prefix = synthetic[0]
+    again = _generate(tmp_path / "again")
+    other = _generate(tmp_path / "other", seed=8)
+
+    for ext in [".bed", ".bim", ".fam"]:
+        assert open(again + ext, "rb").read() == open(prefix + ext, "rb").read()
+    assert open(other + ".bed", "rb").read() != open(prefix + ".bed", "rb").read()
+
+
+def test_related_pairs_are_parent_offspring(synthetic):
+    _, genotypes, bim, fam = synthetic
+    autosomal = genotypes[bim['chrom'].astype(int).to_numpy() <= 22]
+    parents = fam['pat'].where(fam['pat'] != '0', fam['mat'])
+    children = np.flatnonzero(parents != '0')
+    assert len(children) == 5
+    positions = {iid: i for i, iid in enumerate(fam['iid'])}
+
+    for child in children:
+        parent = positions[parents[child]]
+        assert fam['fid'][child] == fam['fid'][parent]
+        x, y = autosomal[:, child], autosomal[:, parent]
+        both = (x >= 0) & (y >= 0)
+        hethet = (both & (x == 1) & (y == 1)).sum()
+        ibs0 = (both & (np.abs(x - y) == 2)).sum()
+        kinship = (hethet - 2 * ibs0) / ((both & (x == 1)).sum() + (both & (y == 1)).sum())
+        # parent and offspring share one allele at every variant: no opposite homozygotes
+        assert ibs0 == 0
+        assert 0.2 < kinship < 0.3
+
+
+def test_sex_chromosomes_and_missingness(synthetic):
+    _, genotypes, bim, fam = synthetic
+    chroms = bim['chrom'].to_numpy()
+    x, y = genotypes[chroms == '23'], genotypes[chroms == '24']
+    assert len(x) == 150 and len(y) == 30
+    # males (no heterozygous X genotypes) are hemizygous; females have no Y genotypes
+    male = ~(x == 1).any(axis=0)
+    het_rate = (x == 1).sum(axis=0) / (x >= 0).sum(axis=0)
+    assert het_rate[~male].min() > 0.1
+    assert (y[:, ~male] == -1).all() and (y[:, male] >= 0).mean() > 0.9
+    assert 0.35 < male.mean() < 0.65
+    # about sex_error_rate of the reported sexes are wrong
+    wrong = (fam['sex'].to_numpy() == 1) != male
+    assert 0 < wrong.sum() < 0.2 * N_SAMPLES
+
+    missing = (genotypes[chroms != '24'] < 0).mean(axis=0)
+    assert 0.015 < missing.mean() < 0.025
+    # missingness varies between samples
+    assert missing.std() > 0.005
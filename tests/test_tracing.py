@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+from pyplinkqc import tracing
+
+
+def test_span_records_times():
+    tracing.reset()
+    tracing.enable()
+    try:
+        with tracing.span("stage", "test"):
+            sum(range(10000))
+    finally:
+        tracing.disable()
+    record, = tracing.spans()
+    assert record['name'] == "stage" and record['wall'] >= 0 and record['cpu'] >= 0
+
+
+def test_tracing_without_resource_module():
+    # the resource module does not exist on Windows
+    code = ("import sys; sys.modules['resource'] = None\n"
+            "from pyplinkqc import tracing\n"
+            "tracing.enable()\n"
+            "with tracing.span('stage'): pass\n"
+            "record, = tracing.spans()\n"
+            "assert tracing.resource is None and record['child_cpu'] == 0, record\n")
+    subprocess.run([sys.executable, "-c", code], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
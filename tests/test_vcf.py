@@ -0,0 +1,71 @@
+import gzip
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from pyplinkqc import vcf
+from pyplinkqc.plink_io import decode_genotypes, open_bed, read_bim, read_fam
+
+
+def bgzip(path, text, block_bytes):
+    """Write text as BGZF blocks of block_bytes uncompressed bytes, with the EOF block."""
+    data = text.encode()
+    with open(path, "wb") as f:
+        for start in range(0, len(data) + 1, block_bytes):
+            chunk = data[start:start + block_bytes]
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            payload = compressor.compress(chunk) + compressor.flush()
+            f.write(b'\x1f\x8b\x08\x04' + struct.pack('<IBBH', 0, 0, 255, 6) + b'BC'
+                    + struct.pack('<HH', 2, len(payload) + 25) + payload
+                    + struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+
+
+@pytest.fixture
+def vcf_records(rng):
+    n_samples, n_records = 7, 120
+    samples = [f'S{i}' for i in range(n_samples)]
+    lines = ["##fileformat=VCFv4.2", "#" + "\t".join(["CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER",
+                                                       "INFO", "FORMAT"] + samples)]
+    expected, rows = [], []
+    calls = {'0/0': 0, '0|1': 1, '1/0': 1, '1|1': 2, './.': -1, '0/.': -1, '1': 2, '0': 0}
+    for i in range(n_records):
+        chrom = 'chr2' if i >= 80 else 'chr1'
+        gts = rng.choice(list(calls), n_samples)
+        alt = "C,T" if i % 17 == 5 else "C"
+        fmt = "DP:GT" if i % 23 == 7 else "GT:DP"
+        snp = "." if i % 10 == 3 else f'rs{i}'
+        fields = [f'{gt}:12' if fmt == "GT:DP" else f'12:{gt}' for gt in gts]
+        lines.append("\t".join([chrom, str(100 + i), snp, "A", alt, ".", "PASS", "DP=10", fmt] + fields))
+        if alt == "C" and fmt == "GT:DP":
+            rows.append(('2' if i >= 80 else '1', snp if snp != "." else f'{chrom[3:]}:{100 + i}:A:C', 100 + i))
+            expected.append([calls[gt] for gt in gts])
+    return samples, "\n".join(lines) + "\n", rows, np.array(expected)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_vcf_to_bfile_across_block_and_chunk_boundaries(tmp_path, vcf_records, processes):
+    samples, text, rows, expected = vcf_records
+    path = str(tmp_path / "cohort.vcf.gz")
+    bgzip(path, text, block_bytes=300)
+    outfile = str(tmp_path / "cohort")
+
+    prefixes = vcf.vcf_to_bfile(path, outfile, processes=processes, chunk_size=700, batch_bytes=500)
+
+    assert prefixes == [outfile]
+    assert len(vcf.bgzf_blocks(path)) > 10
+    assert list(read_fam(outfile + ".fam")['iid']) == samples
+    bim = read_bim(outfile + ".bim")
+    assert list(zip(bim['chrom'], bim['snp'], bim['pos'])) == rows
+    assert (bim['a1'] == "C").all() and (bim['a2'] == "A").all()
+    np.testing.assert_array_equal(decode_genotypes(open_bed(outfile), len(samples)), expected)
+
+
+def test_vcf_to_bfile_requires_bgzf(tmp_path, vcf_records):
+    path = str(tmp_path / "plain.vcf.gz")
+    with gzip.open(path, "wt") as f:
+        f.write(vcf_records[1])
+
+    with pytest.raises(ValueError, match="bgzip"):
+        vcf.vcf_to_bfile(path, str(tmp_path / "out"))